@@ -1,9 +1,10 @@
 import uuid
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from app.core.client import get_supabase_client
 from app.core.auth import require_user, optional_user
+from app.utils.etag import etag_matches, make_etag, not_modified, set_etag
 from supabase import Client
 
 # 创建API路由实例，用于定义清单相关的API端点
@@ -178,25 +179,40 @@ def create_checklist(req: ChecklistCreateRequest, db: Client = Depends(get_supab
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{checklist_id}", response_model=ChecklistResponse)
-def get_checklist_details(checklist_id: uuid.UUID, db: Client = Depends(get_supabase_client), user_id: str = Depends(require_user)):
+def get_checklist_details(checklist_id: uuid.UUID, response: Response, if_none_match: Optional[str] = Header(None), db: Client = Depends(get_supabase_client), user_id: str = Depends(require_user)):
     """获取清单详细信息
     
     Args:
         checklist_id: 清单ID
+        response: 响应对象，用于设置 ETag
+        if_none_match: If-None-Match 请求头（客户端缓存的 ETag）
         db: Supabase数据库客户端实例（依赖注入）
         user_id: 用户ID（必需，依赖注入）
         
     Returns:
-        ChecklistResponse: 清单响应对象
+        ChecklistResponse: 清单响应对象；ETag 未变化时返回 304
     """
     try:
+        # 客户端带了 ETag 时先只读版本号（同时校验所有权），未变化则直接返回 304
+        if if_none_match:
+            version_res = db.table("checklists").select("version").eq("id", str(checklist_id)).eq("user_id", user_id).maybe_single().execute()
+            if not version_res or not version_res.data:
+                raise HTTPException(status_code=404, detail="Checklist not found or access denied")
+            etag = make_etag("checklist", str(checklist_id), version_res.data['version'])
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag)
+        
         # 查询指定ID的清单及其关联的分类和项目信息
-        response = db.table("checklists").select("*, checklist_categories(*, checklist_items(*))").eq("id", str(checklist_id)).eq("user_id", user_id).single().execute()
+        res = db.table("checklists").select("*, checklist_categories(*, checklist_items(*))").eq("id", str(checklist_id)).eq("user_id", user_id).single().execute()
         
         # 检查是否找到清单
-        if not response.data:
+        if not res.data:
             raise HTTPException(status_code=404, detail="Checklist not found or access denied")
-        return response.data
+        if res.data.get('version') is not None:
+            set_etag(response, make_etag("checklist", res.data['id'], res.data['version']))
+        return res.data
+    except HTTPException:
+        raise
     except Exception as e:
         # 捕获并抛出数据库异常
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,9 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
-from supabase import Client
+from supabase import AsyncClient
 from typing import List
 
-from app.core.client import get_supabase_client
+from app.core.client import get_async_supabase_client
 from app.core.auth import require_user
 
 router = APIRouter()
@@ -16,7 +16,7 @@ class FavoriteItem(BaseModel):
 async def add_favorite(
     favorite: FavoriteItem,
     user_id: str = Depends(require_user),
-    supabase: Client = Depends(get_supabase_client)
+    supabase: AsyncClient = Depends(get_async_supabase_client)
 ):
     """Adds an item to the user's favorites."""
     try:
@@ -41,7 +41,7 @@ async def add_favorite(
 @router.get("/", response_model=List[FavoriteItem])
 async def get_favorites(
     user_id: str = Depends(require_user),
-    supabase: Client = Depends(get_supabase_client)
+    supabase: AsyncClient = Depends(get_async_supabase_client)
 ):
     """Gets all favorite items for the current user."""
     response = await supabase.from_("user_favorites").select("item_id, item_type").eq("user_id", user_id).execute()
@@ -52,7 +52,7 @@ async def remove_favorite(
     item_id: str = Query(...),
     item_type: str = Query(...),
     user_id: str = Depends(require_user),
-    supabase: Client = Depends(get_supabase_client)
+    supabase: AsyncClient = Depends(get_async_supabase_client)
 ):
     """Removes an item from the user's favorites using query parameters."""
     response = await supabase.from_("user_favorites").delete().match({
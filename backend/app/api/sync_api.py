@@ -0,0 +1,68 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List
+from app.core.client import get_async_supabase_client
+from app.core.auth import require_user
+from app.core.config import settings
+from app.utils.fast_json import json_response
+from app.utils.rpc_errors import raise_for_rpc_error
+from postgrest.exceptions import APIError
+from supabase import AsyncClient
+
+# 创建API路由实例，用于定义增量同步的API端点
+router = APIRouter()
+
+# --- Pydantic数据模型 ---
+
+class SyncResponse(BaseModel):
+    """增量同步响应数据模型，各表返回变化后的完整数据行"""
+    watermark: int  # 下一次请求的 since
+    after_seq: int = 0  # 下一次请求的 after_seq（has_more 为 true 时不为 0）
+    has_more: bool = False  # 还有未返回的变化，应立即用新的 since / after_seq 继续请求
+    trips: List[Dict[str, Any]] = Field(default_factory=list)
+    itinerary_days: List[Dict[str, Any]] = Field(default_factory=list)
+    itinerary_items: List[Dict[str, Any]] = Field(default_factory=list)
+    checklists: List[Dict[str, Any]] = Field(default_factory=list)
+    checklist_categories: List[Dict[str, Any]] = Field(default_factory=list)
+    checklist_items: List[Dict[str, Any]] = Field(default_factory=list)
+    deleted: Dict[str, List[str]] = Field(default_factory=dict)  # 表名 -> 已删除的行ID
+
+# --- 增量同步接口 ---
+
+@router.get("/", response_model=SyncResponse)
+async def sync_changes(
+    since: int = Query(0, ge=0),
+    after_seq: int = Query(0, ge=0),
+    db: AsyncClient = Depends(get_async_supabase_client),
+    user_id: str = Depends(require_user),
+):
+    """返回上次同步之后变化的行程、日程、清单数据和删除记录
+    
+    由 sync_changes RPC 读取 change_log，一次往返返回一页变化（最多 SYNC_PAGE_SIZE 条变更记录）。
+    客户端保存响应中的 watermark 和 after_seq，下次请求时作为 since 和 after_seq 传回；
+    has_more 为 true 时应立即继续请求下一页。since=0 表示首次同步，分页返回全部数据。
+    同一行在两次同步之间多次修改只返回最新的一次；行程被删除或当前用户被移出协作者时，
+    该行程出现在 deleted.trips 中，客户端应同时删除它的日程天和日程项目。
+    
+    Args:
+        since: 上一次同步返回的 watermark
+        after_seq: 上一次同步返回的 after_seq
+        db: Supabase数据库客户端实例（依赖注入）
+        user_id: 用户ID（必需，依赖注入）
+    
+    Returns:
+        SyncResponse: 变化的数据行、删除记录和续传位置
+    """
+    try:
+        res = await db.rpc("sync_changes", {
+            "p_user_id": user_id,
+            "p_since": since,
+            "p_after_seq": after_seq,
+            "p_limit": settings.SYNC_PAGE_SIZE,
+        }).execute()
+    except APIError as e:
+        raise_for_rpc_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return json_response(SyncResponse, res.data)
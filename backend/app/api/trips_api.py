@@ -1,10 +1,30 @@
+import asyncio
+import base64
+import json
 import uuid
-from fastapi import APIRouter, Depends, HTTPException, status
-from pydantic import BaseModel, Field
-from typing import List, Optional
-from app.core.client import get_supabase_client
+from contextvars import ContextVar
+from datetime import datetime
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, model_validator
+from typing import AsyncIterator, Dict, List, Literal, Optional, Tuple
+from app.core.client import get_async_supabase_client
 from app.core.auth import require_user
-from supabase import Client
+from app.core.config import settings
+from app.utils.cache import LRUCache
+from app.utils.document_cache import create_document_cache
+from app.utils.etag import etag_matches, make_etag, not_modified, set_etag
+from app.utils.events import PubSub, create_event_listener, sse_message
+from app.utils.fast_json import dump_json, json_response, load_json, render_json
+from app.utils.logger import setup_logger
+from app.utils.metrics import register_cache
+from app.utils.profiles import load_profiles
+from app.utils.rank import RANK_PATTERN, needs_rebalance, rank_between, rank_sequence
+from app.utils.rpc_errors import raise_for_rpc_error
+from postgrest.exceptions import APIError
+from supabase import AsyncClient
+
+logger = setup_logger(__name__)
 
 # 创建API路由实例，用于定义行程相关的API端点
 router = APIRouter()
@@ -18,6 +38,7 @@ class ItineraryItem(BaseModel):
     type: str = "custom"
     name: str
     notes: Optional[str] = None
+    rank: Optional[str] = None  # 分数排序键，同一天内按 rank 升序排列
 
 class ItineraryDay(BaseModel):
     """日程天数据模型"""
@@ -59,6 +80,31 @@ class TripUpdate(BaseModel):
     status: Optional[str] = None
     thumbnail: Optional[str] = None
 
+class TripClone(BaseModel):
+    """复制行程请求数据模型"""
+    start_date: Optional[str] = None  # 新的开始日期，整个行程随之平移；不传则保持原日期
+    name: Optional[str] = None  # 新行程名称，不传则为 "<原名称> (copy)"
+
+class TripSummary(BaseModel):
+    """行程列表项数据模型，字段与 TripResponse 相同，但只返回 fields 参数请求的字段"""
+    id: Optional[uuid.UUID] = None
+    user_id: Optional[str] = None
+    name: Optional[str] = None
+    destination: Optional[str] = None
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    description: Optional[str] = None
+    status: Optional[str] = None
+    thumbnail: Optional[str] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+    day_count: Optional[int] = None  # 日程天数
+    item_count: Optional[int] = None  # 日程项目数
+    collaborator_count: Optional[int] = None  # 协作者数（不含所有者）
+    last_activity_at: Optional[str] = None  # 行程或其日程、协作者最近一次修改的时间
+    collaborators: Optional[List[Collaborator]] = None
+    itinerary: Optional[List[ItineraryDay]] = None
+
 class TripResponse(TripBase):
     """行程响应数据模型"""
     id: uuid.UUID
@@ -68,9 +114,168 @@ class TripResponse(TripBase):
     collaborators: List[Collaborator] = Field(default_factory=list)
     itinerary: List[ItineraryDay] = Field(default_factory=list)
 
+class ItineraryItemMove(BaseModel):
+    """移动日程项目请求数据模型：给出目标位置两侧的相邻项目"""
+    day_id: Optional[uuid.UUID] = None  # 目标天，不传则留在原来的天
+    prev_id: Optional[uuid.UUID] = None  # 目标位置的前一个项目，移到最前面时为空
+    next_id: Optional[uuid.UUID] = None  # 目标位置的后一个项目，移到最后面时为空
+
+class ItineraryOperation(BaseModel):
+    """批量日程操作中的单个操作"""
+    op: Literal["create", "update", "move", "delete"]
+    id: Optional[uuid.UUID] = None  # update/move/delete 的目标项目
+    day_id: Optional[uuid.UUID] = None  # create 的所属天 / move 的目标天
+    client_id: Optional[str] = None  # create 时客户端的临时ID，原样返回用于对应新项目的ID
+    name: Optional[str] = None
+    time: Optional[str] = None
+    type: Optional[str] = None
+    notes: Optional[str] = None
+    sort_order: Optional[int] = None  # 已废弃：天内顺序只由 rank 决定，传入时返回 400
+    rank: Optional[str] = Field(None, pattern=RANK_PATTERN)  # create/update/move 的新位置（见 app.utils.rank）
+
+    @model_validator(mode="after")
+    def check_required_fields(self):
+        if self.op == "create" and (self.day_id is None or not self.name):
+            raise ValueError("create requires day_id and name")
+        if self.op != "create" and self.id is None:
+            raise ValueError(f"{self.op} requires id")
+        if self.op == "move" and self.day_id is None and self.rank is None:
+            raise ValueError("move requires day_id or rank")
+        return self
+
+class ItineraryBatchRequest(BaseModel):
+    """批量日程操作请求数据模型"""
+    operations: List[ItineraryOperation] = Field(..., min_length=1, max_length=500)
+
+class ItineraryOperationResult(BaseModel):
+    """单个操作的执行结果"""
+    index: int
+    op: str
+    id: uuid.UUID
+    client_id: Optional[str] = None
+
+class ItineraryBatchResponse(BaseModel):
+    """批量日程操作响应数据模型，结果顺序与请求一致"""
+    results: List[ItineraryOperationResult]
+
 # --- 辅助函数 ---
 
-def _verify_user_has_access_to_trip(db: Client, user_id: str, trip_id: str, required_access_level: str = "viewer"):
+# 行程访问级别的短 TTL 缓存，键为 (trip_id, user_id)，值为 owner/editor/viewer。
+# 只缓存有权限的结果；协作者变更和删除行程时显式失效。
+trip_access_cache = LRUCache(maxsize=settings.TRIP_ACCESS_CACHE_SIZE, ttl=settings.TRIP_ACCESS_CACHE_TTL)
+register_cache("trip_access", trip_access_cache)
+
+# 已组装好的行程详情文档（序列化后的 JSON 和 ETag），按 trip_id 缓存。
+# 读多写少：所有修改行程、协作者、日程天、日程项目的接口在写入后都会调用 invalidate。
+trip_document_cache = create_document_cache(
+    "trip",
+    settings.DOCUMENT_CACHE_BACKEND,
+    url=settings.DOCUMENT_CACHE_URL,
+    maxsize=settings.DOCUMENT_CACHE_SIZE,
+    ttl=settings.DOCUMENT_CACHE_TTL,
+)
+register_cache("trip_document", trip_document_cache)
+
+# 行程变更事件，通过 GET /{trip_id}/events 以 SSE 推送给正在查看同一行程的协作者。
+# local 模式由写接口在写入后发布；postgres 模式由数据库触发器 NOTIFY，写接口不再重复发布。
+trip_events = PubSub(queue_size=settings.TRIP_EVENTS_QUEUE_SIZE)
+trip_event_listener = create_event_listener(trip_events, settings.TRIP_EVENTS_BACKEND, dsn=settings.TRIP_EVENTS_DSN)
+
+# 请求内的访问级别备忘：同一请求多次校验同一行程时不再访问缓存或数据库
+_request_access_levels: ContextVar[Optional[Dict[Tuple[str, str], str]]] = ContextVar("trip_access_levels", default=None)
+
+ACCESS_LEVELS = ["viewer", "editor", "owner"]
+
+def _invalidate_trip_access(trip_id: str, user_id: Optional[str] = None):
+    """使行程访问级别缓存失效
+    
+    Args:
+        trip_id: 行程ID
+        user_id: 用户ID；为空时失效该行程的所有用户
+    """
+    trip_id = str(trip_id)
+    if user_id is not None:
+        trip_access_cache.delete((trip_id, user_id))
+    else:
+        trip_access_cache.delete_where(lambda key: key[0] == trip_id)
+    memo = _request_access_levels.get()
+    if memo:
+        for key in [key for key in memo if key[0] == trip_id and user_id in (None, key[1])]:
+            del memo[key]
+
+def _remember_access_level(trip_id: str, user_id: str, access_level: str):
+    """把访问级别写入请求内备忘和 TTL 缓存"""
+    key = (trip_id, user_id)
+    memo = _request_access_levels.get()
+    if memo is None:
+        memo = {}
+        _request_access_levels.set(memo)
+    memo[key] = access_level
+    trip_access_cache.set(key, access_level)
+
+def _access_level_from_trip_row(trip: dict, user_id: str) -> Optional[str]:
+    """根据嵌入查询得到的 trips(user_id, trip_collaborators(access_level)) 计算访问级别
+    
+    Args:
+        trip: 行程数据，trip_collaborators 已按当前用户过滤
+        user_id: 用户ID
+        
+    Returns:
+        Optional[str]: 访问级别，无权限时为 None
+    """
+    if trip.get('user_id') == user_id:
+        return "owner"
+    collaborators = trip.get('trip_collaborators') or []
+    return collaborators[0]['access_level'] if collaborators else None
+
+async def _get_access_level(db: AsyncClient, user_id: str, trip_id: str) -> str:
+    """获取用户对行程的访问级别，依次查询请求内备忘、TTL 缓存和数据库。
+    
+    Args:
+        db: Supabase数据库客户端实例
+        user_id: 用户ID
+        trip_id: 行程ID
+        
+    Returns:
+        str: 访问级别 (viewer, editor, owner)
+    """
+    key = (trip_id, user_id)
+    memo = _request_access_levels.get()
+    if memo and key in memo:
+        return memo[key]
+    
+    access_level = trip_access_cache.get(key)
+    if access_level is None:
+        # 查询行程所有者
+        res = await db.table("trips").select("user_id").eq("id", trip_id).single().execute()
+        
+        # 检查行程是否存在
+        if not res.data:
+            raise HTTPException(status_code=404, detail="Trip not found.")
+        
+        # 检查用户是否是行程所有者
+        if res.data['user_id'] == user_id:
+            access_level = "owner"
+        else:
+            # 查询协作者信息
+            collaborator_res = await db.table("trip_collaborators").select("access_level").eq("trip_id", trip_id).eq("user_id", user_id).single().execute()
+            
+            # 检查用户是否是协作者
+            if not collaborator_res.data:
+                raise HTTPException(status_code=403, detail="Access denied.")
+            access_level = collaborator_res.data['access_level']
+    
+    _remember_access_level(trip_id, user_id, access_level)
+    return access_level
+
+def _check_access_level(access_level: Optional[str], required_access_level: str):
+    """检查访问级别是否满足要求，不满足时抛出 403"""
+    if access_level is None:
+        raise HTTPException(status_code=403, detail="Access denied.")
+    if ACCESS_LEVELS.index(access_level) < ACCESS_LEVELS.index(required_access_level):
+        raise HTTPException(status_code=403, detail="Insufficient access level.")
+
+async def _verify_user_has_access_to_trip(db: AsyncClient, user_id: str, trip_id: str, required_access_level: str = "viewer"):
     """验证用户是否对指定行程有访问权限。
     
     Args:
@@ -79,94 +284,417 @@ def _verify_user_has_access_to_trip(db: Client, user_id: str, trip_id: str, requ
         trip_id: 行程ID
         required_access_level: 所需访问级别 (viewer, editor, owner)
     """
-    # 查询行程及其协作者信息
-    res = db.table("trips").select("user_id").eq("id", trip_id).single().execute()
+    user_access_level = await _get_access_level(db, user_id, str(trip_id))
     
-    # 检查行程是否存在
-    if not res.data:
-        raise HTTPException(status_code=404, detail="Trip not found.")
+    # 检查访问级别是否满足要求
+    _check_access_level(user_access_level, required_access_level)
     
-    # 检查用户是否是行程所有者
-    if res.data['user_id'] == user_id:
-        return True
+    return True
+
+async def _resolve_day_access(db: AsyncClient, user_id: str, day_id: str, required_access_level: str = "viewer") -> str:
+    """一次往返解析日程天所属的行程并验证访问权限。
     
-    # 查询协作者信息
-    collaborator_res = db.table("trip_collaborators").select("access_level").eq("trip_id", trip_id).eq("user_id", user_id).single().execute()
+    通过嵌入查询 itinerary_days -> trips -> trip_collaborators（按当前用户过滤）
+    同时拿到 trip_id、行程所有者和当前用户的协作者角色。
     
-    # 检查用户是否是协作者
-    if not collaborator_res.data:
-        raise HTTPException(status_code=403, detail="Access denied.")
+    Args:
+        db: Supabase数据库客户端实例
+        user_id: 用户ID
+        day_id: 日程天ID
+        required_access_level: 所需访问级别 (viewer, editor, owner)
+        
+    Returns:
+        str: 日程天所属的行程ID
+    """
+    res = await db.table("itinerary_days").select(
+        "trip_id, trips(user_id, trip_collaborators(access_level))"
+    ).eq("id", day_id).eq("trips.trip_collaborators.user_id", user_id).maybe_single().execute()
+    if not res or not res.data or not res.data.get('trips'):
+        raise HTTPException(status_code=404, detail="Itinerary day not found.")
     
-    # 检查访问级别是否满足要求
-    access_levels = ["viewer", "editor", "owner"]
-    user_access_level = collaborator_res.data['access_level']
+    trip_id = res.data['trip_id']
+    access_level = _access_level_from_trip_row(res.data['trips'], user_id)
+    if access_level:
+        _remember_access_level(trip_id, user_id, access_level)
+    _check_access_level(access_level, required_access_level)
+    return trip_id
+
+async def _resolve_item_access(db: AsyncClient, user_id: str, item_id: str, required_access_level: str = "viewer") -> str:
+    """一次往返解析日程项目所属的行程并验证访问权限（item -> day -> trip -> 协作者角色）。
     
-    if access_levels.index(user_access_level) < access_levels.index(required_access_level):
-        raise HTTPException(status_code=403, detail="Insufficient access level.")
+    Args:
+        db: Supabase数据库客户端实例
+        user_id: 用户ID
+        item_id: 日程项目ID
+        required_access_level: 所需访问级别 (viewer, editor, owner)
+        
+    Returns:
+        str: 日程项目所属的行程ID
+    """
+    res = await db.table("itinerary_items").select(
+        "itinerary_days(trip_id, trips(user_id, trip_collaborators(access_level)))"
+    ).eq("id", item_id).eq("itinerary_days.trips.trip_collaborators.user_id", user_id).maybe_single().execute()
+    day = res.data.get('itinerary_days') if res and res.data else None
+    if not day or not day.get('trips'):
+        raise HTTPException(status_code=404, detail="Itinerary item not found.")
     
-    return True
+    trip_id = day['trip_id']
+    access_level = _access_level_from_trip_row(day['trips'], user_id)
+    if access_level:
+        _remember_access_level(trip_id, user_id, access_level)
+    _check_access_level(access_level, required_access_level)
+    return trip_id
+
+async def _rebalance_day_ranks(db: AsyncClient, user_id: str, trip_id: str, day_id: str):
+    """把一天内所有项目的 rank 重新均匀分布（后台任务；相邻项目 rank 相同时由移动接口直接调用）
+    
+    反复在同一位置插入会让 rank 越来越长，并发追加可能产生相同的 rank；这里按当前顺序生成等宽的新键，
+    通过 apply_itinerary_batch 在一个事务中一次写回。失败只记录日志，下次移动时会再次触发。
+    
+    Args:
+        db: Supabase数据库客户端实例
+        user_id: 用户ID
+        trip_id: 行程ID
+        day_id: 日程天ID
+    """
+    try:
+        res = await db.table("itinerary_items").select("id").eq("day_id", day_id).order("rank").order("id").execute()
+        ranks = rank_sequence(len(res.data))
+        operations = [{"op": "move", "id": item['id'], "rank": rank} for item, rank in zip(res.data, ranks)]
+        if operations:
+            batch_res = await db.rpc("apply_itinerary_batch", {
+                "p_trip_id": trip_id,
+                "p_user_id": user_id,
+                "p_operations": operations,
+            }).execute()
+            await trip_document_cache.invalidate(trip_id)
+            _publish_trip_event(trip_id, "itinerary.changed", {"results": batch_res.data})
+        logger.info("日程天 %s 的 rank 已重新分布: %d 个项目", day_id, len(operations))
+    except Exception as e:
+        logger.warning("日程天 %s 的 rank 重新分布失败: %s", day_id, e)
+
+# 行程列表可选择的字段，顺序即返回顺序；collaborators 为嵌入查询，itinerary 在列表中始终为空
+# day_count / item_count / collaborator_count / last_activity_at 是 trips 上由触发器维护的计数器
+TRIP_LIST_FIELDS = [
+    "id", "user_id", "name", "destination", "start_date", "end_date", "description",
+    "status", "thumbnail", "created_at", "updated_at",
+    "day_count", "item_count", "collaborator_count", "last_activity_at",
+    "collaborators", "itinerary",
+]
+
+# 完整行程文档（导出、复制）的嵌入查询：协作者、日程天及其项目
+# 协作者的 name/avatar_url 不在这里嵌入，由 load_profiles 按整个响应批量读取
+TRIP_DOCUMENT_SELECT = """
+    *,
+    trip_collaborators(id, user_id, access_level),
+    itinerary_days(
+        *,
+        itinerary_items(*)
+    )
+"""
+
+# --- 数据行 -> 响应结构 ---
+# 只做字段挑选和重命名，校验和序列化由 json_response / render_json 一次完成
+
+def _item_document(item: dict) -> dict:
+    """itinerary_items 行 -> ItineraryItem 结构"""
+    return {
+        "id": item['id'],
+        "time": item.get('time'),
+        "type": item.get('type', 'custom'),
+        "name": item['name'],
+        "notes": item.get('notes'),
+        "rank": item.get('rank'),
+    }
+
+def _day_document(day: dict, items: Optional[List[dict]] = None) -> dict:
+    """itinerary_days 行 -> ItineraryDay 结构
+    
+    Args:
+        day: 日程天数据行
+        items: 该天的项目行；为空时使用嵌入查询得到的 itinerary_items
+    """
+    if items is None:
+        items = day.get('itinerary_items') or []
+    return {
+        "id": day['id'],
+        "day_number": day['day_number'],
+        "date": day['date'],
+        "title": day.get('title'),
+        "items": [_item_document(item) for item in items],
+    }
+
+def _collaborator_user_ids(trips: List[dict]) -> List[str]:
+    """收集一批行程行中所有协作者的 user_id，供 load_profiles 一次读取"""
+    return [collab['user_id'] for trip in trips for collab in trip.get('trip_collaborators') or []]
+
+def _collaborator_documents(rows: Optional[List[dict]], profiles: Dict[str, dict]) -> List[dict]:
+    """trip_collaborators(id, user_id, access_level) 行 + load_profiles 的结果 -> Collaborator 结构"""
+    return [
+        {
+            "id": collab['id'],
+            "user_id": collab['user_id'],
+            "access_level": collab['access_level'],
+            "name": profiles[str(collab['user_id'])].get('name') or '',
+            "avatar_url": profiles[str(collab['user_id'])].get('avatar_url'),
+        }
+        for collab in rows or []
+        if str(collab['user_id']) in profiles
+    ]
+
+def _trip_document(trip: dict, collaborators: Optional[List[dict]] = None, itinerary: Optional[List[dict]] = None) -> dict:
+    """trips 行 -> TripResponse 结构"""
+    return {
+        "name": trip['name'],
+        "destination": trip['destination'],
+        "start_date": trip['start_date'],
+        "end_date": trip['end_date'],
+        "description": trip.get('description'),
+        "status": trip['status'],
+        "thumbnail": trip.get('thumbnail'),
+        "id": trip['id'],
+        "user_id": trip['user_id'],
+        "created_at": trip['created_at'],
+        "updated_at": trip['updated_at'],
+        "collaborators": collaborators or [],
+        "itinerary": itinerary or [],
+    }
+
+def _render_trip_document(trip: dict, profiles: Dict[str, dict]) -> bytes:
+    """把 TRIP_DOCUMENT_SELECT 查询得到的行程行序列化为 TripResponse JSON"""
+    document = _trip_document(
+        trip,
+        collaborators=_collaborator_documents(trip.get('trip_collaborators'), profiles),
+        itinerary=[_day_document(day) for day in trip.get('itinerary_days') or []],
+    )
+    return render_json(TripResponse, document)
+
+# 事件只携带变化的这一行，字段与 notify_trip_event 触发器发出的相同
+TRIP_EVENT_FIELDS = ["id", "name", "destination", "start_date", "end_date", "description", "status", "thumbnail"]
+DAY_EVENT_FIELDS = ["id", "day_number", "date", "title"]
+ITEM_EVENT_FIELDS = ["id", "day_id", "time", "type", "name", "notes", "rank"]
+
+def _event_data(row: dict, fields: List[str]) -> dict:
+    """从数据行中挑出事件字段"""
+    return {field: row.get(field) for field in fields}
+
+def _publish_trip_event(trip_id: str, event_type: str, data: dict):
+    """写入成功后发布行程变更事件（只在 local 模式下发布）
+    
+    Args:
+        trip_id: 行程ID
+        event_type: 事件类型，例如 item.updated
+        data: 事件数据
+    """
+    if trip_event_listener is None:
+        trip_events.publish(str(trip_id), {"type": event_type, "data": data})
+
+async def _trip_document_response(db: AsyncClient, user_id: str, etag: str, body: bytes) -> Response:
+    """用已序列化的行程详情构建响应（跳过 response_model 的再次校验）
+    
+    缓存的文档按行程共享，协作者只有 id/user_id/access_level；
+    name/avatar_url 与其他接口一样由 load_profiles 按当前用户读取后补上。
+    """
+    document = load_json(body)
+    if document['collaborators']:
+        profiles = await load_profiles(db, user_id, [collab['user_id'] for collab in document['collaborators']])
+        document['collaborators'] = _collaborator_documents(document['collaborators'], profiles)
+        body = dump_json(document)
+    response = Response(content=body, media_type="application/json")
+    set_etag(response, etag)
+    return response
+
+def _parse_trip_fields(fields: Optional[str]) -> List[str]:
+    """解析 fields 查询参数，为空时返回全部字段
+    
+    Args:
+        fields: 逗号分隔的字段名
+        
+    Returns:
+        List[str]: 请求的字段名
+    """
+    if not fields:
+        return TRIP_LIST_FIELDS
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in TRIP_LIST_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(TRIP_LIST_FIELDS)}",
+        )
+    return requested
+
+def _encode_trip_cursor(created_at: str, trip_id: str) -> str:
+    """把最后一行的 (created_at, id) 编码为不透明的游标"""
+    raw = json.dumps([created_at, str(trip_id)], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_trip_cursor(cursor: str) -> Tuple[str, str]:
+    """解析游标，格式不正确时返回 400"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, trip_id = json.loads(raw)
+        # 校验格式，避免把任意字符串拼进 PostgREST 过滤条件
+        return datetime.fromisoformat(created_at).isoformat(), str(uuid.UUID(trip_id))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
 
 # --- 行程管理接口 ---
 
-@router.get("/", response_model=List[TripResponse])
-async def get_trips(db: Client = Depends(get_supabase_client), user_id: str = Depends(require_user)):
-    """获取用户的所有行程列表
+@router.get("/", response_model=List[TripSummary], response_model_exclude_unset=True)
+async def get_trips(
+    limit: Optional[int] = Query(None, ge=1, le=settings.TRIP_LIST_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None),
+    db: AsyncClient = Depends(get_async_supabase_client),
+    user_id: str = Depends(require_user),
+):
+    """获取用户的行程列表（按 created_at, id 倒序，游标分页）
+    
+    下一页的游标通过 X-Next-Cursor 响应头返回，没有更多数据时不返回该响应头。
+    limit 和 cursor 都不传时不分页，返回全部行程（兼容不读取 X-Next-Cursor 的旧客户端）。
+    卡片上的天数、项目数、协作者数和最近活动时间直接读取 trips 上的计数器列，
+    例如 fields=id,name,thumbnail,day_count,item_count,collaborator_count,last_activity_at 只需读取 trips 一张表。
     
     Args:
+        limit: 每页数量；只传 cursor 时默认 TRIP_LIST_PAGE_SIZE
+        cursor: 上一页返回的 X-Next-Cursor
+        fields: 逗号分隔的返回字段，例如 id,name,destination,start_date,thumbnail；为空时返回全部字段
         db: Supabase数据库客户端实例（依赖注入）
         user_id: 用户ID（必需，依赖注入）
         
     Returns:
-        List[TripResponse]: 行程响应对象列表
+        List[TripSummary]: 行程列表（只包含请求的字段）
     """
+    requested = _parse_trip_fields(fields)
+    paginate = limit is not None or cursor is not None
+    limit = limit or settings.TRIP_LIST_PAGE_SIZE
+    
+    columns = [column for column in TRIP_LIST_FIELDS if column in requested and column not in ("collaborators", "itinerary")]
+    # created_at 和 id 是游标列，始终查询
+    for column in ("created_at", "id"):
+        if column not in columns:
+            columns.append(column)
+    select = ", ".join(columns)
+    if "collaborators" in requested:
+        select += ", trip_collaborators(id, user_id, access_level)"
+    
     try:
-        # 查询用户拥有的行程和作为协作者参与的行程
-        response = db.table("trips").select("*, trip_collaborators(user_id, access_level, users(name, avatar_url))").or_(
-            f"user_id.eq.{user_id}",
-            f"trip_collaborators.user_id.eq.{user_id}"
-        ).order("created_at", desc=True).execute()
+        # list_user_trips 基于 trip_members 的 (user_id, trip_created_at, trip_id) 索引做范围扫描，
+        # 同时覆盖拥有和参与协作的行程；多取一行用于判断是否还有下一页，不分页时 p_limit 为 NULL（LIMIT NULL 即不限制）
+        params = {"p_user_id": user_id, "p_limit": limit + 1 if paginate else None}
+        if cursor:
+            params["p_cursor_created_at"], params["p_cursor_id"] = _decode_trip_cursor(cursor)
+        res = await db.rpc("list_user_trips", params).select(select) \
+            .order("created_at", desc=True).order("id", desc=True).execute()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    rows = res.data
+    headers = {}
+    if paginate and len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = _encode_trip_cursor(rows[-1]['created_at'], rows[-1]['id'])
+    
+    # 整页行程的协作者资料一次读取
+    profiles = await load_profiles(db, user_id, _collaborator_user_ids(rows)) if "collaborators" in requested else {}
+    
+    trips = []
+    for trip in rows:
+        item = {column: trip[column] for column in TRIP_LIST_FIELDS if column in requested and column in trip}
+        if "collaborators" in requested:
+            item['collaborators'] = _collaborator_documents(trip.get('trip_collaborators'), profiles)
+        if "itinerary" in requested:
+            item['itinerary'] = []  # 简化处理，不在列表中返回详细日程
+        trips.append(item)
+    
+    # 只包含请求的字段，等价于 response_model_exclude_unset
+    return json_response(List[TripSummary], trips, headers=headers)
+
+async def _fetch_export_page(db: AsyncClient, user_id: str, cursor: Optional[Tuple[str, str]] = None) -> List[dict]:
+    """取回一页完整的行程文档（按 created_at, id 倒序）
+    
+    Args:
+        db: Supabase数据库客户端实例
+        user_id: 用户ID
+        cursor: 上一页最后一行的 (created_at, id)，第一页为空
         
-        # 处理协作者信息
-        trips = []
-        for trip in response.data:
-            collaborators = []
-            if trip.get('trip_collaborators'):
-                for collab in trip['trip_collaborators']:
-                    if collab.get('users'):
-                        collaborators.append(Collaborator(
-                            id=uuid.uuid4(),  # 这里应该使用数据库中的实际ID
-                            user_id=collab['user_id'],
-                            access_level=collab['access_level'],
-                            name=collab['users'].get('name', ''),
-                            avatar_url=collab['users'].get('avatar_url')
-                        ))
-            
-            # 构建行程对象
-            trip_obj = TripResponse(
-                id=trip['id'],
-                user_id=trip['user_id'],
-                name=trip['name'],
-                destination=trip['destination'],
-                start_date=trip['start_date'],
-                end_date=trip['end_date'],
-                description=trip.get('description'),
-                status=trip['status'],
-                thumbnail=trip.get('thumbnail'),
-                created_at=trip['created_at'],
-                updated_at=trip['updated_at'],
-                collaborators=collaborators,
-                itinerary=[]  # 简化处理，不在列表中返回详细日程
-            )
-            trips.append(trip_obj)
-            
-        return trips
+    Returns:
+        List[dict]: 行程数据行，包含协作者、日程天和日程项目
+    """
+    params = {"p_user_id": user_id, "p_limit": settings.TRIP_EXPORT_PAGE_SIZE}
+    if cursor:
+        params["p_cursor_created_at"], params["p_cursor_id"] = cursor
+    res = await db.rpc("list_user_trips", params).select(TRIP_DOCUMENT_SELECT) \
+        .order("created_at", desc=True).order("id", desc=True) \
+        .order("day_number", foreign_table="itinerary_days") \
+        .order("rank", foreign_table="itinerary_days.itinerary_items") \
+        .execute()
+    return res.data
+
+async def _export_trip_lines(db: AsyncClient, user_id: str, page: List[dict]) -> AsyncIterator[bytes]:
+    """逐页生成 NDJSON 行，内存中最多只保留一页行程
+    
+    Args:
+        db: Supabase数据库客户端实例
+        user_id: 用户ID
+        page: 已取回的第一页
+    """
+    while page:
+        try:
+            # 每页的协作者资料一次读取
+            profiles = await load_profiles(db, user_id, _collaborator_user_ids(page))
+        except Exception as e:
+            logger.error("行程导出中断 user=%s: %s", user_id, e)
+            yield json.dumps({"error": "Export interrupted.", "detail": str(e)}).encode() + b"\n"
+            return
+        for trip in page:
+            yield _render_trip_document(trip, profiles) + b"\n"
+        if len(page) < settings.TRIP_EXPORT_PAGE_SIZE:
+            return
+        cursor = (page[-1]['created_at'], page[-1]['id'])
+        try:
+            page = await _fetch_export_page(db, user_id, cursor)
+        except Exception as e:
+            # 响应头已经发出，无法再改状态码：追加一行错误，客户端据此判断导出不完整
+            logger.error("行程导出中断 user=%s: %s", user_id, e)
+            yield json.dumps({"error": "Export interrupted.", "detail": str(e)}).encode() + b"\n"
+            return
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_trips(db: AsyncClient = Depends(get_async_supabase_client), user_id: str = Depends(require_user)):
+    """以 NDJSON 流导出用户的全部行程（拥有的和参与协作的），每行一个完整的行程文档
+    
+    通过 list_user_trips 按 (created_at, id) 游标逐页读取，每页一次数据库往返，
+    取回整页行程及其协作者、日程天和日程项目；生成完一页后再读取下一页，内存占用与行程总数无关。
+    
+    Args:
+        db: Supabase数据库客户端实例（依赖注入）
+        user_id: 用户ID（必需，依赖注入）
+        
+    Returns:
+        StreamingResponse: application/x-ndjson，每行结构与 TripResponse 相同
+    """
+    try:
+        # 第一页在发送响应头之前读取，出错时仍然可以返回 500
+        first_page = await _fetch_export_page(db, user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    return StreamingResponse(
+        _export_trip_lines(db, user_id, first_page),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="trips.ndjson"'},
+    )
 
 @router.post("/", response_model=TripResponse, status_code=status.HTTP_201_CREATED)
-async def create_trip(trip: TripCreate, db: Client = Depends(get_supabase_client), user_id: str = Depends(require_user)):
+async def create_trip(trip: TripCreate, db: AsyncClient = Depends(get_async_supabase_client), user_id: str = Depends(require_user)):
     """创建新的行程
     
+    日程天由数据库触发器（sync_trip_itinerary_days）按 start_date ~ end_date 在同一事务中批量生成。
+    
     Args:
         trip: 行程创建请求对象
         db: Supabase数据库客户端实例（依赖注入）
@@ -177,7 +705,7 @@ async def create_trip(trip: TripCreate, db: Client = Depends(get_supabase_client
     """
     try:
         # 向数据库插入新的行程记录
-        response = db.table("trips").insert({
+        response = await db.table("trips").insert({
             "name": trip.name,
             "destination": trip.destination,
             "start_date": trip.start_date,
@@ -194,121 +722,67 @@ async def create_trip(trip: TripCreate, db: Client = Depends(get_supabase_client
         
         # 构建响应对象
         created_trip = response.data[0]
-        trip_response = TripResponse(
-            id=created_trip['id'],
-            user_id=created_trip['user_id'],
-            name=created_trip['name'],
-            destination=created_trip['destination'],
-            start_date=created_trip['start_date'],
-            end_date=created_trip['end_date'],
-            description=created_trip.get('description'),
-            status=created_trip['status'],
-            thumbnail=created_trip.get('thumbnail'),
-            created_at=created_trip['created_at'],
-            updated_at=created_trip['updated_at'],
-            collaborators=[],
-            itinerary=[]
-        )
-        
-        return trip_response
+        return json_response(TripResponse, _trip_document(created_trip), status_code=status.HTTP_201_CREATED)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{trip_id}", response_model=TripResponse)
-async def get_trip_details(trip_id: uuid.UUID, db: Client = Depends(get_supabase_client), user_id: str = Depends(require_user)):
+async def get_trip_details(trip_id: uuid.UUID, if_none_match: Optional[str] = Header(None), db: AsyncClient = Depends(get_async_supabase_client), user_id: str = Depends(require_user)):
     """获取特定行程的详细信息
     
     Args:
         trip_id: 行程ID
+        if_none_match: If-None-Match 请求头（客户端缓存的 ETag）
         db: Supabase数据库客户端实例（依赖注入）
         user_id: 用户ID（必需，依赖注入）
         
     Returns:
-        TripResponse: 行程响应对象
+        TripResponse: 行程响应对象；ETag 未变化时返回 304
     """
     try:
         # 验证用户是否有访问权限
-        _verify_user_has_access_to_trip(db, user_id, str(trip_id))
-        
-        # 查询行程详细信息，包括协作者和日程
-        response = db.table("trips").select("""
-            *,
-            trip_collaborators(user_id, access_level, users(name, avatar_url)),
-            itinerary_days(
-                *,
-                itinerary_items(*)
-            )
-        """).eq("id", str(trip_id)).single().execute()
+        await _verify_user_has_access_to_trip(db, user_id, str(trip_id))
+        
+        # 缓存命中时直接返回已序列化的文档，不再查询数据库和构建模型
+        cached = await trip_document_cache.get(str(trip_id))
+        if cached:
+            etag, body = cached
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag)
+            return await _trip_document_response(db, user_id, etag, body)
+        
+        # 在读取数据库之前取代次标记：读取期间有写接口 invalidate 时，下面的 set 会放弃写入旧文档
+        generation = await trip_document_cache.generation(str(trip_id))
+        
+        # get_trip_document 在数据库中用 json_agg 组装好完整文档（日程天按 day_number、项目按 rank 排序），
+        # 这里不再逐行重建对象，原样序列化后缓存；协作者资料在构建响应时补上
+        try:
+            res = await db.rpc("get_trip_document", {"p_trip_id": str(trip_id), "p_user_id": user_id}).execute()
+        except APIError as e:
+            raise_for_rpc_error(e)
         
         # 检查行程是否存在
-        if not response.data:
+        if not res.data:
             raise HTTPException(status_code=404, detail="Trip not found.")
         
-        trip = response.data
-        
-        # 处理协作者信息
-        collaborators = []
-        if trip.get('trip_collaborators'):
-            for collab in trip['trip_collaborators']:
-                if collab.get('users'):
-                    collaborators.append(Collaborator(
-                        id=uuid.uuid4(),  # 这里应该使用数据库中的实际ID
-                        user_id=collab['user_id'],
-                        access_level=collab['access_level'],
-                        name=collab['users'].get('name', ''),
-                        avatar_url=collab['users'].get('avatar_url')
-                    ))
-        
-        # 处理日程信息
-        itinerary = []
-        if trip.get('itinerary_days'):
-            for day in trip['itinerary_days']:
-                items = []
-                if day.get('itinerary_items'):
-                    for item in day['itinerary_items']:
-                        items.append(ItineraryItem(
-                            id=item['id'],
-                            time=item.get('time'),
-                            type=item.get('type', 'custom'),
-                            name=item['name'],
-                            notes=item.get('notes')
-                        ))
-                
-                itinerary.append(ItineraryDay(
-                    id=day['id'],
-                    day_number=day['day_number'],
-                    date=day['date'],
-                    title=day.get('title'),
-                    items=items
-                ))
-        
-        # 构建响应对象
-        trip_response = TripResponse(
-            id=trip['id'],
-            user_id=trip['user_id'],
-            name=trip['name'],
-            destination=trip['destination'],
-            start_date=trip['start_date'],
-            end_date=trip['end_date'],
-            description=trip.get('description'),
-            status=trip['status'],
-            thumbnail=trip.get('thumbnail'),
-            created_at=trip['created_at'],
-            updated_at=trip['updated_at'],
-            collaborators=collaborators,
-            itinerary=itinerary
-        )
-        
-        return trip_response
+        # 序列化一次，写入缓存后直接作为响应体返回；客户端的 ETag 与 RPC 返回的版本一致时返回 304
+        body = dump_json(res.data['document'])
+        etag = make_etag("trip", str(trip_id), res.data['version'])
+        await trip_document_cache.set(str(trip_id), etag, body, generation)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        return await _trip_document_response(db, user_id, etag, body)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.patch("/{trip_id}", response_model=TripResponse)
-async def update_trip(trip_id: uuid.UUID, trip_update: TripUpdate, db: Client = Depends(get_supabase_client), user_id: str = Depends(require_user)):
+async def update_trip(trip_id: uuid.UUID, trip_update: TripUpdate, db: AsyncClient = Depends(get_async_supabase_client), user_id: str = Depends(require_user)):
     """更新行程信息
     
+    修改 start_date/end_date 时，数据库触发器会批量插入缺少的日程天并把已有的天平移到新日期。
+    
     Args:
         trip_id: 要更新的行程ID
         trip_update: 行程更新请求对象
@@ -320,7 +794,7 @@ async def update_trip(trip_id: uuid.UUID, trip_update: TripUpdate, db: Client =
     """
     try:
         # 验证用户是否有编辑权限
-        _verify_user_has_access_to_trip(db, user_id, str(trip_id), "editor")
+        await _verify_user_has_access_to_trip(db, user_id, str(trip_id), "editor")
         
         # 获取请求中非空的更新数据
         update_data = trip_update.model_dump(exclude_unset=True)
@@ -330,7 +804,8 @@ async def update_trip(trip_id: uuid.UUID, trip_update: TripUpdate, db: Client =
             raise HTTPException(status_code=400, detail="No update data provided.")
         
         # 更新数据库中的行程记录
-        response = db.table("trips").update(update_data).eq("id", str(trip_id)).execute()
+        response = await db.table("trips").update(update_data).eq("id", str(trip_id)).execute()
+        await trip_document_cache.invalidate(str(trip_id))
         
         # 检查是否成功更新行程
         if not response.data:
@@ -338,32 +813,17 @@ async def update_trip(trip_id: uuid.UUID, trip_update: TripUpdate, db: Client =
         
         # 获取更新后的行程信息
         updated_trip = response.data[0]
+        _publish_trip_event(trip_id, "trip.updated", _event_data(updated_trip, TRIP_EVENT_FIELDS))
         
         # 构建响应对象
-        trip_response = TripResponse(
-            id=updated_trip['id'],
-            user_id=updated_trip['user_id'],
-            name=updated_trip['name'],
-            destination=updated_trip['destination'],
-            start_date=updated_trip['start_date'],
-            end_date=updated_trip['end_date'],
-            description=updated_trip.get('description'),
-            status=updated_trip['status'],
-            thumbnail=updated_trip.get('thumbnail'),
-            created_at=updated_trip['created_at'],
-            updated_at=updated_trip['updated_at'],
-            collaborators=[],
-            itinerary=[]
-        )
-        
-        return trip_response
+        return json_response(TripResponse, _trip_document(updated_trip))
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/{trip_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_trip(trip_id: uuid.UUID, db: Client = Depends(get_supabase_client), user_id: str = Depends(require_user)):
+async def delete_trip(trip_id: uuid.UUID, db: AsyncClient = Depends(get_async_supabase_client), user_id: str = Depends(require_user)):
     """删除行程
     
     Args:
@@ -373,23 +833,63 @@ async def delete_trip(trip_id: uuid.UUID, db: Client = Depends(get_supabase_clie
     """
     try:
         # 验证用户是否是行程所有者
-        _verify_user_has_access_to_trip(db, user_id, str(trip_id), "owner")
+        await _verify_user_has_access_to_trip(db, user_id, str(trip_id), "owner")
         
         # 从数据库中删除行程记录
-        response = db.table("trips").delete().eq("id", str(trip_id)).execute()
+        response = await db.table("trips").delete().eq("id", str(trip_id)).execute()
+        await trip_document_cache.invalidate(str(trip_id))
         
         # 检查是否成功删除行程
         if not response.data:
             raise HTTPException(status_code=404, detail="Trip not found.")
+        
+        # 行程已删除，所有用户的访问级别缓存随之失效
+        _invalidate_trip_access(trip_id)
+        _publish_trip_event(trip_id, "trip.deleted", {"id": str(trip_id)})
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/{trip_id}/clone", response_model=TripResponse, status_code=status.HTTP_201_CREATED)
+async def clone_trip(trip_id: uuid.UUID, clone: Optional[TripClone] = None, db: AsyncClient = Depends(get_async_supabase_client), user_id: str = Depends(require_user)):
+    """复制行程（包括日程天和日程项目），新行程属于当前用户
+    
+    由 clone_trip RPC 在一个事务中用集合插入完成复制，并在同一次往返中嵌入查询出完整的新行程。
+    协作者不会被复制。
+    
+    Args:
+        trip_id: 源行程ID（需要查看权限）
+        clone: 复制选项（新的开始日期、名称），可选
+        db: Supabase数据库客户端实例（依赖注入）
+        user_id: 用户ID（必需，依赖注入）
+        
+    Returns:
+        TripResponse: 新行程的完整信息
+    """
+    clone = clone or TripClone()
+    try:
+        res = await db.rpc("clone_trip", {
+            "p_trip_id": str(trip_id),
+            "p_user_id": user_id,
+            "p_start_date": clone.start_date,
+            "p_name": clone.name,
+        }).select(TRIP_DOCUMENT_SELECT) \
+            .order("day_number", foreign_table="itinerary_days") \
+            .order("rank", foreign_table="itinerary_days.itinerary_items") \
+            .single().execute()
+    except APIError as e:
+        raise_for_rpc_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    # 协作者不复制，新行程没有需要读取资料的协作者
+    return Response(content=_render_trip_document(res.data, {}), status_code=status.HTTP_201_CREATED, media_type="application/json")
+
 # --- 协作者管理接口 ---
 
 @router.get("/{trip_id}/collaborators", response_model=List[Collaborator])
-async def get_collaborators(trip_id: uuid.UUID, db: Client = Depends(get_supabase_client), user_id: str = Depends(require_user)):
+async def get_collaborators(trip_id: uuid.UUID, db: AsyncClient = Depends(get_async_supabase_client), user_id: str = Depends(require_user)):
     """获取行程的协作者列表
     
     Args:
@@ -402,29 +902,19 @@ async def get_collaborators(trip_id: uuid.UUID, db: Client = Depends(get_supabas
     """
     try:
         # 验证用户是否有访问权限
-        _verify_user_has_access_to_trip(db, user_id, str(trip_id))
+        await _verify_user_has_access_to_trip(db, user_id, str(trip_id))
         
         # 查询协作者信息
-        response = db.table("trip_collaborators").select("user_id, access_level, users(name, avatar_url)").eq("trip_id", str(trip_id)).execute()
+        response = await db.table("trip_collaborators").select("id, user_id, access_level").eq("trip_id", str(trip_id)).execute()
+        profiles = await load_profiles(db, user_id, [collab['user_id'] for collab in response.data])
         
         # 处理协作者信息
-        collaborators = []
-        for collab in response.data:
-            if collab.get('users'):
-                collaborators.append(Collaborator(
-                    id=uuid.uuid4(),  # 这里应该使用数据库中的实际ID
-                    user_id=collab['user_id'],
-                    access_level=collab['access_level'],
-                    name=collab['users'].get('name', ''),
-                    avatar_url=collab['users'].get('avatar_url')
-                ))
-        
-        return collaborators
+        return json_response(List[Collaborator], _collaborator_documents(response.data, profiles))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/{trip_id}/collaborators", response_model=Collaborator, status_code=status.HTTP_201_CREATED)
-async def add_collaborator(trip_id: uuid.UUID, user_id_to_add: str, access_level: str = "viewer", db: Client = Depends(get_supabase_client), user_id: str = Depends(require_user)):
+async def add_collaborator(trip_id: uuid.UUID, user_id_to_add: str, access_level: str = "viewer", db: AsyncClient = Depends(get_async_supabase_client), user_id: str = Depends(require_user)):
     """添加协作者
     
     Args:
@@ -439,42 +929,43 @@ async def add_collaborator(trip_id: uuid.UUID, user_id_to_add: str, access_level
     """
     try:
         # 验证当前用户是否是行程所有者
-        _verify_user_has_access_to_trip(db, user_id, str(trip_id), "owner")
+        await _verify_user_has_access_to_trip(db, user_id, str(trip_id), "owner")
         
         # 检查要添加的用户是否已经是协作者
-        existing_collab = db.table("trip_collaborators").select("id").eq("trip_id", str(trip_id)).eq("user_id", user_id_to_add).execute()
+        existing_collab = await db.table("trip_collaborators").select("id").eq("trip_id", str(trip_id)).eq("user_id", user_id_to_add).execute()
         if existing_collab.data:
             raise HTTPException(status_code=400, detail="User is already a collaborator.")
         
         # 添加协作者
-        response = db.table("trip_collaborators").insert({
+        response = await db.table("trip_collaborators").insert({
             "trip_id": str(trip_id),
             "user_id": user_id_to_add,
             "access_level": access_level
         }).execute()
+        await trip_document_cache.invalidate(str(trip_id))
         
         # 检查是否成功添加协作者
         if not response.data:
             raise HTTPException(status_code=400, detail="Failed to add collaborator.")
+        _invalidate_trip_access(trip_id, user_id_to_add)
         
         # 构建响应对象
         collaborator = response.data[0]
-        collaborator_response = Collaborator(
-            id=collaborator['id'],
-            user_id=collaborator['user_id'],
-            access_level=collaborator['access_level'],
-            name="",  # 简化处理，实际应用中应查询用户信息
-            avatar_url=None
-        )
-        
-        return collaborator_response
+        profile = (await load_profiles(db, user_id, [collaborator['user_id']])).get(str(collaborator['user_id']), {})
+        return json_response(Collaborator, {
+            "id": collaborator['id'],
+            "user_id": collaborator['user_id'],
+            "access_level": collaborator['access_level'],
+            "name": profile.get('name') or "",
+            "avatar_url": profile.get('avatar_url'),
+        }, status_code=status.HTTP_201_CREATED)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/{trip_id}/collaborators/{user_id_to_remove}", status_code=status.HTTP_204_NO_CONTENT)
-async def remove_collaborator(trip_id: uuid.UUID, user_id_to_remove: str, db: Client = Depends(get_supabase_client), user_id: str = Depends(require_user)):
+async def remove_collaborator(trip_id: uuid.UUID, user_id_to_remove: str, db: AsyncClient = Depends(get_async_supabase_client), user_id: str = Depends(require_user)):
     """移除协作者
     
     Args:
@@ -485,19 +976,21 @@ async def remove_collaborator(trip_id: uuid.UUID, user_id_to_remove: str, db: Cl
     """
     try:
         # 验证当前用户是否是行程所有者
-        _verify_user_has_access_to_trip(db, user_id, str(trip_id), "owner")
+        await _verify_user_has_access_to_trip(db, user_id, str(trip_id), "owner")
         
         # 检查要移除的用户是否是协作者
-        collaborator = db.table("trip_collaborators").select("id").eq("trip_id", str(trip_id)).eq("user_id", user_id_to_remove).execute()
+        collaborator = await db.table("trip_collaborators").select("id").eq("trip_id", str(trip_id)).eq("user_id", user_id_to_remove).execute()
         if not collaborator.data:
             raise HTTPException(status_code=404, detail="User is not a collaborator.")
         
         # 移除协作者
-        response = db.table("trip_collaborators").delete().eq("trip_id", str(trip_id)).eq("user_id", user_id_to_remove).execute()
+        response = await db.table("trip_collaborators").delete().eq("trip_id", str(trip_id)).eq("user_id", user_id_to_remove).execute()
+        await trip_document_cache.invalidate(str(trip_id))
         
         # 检查是否成功移除协作者
         if not response.data:
             raise HTTPException(status_code=400, detail="Failed to remove collaborator.")
+        _invalidate_trip_access(trip_id, user_id_to_remove)
     except HTTPException:
         raise
     except Exception as e:
@@ -506,7 +999,7 @@ async def remove_collaborator(trip_id: uuid.UUID, user_id_to_remove: str, db: Cl
 # --- 日程天管理接口 ---
 
 @router.get("/{trip_id}/days", response_model=List[ItineraryDay])
-async def get_itinerary_days(trip_id: uuid.UUID, db: Client = Depends(get_supabase_client), user_id: str = Depends(require_user)):
+async def get_itinerary_days(trip_id: uuid.UUID, db: AsyncClient = Depends(get_async_supabase_client), user_id: str = Depends(require_user)):
     """获取行程的所有日程天
     
     Args:
@@ -519,44 +1012,25 @@ async def get_itinerary_days(trip_id: uuid.UUID, db: Client = Depends(get_supaba
     """
     try:
         # 验证用户是否有访问权限
-        _verify_user_has_access_to_trip(db, user_id, str(trip_id))
+        await _verify_user_has_access_to_trip(db, user_id, str(trip_id))
         
         # 查询日程天信息
-        response = db.table("itinerary_days").select("*, itinerary_items(*)").eq("trip_id", str(trip_id)).order("day_number").execute()
+        response = await db.table("itinerary_days").select("*, itinerary_items(*)").eq("trip_id", str(trip_id)).order("day_number").execute()
         
         # 处理日程天信息
-        days = []
-        for day in response.data:
-            items = []
-            if day.get('itinerary_items'):
-                for item in day['itinerary_items']:
-                    items.append(ItineraryItem(
-                        id=item['id'],
-                        time=item.get('time'),
-                        type=item.get('type', 'custom'),
-                        name=item['name'],
-                        notes=item.get('notes')
-                    ))
-            
-            days.append(ItineraryDay(
-                id=day['id'],
-                day_number=day['day_number'],
-                date=day['date'],
-                title=day.get('title'),
-                items=items
-            ))
-        
-        return days
+        return json_response(List[ItineraryDay], [_day_document(day) for day in response.data])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/{trip_id}/days", response_model=ItineraryDay, status_code=status.HTTP_201_CREATED)
-async def add_itinerary_day(trip_id: uuid.UUID, day_number: int, date: str, title: Optional[str] = None, db: Client = Depends(get_supabase_client), user_id: str = Depends(require_user)):
+async def add_itinerary_day(trip_id: uuid.UUID, date: str, title: Optional[str] = None, db: AsyncClient = Depends(get_async_supabase_client), user_id: str = Depends(require_user)):
     """添加新的日程天
     
+    有日期范围的行程，日程天由数据库按 start_date/end_date 生成（修改日期即可增减天数），这里拒绝手动添加；
+    没有日期范围的行程追加在最后一天之后，day_number 由服务端决定。
+    
     Args:
         trip_id: 行程ID
-        day_number: 天数
         date: 日期
         title: 标题（可选）
         db: Supabase数据库客户端实例（依赖注入）
@@ -567,15 +1041,28 @@ async def add_itinerary_day(trip_id: uuid.UUID, day_number: int, date: str, titl
     """
     try:
         # 验证用户是否有编辑权限
-        _verify_user_has_access_to_trip(db, user_id, str(trip_id), "editor")
+        await _verify_user_has_access_to_trip(db, user_id, str(trip_id), "editor")
+        
+        # 读取日期范围和当前最后一天
+        trip_res = await db.table("trips").select("start_date, end_date, itinerary_days(day_number)") \
+            .eq("id", str(trip_id)) \
+            .order("day_number", desc=True, foreign_table="itinerary_days") \
+            .limit(1, foreign_table="itinerary_days") \
+            .single().execute()
+        trip = trip_res.data
+        if trip.get('start_date') and trip.get('end_date'):
+            raise HTTPException(status_code=400, detail="Itinerary days follow the trip's date range; update start_date/end_date instead.")
+        last_days = trip.get('itinerary_days') or []
+        day_number = last_days[0]['day_number'] + 1 if last_days else 1
         
         # 添加日程天
-        response = db.table("itinerary_days").insert({
+        response = await db.table("itinerary_days").insert({
             "trip_id": str(trip_id),
             "day_number": day_number,
             "date": date,
             "title": title
         }).execute()
+        await trip_document_cache.invalidate(str(trip_id))
         
         # 检查是否成功添加日程天
         if not response.data:
@@ -583,20 +1070,15 @@ async def add_itinerary_day(trip_id: uuid.UUID, day_number: int, date: str, titl
         
         # 构建响应对象
         day = response.data[0]
-        day_response = ItineraryDay(
-            id=day['id'],
-            day_number=day['day_number'],
-            date=day['date'],
-            title=day.get('title'),
-            items=[]
-        )
-        
-        return day_response
+        _publish_trip_event(trip_id, "day.created", _event_data(day, DAY_EVENT_FIELDS))
+        return json_response(ItineraryDay, _day_document(day, items=[]), status_code=status.HTTP_201_CREATED)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.patch("/days/{day_id}", response_model=ItineraryDay)
-async def update_itinerary_day(day_id: uuid.UUID, title: Optional[str] = None, db: Client = Depends(get_supabase_client), user_id: str = Depends(require_user)):
+async def update_itinerary_day(day_id: uuid.UUID, title: Optional[str] = None, db: AsyncClient = Depends(get_async_supabase_client), user_id: str = Depends(require_user)):
     """更新日程天信息
     
     Args:
@@ -609,13 +1091,8 @@ async def update_itinerary_day(day_id: uuid.UUID, title: Optional[str] = None, d
         ItineraryDay: 更新后的日程天信息
     """
     try:
-        # 验证用户是否有编辑权限（需要先查询day所属的行程）
-        day_res = db.table("itinerary_days").select("trip_id").eq("id", str(day_id)).single().execute()
-        if not day_res.data:
-            raise HTTPException(status_code=404, detail="Itinerary day not found.")
-        
-        trip_id = day_res.data['trip_id']
-        _verify_user_has_access_to_trip(db, user_id, trip_id, "editor")
+        # 验证用户是否有编辑权限（一次查询同时解析day所属的行程和权限）
+        trip_id = await _resolve_day_access(db, user_id, str(day_id), "editor")
         
         # 更新日程天
         update_data = {}
@@ -625,7 +1102,8 @@ async def update_itinerary_day(day_id: uuid.UUID, title: Optional[str] = None, d
         if not update_data:
             raise HTTPException(status_code=400, detail="No update data provided.")
         
-        response = db.table("itinerary_days").update(update_data).eq("id", str(day_id)).execute()
+        response = await db.table("itinerary_days").update(update_data).eq("id", str(day_id)).execute()
+        await trip_document_cache.invalidate(str(trip_id))
         
         # 检查是否成功更新日程天
         if not response.data:
@@ -633,59 +1111,41 @@ async def update_itinerary_day(day_id: uuid.UUID, title: Optional[str] = None, d
         
         # 获取更新后的日程天信息
         day = response.data[0]
+        _publish_trip_event(trip_id, "day.updated", _event_data(day, DAY_EVENT_FIELDS))
         
         # 查询相关的项目信息
-        items_res = db.table("itinerary_items").select("*").eq("day_id", str(day_id)).execute()
-        items = []
-        if items_res.data:
-            for item in items_res.data:
-                items.append(ItineraryItem(
-                    id=item['id'],
-                    time=item.get('time'),
-                    type=item.get('type', 'custom'),
-                    name=item['name'],
-                    notes=item.get('notes')
-                ))
+        items_res = await db.table("itinerary_items").select("*").eq("day_id", str(day_id)).execute()
         
         # 构建响应对象
-        day_response = ItineraryDay(
-            id=day['id'],
-            day_number=day['day_number'],
-            date=day['date'],
-            title=day.get('title'),
-            items=items
-        )
-        
-        return day_response
+        return json_response(ItineraryDay, _day_document(day, items=items_res.data or []))
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/days/{day_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_itinerary_day(day_id: uuid.UUID, db: Client = Depends(get_supabase_client), user_id: str = Depends(require_user)):
+async def delete_itinerary_day(day_id: uuid.UUID, db: AsyncClient = Depends(get_async_supabase_client), user_id: str = Depends(require_user)):
     """删除日程天
     
+    之后的日程天由数据库触发器用一条 UPDATE 依次前移 day_number。
+    
     Args:
         day_id: 要删除的日程天ID
         db: Supabase数据库客户端实例（依赖注入）
         user_id: 用户ID（必需，依赖注入）
     """
     try:
-        # 验证用户是否有编辑权限（需要先查询day所属的行程）
-        day_res = db.table("itinerary_days").select("trip_id").eq("id", str(day_id)).single().execute()
-        if not day_res.data:
-            raise HTTPException(status_code=404, detail="Itinerary day not found.")
-        
-        trip_id = day_res.data['trip_id']
-        _verify_user_has_access_to_trip(db, user_id, trip_id, "editor")
+        # 验证用户是否有编辑权限（一次查询同时解析day所属的行程和权限）
+        trip_id = await _resolve_day_access(db, user_id, str(day_id), "editor")
         
         # 删除日程天
-        response = db.table("itinerary_days").delete().eq("id", str(day_id)).execute()
+        response = await db.table("itinerary_days").delete().eq("id", str(day_id)).execute()
+        await trip_document_cache.invalidate(str(trip_id))
         
         # 检查是否成功删除日程天
         if not response.data:
             raise HTTPException(status_code=404, detail="Itinerary day not found.")
+        _publish_trip_event(trip_id, "day.deleted", {"id": str(day_id)})
     except HTTPException:
         raise
     except Exception as e:
@@ -694,7 +1154,7 @@ async def delete_itinerary_day(day_id: uuid.UUID, db: Client = Depends(get_supab
 # --- 日程项目管理接口 ---
 
 @router.get("/days/{day_id}/items", response_model=List[ItineraryItem])
-async def get_itinerary_items(day_id: uuid.UUID, db: Client = Depends(get_supabase_client), user_id: str = Depends(require_user)):
+async def get_itinerary_items(day_id: uuid.UUID, db: AsyncClient = Depends(get_async_supabase_client), user_id: str = Depends(require_user)):
     """获取日程天的所有项目
     
     Args:
@@ -706,69 +1166,53 @@ async def get_itinerary_items(day_id: uuid.UUID, db: Client = Depends(get_supaba
         List[ItineraryItem]: 日程项目列表
     """
     try:
-        # 验证用户是否有访问权限（需要先查询day所属的行程）
-        day_res = db.table("itinerary_days").select("trip_id").eq("id", str(day_id)).single().execute()
-        if not day_res.data:
-            raise HTTPException(status_code=404, detail="Itinerary day not found.")
-        
-        trip_id = day_res.data['trip_id']
-        _verify_user_has_access_to_trip(db, user_id, trip_id)
+        # 验证用户是否有访问权限（一次查询同时解析day所属的行程和权限）
+        await _resolve_day_access(db, user_id, str(day_id))
         
         # 查询日程项目信息
-        response = db.table("itinerary_items").select("*").eq("day_id", str(day_id)).order("sort_order").execute()
+        response = await db.table("itinerary_items").select("*").eq("day_id", str(day_id)).order("rank").order("id").execute()
         
         # 处理日程项目信息
-        items = []
-        for item in response.data:
-            items.append(ItineraryItem(
-                id=item['id'],
-                time=item.get('time'),
-                type=item.get('type', 'custom'),
-                name=item['name'],
-                notes=item.get('notes')
-            ))
-        
-        return items
+        return json_response(List[ItineraryItem], [_item_document(item) for item in response.data])
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/days/{day_id}/items", response_model=ItineraryItem, status_code=status.HTTP_201_CREATED)
-async def add_itinerary_item(day_id: uuid.UUID, name: str, time: Optional[str] = None, type: str = "custom", notes: Optional[str] = None, sort_order: int = 0, db: Client = Depends(get_supabase_client), user_id: str = Depends(require_user)):
+async def add_itinerary_item(day_id: uuid.UUID, name: str, background_tasks: BackgroundTasks, time: Optional[str] = None, type: str = "custom", notes: Optional[str] = None, sort_order: Optional[int] = None, db: AsyncClient = Depends(get_async_supabase_client), user_id: str = Depends(require_user)):
     """添加新的日程项目
     
     Args:
         day_id: 日程天ID
         name: 项目名称
+        background_tasks: 后台任务（rank 过长时重新分布）
         time: 时间（可选）
         type: 类型（可选，默认为custom）
         notes: 备注（可选）
-        sort_order: 排序顺序（可选，默认为0）
+        sort_order: 已废弃，传入时返回 400（显示顺序由 rank 决定，新项目追加到当天末尾，用 POST /items/{item_id}/move 调整位置）
         db: Supabase数据库客户端实例（依赖注入）
         user_id: 用户ID（必需，依赖注入）
         
     Returns:
         ItineraryItem: 添加的日程项目信息
     """
+    if sort_order is not None:
+        raise HTTPException(status_code=400, detail="sort_order is no longer supported, use POST /trips/items/{item_id}/move.")
+    
     try:
-        # 验证用户是否有编辑权限（需要先查询day所属的行程）
-        day_res = db.table("itinerary_days").select("trip_id").eq("id", str(day_id)).single().execute()
-        if not day_res.data:
-            raise HTTPException(status_code=404, detail="Itinerary day not found.")
-        
-        trip_id = day_res.data['trip_id']
-        _verify_user_has_access_to_trip(db, user_id, trip_id, "editor")
+        # 验证用户是否有编辑权限（一次查询同时解析day所属的行程和权限）
+        trip_id = await _resolve_day_access(db, user_id, str(day_id), "editor")
         
         # 添加日程项目
-        response = db.table("itinerary_items").insert({
+        response = await db.table("itinerary_items").insert({
             "day_id": str(day_id),
             "name": name,
             "time": time,
             "type": type,
             "notes": notes,
-            "sort_order": sort_order
         }).execute()
+        await trip_document_cache.invalidate(str(trip_id))
         
         # 检查是否成功添加日程项目
         if not response.data:
@@ -776,22 +1220,17 @@ async def add_itinerary_item(day_id: uuid.UUID, name: str, time: Optional[str] =
         
         # 构建响应对象
         item = response.data[0]
-        item_response = ItineraryItem(
-            id=item['id'],
-            time=item.get('time'),
-            type=item.get('type', 'custom'),
-            name=item['name'],
-            notes=item.get('notes')
-        )
-        
-        return item_response
+        _publish_trip_event(trip_id, "item.created", _event_data(item, ITEM_EVENT_FIELDS))
+        if needs_rebalance(item.get('rank')):
+            background_tasks.add_task(_rebalance_day_ranks, db, user_id, trip_id, str(day_id))
+        return json_response(ItineraryItem, _item_document(item), status_code=status.HTTP_201_CREATED)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.patch("/items/{item_id}", response_model=ItineraryItem)
-async def update_itinerary_item(item_id: uuid.UUID, name: Optional[str] = None, time: Optional[str] = None, type: Optional[str] = None, notes: Optional[str] = None, sort_order: Optional[int] = None, db: Client = Depends(get_supabase_client), user_id: str = Depends(require_user)):
+async def update_itinerary_item(item_id: uuid.UUID, name: Optional[str] = None, time: Optional[str] = None, type: Optional[str] = None, notes: Optional[str] = None, sort_order: Optional[int] = None, db: AsyncClient = Depends(get_async_supabase_client), user_id: str = Depends(require_user)):
     """更新日程项目
     
     Args:
@@ -800,21 +1239,19 @@ async def update_itinerary_item(item_id: uuid.UUID, name: Optional[str] = None,
         time: 时间（可选）
         type: 类型（可选）
         notes: 备注（可选）
-        sort_order: 排序顺序（可选）
+        sort_order: 已废弃，传入时返回 400（用 POST /items/{item_id}/move 调整位置）
         db: Supabase数据库客户端实例（依赖注入）
         user_id: 用户ID（必需，依赖注入）
         
     Returns:
         ItineraryItem: 更新后的日程项目信息
     """
+    if sort_order is not None:
+        raise HTTPException(status_code=400, detail="sort_order is no longer supported, use POST /trips/items/{item_id}/move.")
+    
     try:
-        # 验证用户是否有编辑权限（需要先查询item所属的行程）
-        item_res = db.table("itinerary_items").select("itinerary_days(trip_id)").eq("id", str(item_id)).single().execute()
-        if not item_res.data or not item_res.data.get('itinerary_days'):
-            raise HTTPException(status_code=404, detail="Itinerary item not found.")
-        
-        trip_id = item_res.data['itinerary_days']['trip_id']
-        _verify_user_has_access_to_trip(db, user_id, trip_id, "editor")
+        # 验证用户是否有编辑权限（一次查询同时解析item所属的行程和权限）
+        trip_id = await _resolve_item_access(db, user_id, str(item_id), "editor")
         
         # 获取请求中非空的更新数据
         update_data = {}
@@ -826,15 +1263,14 @@ async def update_itinerary_item(item_id: uuid.UUID, name: Optional[str] = None,
             update_data["type"] = type
         if notes is not None:
             update_data["notes"] = notes
-        if sort_order is not None:
-            update_data["sort_order"] = sort_order
         
         # 检查是否有更新数据
         if not update_data:
             raise HTTPException(status_code=400, detail="No update data provided.")
         
         # 更新日程项目
-        response = db.table("itinerary_items").update(update_data).eq("id", str(item_id)).execute()
+        response = await db.table("itinerary_items").update(update_data).eq("id", str(item_id)).execute()
+        await trip_document_cache.invalidate(str(trip_id))
         
         # 检查是否成功更新日程项目
         if not response.data:
@@ -842,22 +1278,15 @@ async def update_itinerary_item(item_id: uuid.UUID, name: Optional[str] = None,
         
         # 构建响应对象
         item = response.data[0]
-        item_response = ItineraryItem(
-            id=item['id'],
-            time=item.get('time'),
-            type=item.get('type', 'custom'),
-            name=item['name'],
-            notes=item.get('notes')
-        )
-        
-        return item_response
+        _publish_trip_event(trip_id, "item.updated", _event_data(item, ITEM_EVENT_FIELDS))
+        return json_response(ItineraryItem, _item_document(item))
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/items/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_itinerary_item(item_id: uuid.UUID, db: Client = Depends(get_supabase_client), user_id: str = Depends(require_user)):
+async def delete_itinerary_item(item_id: uuid.UUID, db: AsyncClient = Depends(get_async_supabase_client), user_id: str = Depends(require_user)):
     """删除日程项目
     
     Args:
@@ -866,21 +1295,212 @@ async def delete_itinerary_item(item_id: uuid.UUID, db: Client = Depends(get_sup
         user_id: 用户ID（必需，依赖注入）
     """
     try:
-        # 验证用户是否有编辑权限（需要先查询item所属的行程）
-        item_res = db.table("itinerary_items").select("itinerary_days(trip_id)").eq("id", str(item_id)).single().execute()
-        if not item_res.data or not item_res.data.get('itinerary_days'):
-            raise HTTPException(status_code=404, detail="Itinerary item not found.")
-        
-        trip_id = item_res.data['itinerary_days']['trip_id']
-        _verify_user_has_access_to_trip(db, user_id, trip_id, "editor")
+        # 验证用户是否有编辑权限（一次查询同时解析item所属的行程和权限）
+        trip_id = await _resolve_item_access(db, user_id, str(item_id), "editor")
         
         # 删除日程项目
-        response = db.table("itinerary_items").delete().eq("id", str(item_id)).execute()
+        response = await db.table("itinerary_items").delete().eq("id", str(item_id)).execute()
+        await trip_document_cache.invalidate(str(trip_id))
         
         # 检查是否成功删除日程项目
         if not response.data:
             raise HTTPException(status_code=404, detail="Itinerary item not found.")
+        _publish_trip_event(trip_id, "item.deleted", _event_data(response.data[0], ["id", "day_id"]))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/items/{item_id}/move", response_model=ItineraryItem)
+async def move_itinerary_item(item_id: uuid.UUID, move: ItineraryItemMove, background_tasks: BackgroundTasks, db: AsyncClient = Depends(get_async_supabase_client), user_id: str = Depends(require_user)):
+    """把日程项目移动到两个相邻项目之间（可跨天）
+    
+    根据相邻项目的 rank 计算一个介于两者之间的新 rank，只写被移动的这一行。
+    
+    Args:
+        item_id: 要移动的日程项目ID
+        move: 目标位置（目标天、前后相邻项目）
+        background_tasks: 后台任务（rank 过长时重新分布）
+        db: Supabase数据库客户端实例（依赖注入）
+        user_id: 用户ID（必需，依赖注入）
+        
+    Returns:
+        ItineraryItem: 移动后的日程项目信息
+    """
+    # 三者都不传时没有目标位置（rank_between(None, None) 会把项目放到当天的任意位置）
+    if not (move.day_id or move.prev_id or move.next_id):
+        raise HTTPException(status_code=400, detail="Move requires day_id, prev_id or next_id.")
+    
+    try:
+        # 验证用户是否有编辑权限（一次查询同时解析item所属的行程和权限）
+        trip_id = await _resolve_item_access(db, user_id, str(item_id), "editor")
+        
+        neighbour_ids = [str(neighbour_id) for neighbour_id in (move.prev_id, move.next_id) if neighbour_id]
+        if str(item_id) in neighbour_ids:
+            raise HTTPException(status_code=400, detail="An item cannot be moved next to itself.")
+        
+        target_day_id = str(move.day_id) if move.day_id else None
+        neighbours = {}
+        if neighbour_ids:
+            # 一次查询取回两侧相邻项目的 rank 及其所属的天和行程
+            res = await db.table("itinerary_items").select("id, day_id, rank, itinerary_days(trip_id)").in_("id", neighbour_ids).execute()
+            neighbours = {row['id']: row for row in res.data}
+            if len(neighbours) != len(neighbour_ids):
+                raise HTTPException(status_code=404, detail="Neighbour item not found.")
+            day_ids = {row['day_id'] for row in neighbours.values()}
+            if len(day_ids) != 1 or any((row.get('itinerary_days') or {}).get('trip_id') != trip_id for row in neighbours.values()):
+                raise HTTPException(status_code=400, detail="Neighbour items must be in the same day of this trip.")
+            if target_day_id and target_day_id not in day_ids:
+                raise HTTPException(status_code=400, detail="Neighbour items are not in the target day.")
+            target_day_id = day_ids.pop()
+        elif target_day_id:
+            # 移到一个空的天：确认目标天属于同一个行程
+            if await _resolve_day_access(db, user_id, target_day_id, "editor") != trip_id:
+                raise HTTPException(status_code=400, detail="Target day belongs to another trip.")
+        
+        prev_rank = neighbours[str(move.prev_id)]['rank'] if move.prev_id else None
+        next_rank = neighbours[str(move.next_id)]['rank'] if move.next_id else None
+        try:
+            rank = rank_between(prev_rank, next_rank)
+        except ValueError:
+            if prev_rank is None or prev_rank != next_rank:
+                # 相邻关系已被其他人修改（或客户端传反了），让客户端刷新后重试
+                raise HTTPException(status_code=409, detail="Item order has changed, please reload.")
+            # 两个相邻项目的 rank 相同（并发追加时 set_itinerary_item_rank 触发器可能生成相同的键），
+            # 重试永远不会成功：先重新分布这一天（按 rank, id 排序，与读取时的顺序一致），再按新的 rank 计算
+            await _rebalance_day_ranks(db, user_id, trip_id, target_day_id)
+            res = await db.table("itinerary_items").select("id, rank").in_("id", neighbour_ids).execute()
+            ranks = {row['id']: row['rank'] for row in res.data}
+            if len(ranks) != len(neighbour_ids):
+                raise HTTPException(status_code=409, detail="Item order has changed, please reload.")
+            try:
+                rank = rank_between(ranks[str(move.prev_id)], ranks[str(move.next_id)])
+            except ValueError:
+                raise HTTPException(status_code=409, detail="Item order has changed, please reload.")
+        
+        # 只更新被移动的这一行
+        update_data = {"rank": rank}
+        if target_day_id:
+            update_data["day_id"] = target_day_id
+        response = await db.table("itinerary_items").update(update_data).eq("id", str(item_id)).execute()
+        await trip_document_cache.invalidate(str(trip_id))
+        
+        # 检查是否成功更新日程项目
+        if not response.data:
+            raise HTTPException(status_code=404, detail="Itinerary item not found.")
+        
+        item = response.data[0]
+        _publish_trip_event(trip_id, "item.updated", _event_data(item, ITEM_EVENT_FIELDS))
+        if needs_rebalance(rank):
+            background_tasks.add_task(_rebalance_day_ranks, db, user_id, trip_id, item['day_id'])
+        
+        return json_response(ItineraryItem, _item_document(item))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/{trip_id}/itinerary:batch", response_model=ItineraryBatchResponse)
+async def batch_update_itinerary(trip_id: uuid.UUID, batch: ItineraryBatchRequest, db: AsyncClient = Depends(get_async_supabase_client), user_id: str = Depends(require_user)):
+    """批量执行日程项目的 create/update/move/delete 操作
+    
+    所有操作由 apply_itinerary_batch RPC 在同一个事务中执行：权限只校验一次，
+    任一操作失败则全部回滚。一次拖拽排序会话只需要一次请求、一次数据库往返。
+    
+    Args:
+        trip_id: 行程ID
+        batch: 批量操作请求对象
+        db: Supabase数据库客户端实例（依赖注入）
+        user_id: 用户ID（必需，依赖注入）
+        
+    Returns:
+        ItineraryBatchResponse: 每个操作的结果（新建项目的ID等）
+    """
+    # sort_order 不再影响显示顺序，静默接受会让客户端以为排序成功
+    for index, operation in enumerate(batch.operations):
+        if operation.sort_order is not None:
+            raise HTTPException(status_code=400, detail=f"Operation {index}: sort_order is no longer supported, use rank.")
+    
+    operations = [operation.model_dump(mode="json", exclude_none=True) for operation in batch.operations]
+    try:
+        response = await db.rpc("apply_itinerary_batch", {
+            "p_trip_id": str(trip_id),
+            "p_user_id": user_id,
+            "p_operations": operations,
+        }).execute()
+    except APIError as e:
+        raise_for_rpc_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await trip_document_cache.invalidate(str(trip_id))
+    
+    # 批量操作只发布一条汇总事件，客户端按结果中的ID重新拉取
+    _publish_trip_event(trip_id, "itinerary.changed", {"results": response.data})
+    return ItineraryBatchResponse(results=response.data)
+
+# --- 变更事件接口 ---
+
+async def _trip_event_stream(request: Request, trip_id: str) -> AsyncIterator[bytes]:
+    """把行程变更事件编码为 SSE 消息流
+    
+    空闲时定期发送注释行作为心跳（同时检测客户端是否已断开）；
+    连接到达 TRIP_EVENTS_MAX_STREAM_SECONDS 后结束，EventSource 会自动重连并重新校验访问权限。
+    
+    Args:
+        request: 当前请求，用于检测客户端断开
+        trip_id: 行程ID
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.TRIP_EVENTS_MAX_STREAM_SECONDS
+    queue = trip_events.subscribe(trip_id)
+    try:
+        yield b"retry: 3000\n\n"
+        while loop.time() < deadline:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=settings.TRIP_EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield b": ping\n\n"
+                continue
+            yield sse_message(event)
+            if event['type'] == "trip.deleted":
+                return
+    finally:
+        trip_events.unsubscribe(trip_id, queue)
+
+@router.get("/{trip_id}/events", response_class=StreamingResponse)
+async def stream_trip_events(trip_id: uuid.UUID, request: Request, db: AsyncClient = Depends(get_async_supabase_client), user_id: str = Depends(require_user)):
+    """以 Server-Sent Events 推送行程的增量变更
+    
+    每条消息的 event 为变更类型，data 为变化的这一行（JSON）：
+        trip.updated / trip.deleted
+        day.created / day.updated / day.deleted       {id, day_number, date, title}
+        item.created / item.updated / item.deleted    {id, day_id, time, type, name, notes, rank}
+        itinerary.changed  批量操作或 rank 重新分布，data 为各操作的结果
+        resync             客户端积压过多或通知连接中断，应重新拉取整个行程（带 If-None-Match）
+    
+    Args:
+        trip_id: 行程ID
+        request: 当前请求
+        db: Supabase数据库客户端实例（依赖注入）
+        user_id: 用户ID（必需，依赖注入）
+        
+    Returns:
+        StreamingResponse: text/event-stream
+    """
+    try:
+        # 验证用户是否有访问权限
+        await _verify_user_has_access_to_trip(db, user_id, str(trip_id))
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return StreamingResponse(
+        _trip_event_stream(request, str(trip_id)),
+        media_type="text/event-stream",
+        # 禁止代理缓冲，事件才能即时送达
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
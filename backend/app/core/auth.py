@@ -5,9 +5,12 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt, JWTError
 from pydantic import BaseModel
 from typing import Optional
+import hashlib
 
 from app.core.config import settings
+from app.utils.cache import LRUCache
 from app.utils.logger import setup_logger
+from app.utils.metrics import register_cache
 
 # 初始化 logger
 logger = setup_logger(__name__)
@@ -20,18 +23,33 @@ DEV_USER_ID = "dev-user-id"
 class TokenPayload(BaseModel):
     sub: str  # Subject (the user ID)
     aud: str  # Audience
-    # 可以根据需要添加其他声明，例如 exp (expiration time)
+    exp: Optional[int] = None  # Expiration time (unix timestamp)
 
 # --- Security Schemes ---
 # 用 HTTPBearer 替代 OAuth2PasswordBearer
 # auto_error=False 允许我们自定义未提供 Token 时的行为
 bearer_scheme = HTTPBearer(auto_error=False)
 
+# --- Token Cache ---
+# 已验证的 token -> user_id。键为 token 的 SHA-256 摘要（不在内存中保存原始 token），
+# 条目在 token 的 exp 时刻过期，同一会话的重复请求可以跳过签名校验。
+token_cache = LRUCache(maxsize=settings.JWT_CACHE_SIZE)
+register_cache("jwt", token_cache)
+
+def _token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
 # --- Core Logic ---
 def get_user_id_from_token(token: str) -> str:
     """
     核心的 Token 验证逻辑，验证一个 JWT 并返回 user_id。
+    验证通过的 token 会被缓存到其 exp 过期为止。
     """
+    digest = _token_digest(token)
+    user_id = token_cache.get(digest)
+    if user_id is not None:
+        return user_id
+
     try:
         payload_dict = jwt.decode(
             token,
@@ -40,7 +58,10 @@ def get_user_id_from_token(token: str) -> str:
             audience="authenticated"
         )
         payload = TokenPayload(**payload_dict)
-        logger.info("成功解析 Token, 用户 ID: %s", payload.sub)
+        logger.debug("成功解析 Token, 用户 ID: %s", payload.sub)
+        # 没有 exp 的 token 不缓存，保证每次都重新校验
+        if payload.exp is not None:
+            token_cache.set(digest, payload.sub, expires_at=payload.exp)
         return payload.sub
     except JWTError as e:
         logger.error("Token 解码失败或无效: %s", str(e), exc_info=True)
@@ -49,6 +70,39 @@ def get_user_id_from_token(token: str) -> str:
         logger.error("解析 Token Payload 失败: %s", str(e), exc_info=True)
         raise HTTPException(status_code=401, detail="Token 格式不正确")
 
+# --- Request-scoped Auth Context ---
+class AuthContext:
+    """
+    单个请求的认证上下文。
+    token 在 get_auth_context 中只解析、校验一次，require_user / optional_user
+    和 get_supabase_client 等依赖都共享同一个实例（FastAPI 会在请求内缓存依赖结果）。
+    """
+    def __init__(self, token: Optional[str] = None, user_id: Optional[str] = None, error: Optional[HTTPException] = None):
+        self.token = token
+        self.user_id = user_id
+        self.error = error  # token 校验失败时的异常，由需要认证的依赖决定是否抛出
+
+    @property
+    def db_token(self) -> Optional[str]:
+        """数据库请求应携带的 token；无效 token 按匿名处理，使用 anon key"""
+        return self.token if self.user_id else None
+
+def get_auth_context(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)) -> AuthContext:
+    """解析并校验当前请求的 Bearer Token，失败时不抛异常，只记录在上下文中"""
+    token = credentials.credentials if credentials else None
+
+    if settings.AUTH_DISABLED:
+        logger.warning("认证已禁用! 返回虚拟用户ID: %s", DEV_USER_ID)
+        return AuthContext(token=token, user_id=DEV_USER_ID)
+
+    if token is None:
+        return AuthContext()
+
+    try:
+        return AuthContext(token=token, user_id=get_user_id_from_token(token))
+    except HTTPException as e:
+        return AuthContext(token=token, error=e)
+
 # --- FastAPI Dependency Class ---
 class UserAuthenticator:
     """
@@ -58,12 +112,11 @@ class UserAuthenticator:
     def __init__(self, required: bool = True):
         self.required = required
 
-    def __call__(self, credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)) -> Optional[str]:
-        if settings.AUTH_DISABLED:
-            logger.warning("认证已禁用! 返回虚拟用户ID: %s", DEV_USER_ID)
-            return DEV_USER_ID
+    def __call__(self, auth: AuthContext = Depends(get_auth_context)) -> Optional[str]:
+        if auth.user_id:
+            return auth.user_id
 
-        if credentials is None:
+        if auth.error is None:
             if self.required:
                 logger.warning("请求需要认证，但未提供 Token")
                 raise HTTPException(
@@ -75,15 +128,11 @@ class UserAuthenticator:
                 logger.info("请求未提供 Token，视为匿名用户访问")
                 return None
 
-        token = credentials.credentials  # 提取 Bearer Token
-        try:
-            return get_user_id_from_token(token)
-        except HTTPException as e:
-            if self.required:
-                raise e
-            else:
-                logger.warning("提供了无效 Token，视为匿名用户访问")
-                return None
+        if self.required:
+            raise auth.error
+        else:
+            logger.warning("提供了无效 Token，视为匿名用户访问")
+            return None
 
 # --- Dependency Instances ---
 require_user = UserAuthenticator(required=True)
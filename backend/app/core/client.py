@@ -1,91 +1,273 @@
 # client.py
 # python -m app.core.client
-from supabase import create_client, Client
 from app.core.config import settings
 from app.utils.logger import setup_logger
-from typing import Optional
-from fastapi import Depends, Request
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from typing import Any, Dict, Optional
+from fastapi import Depends
+import httpx
+from httpx import Headers, QueryParams
+from postgrest import (
+    AsyncRequestBuilder,
+    AsyncRPCFilterRequestBuilder,
+    SyncRequestBuilder,
+    SyncRPCFilterRequestBuilder,
+)
+from postgrest.types import CountMethod
+import threading
 import time
-import asyncio
-from app.utils.timing import record_db_time
-from starlette.requests import Request as StarletteRequest
-from starlette.datastructures import Headers, URL
-from starlette.types import Scope
+from app.core.auth import AuthContext, get_auth_context
+from app.utils.timing import record_db_span
 
 logger = setup_logger(__name__)
 
-# 使用 HTTPBearer 解析请求头里的 token
-bearer_scheme = HTTPBearer(auto_error=False)
-
-
-class TimedSupabaseClient:
-    """包装 Supabase 客户端以记录数据库操作耗时"""
-
-    def __init__(self, client: Client, request: Request):
-        self.client = client
-        self.request = request
-
-    def __getattr__(self, name):
-        """代理所有属性访问到原始客户端"""
-        attr = getattr(self.client, name)
-        if callable(attr):
-            # 检查是否为异步方法
-            if asyncio.iscoroutinefunction(attr):
-                return self._wrap_async_method(attr)
-            else:
-                return self._wrap_method(attr)
-        return attr
-
-    def _wrap_method(self, method):
-        """包装同步方法以记录耗时"""
-        def wrapper(*args, **kwargs):
-            start_time = time.time()
-            try:
-                return method(*args, **kwargs)
-            finally:
-                duration = time.time() - start_time
-                record_db_time(self.request, duration)
-        return wrapper
-
-    def _wrap_async_method(self, method):
-        """包装异步方法以记录耗时"""
-        async def wrapper(*args, **kwargs):
-            start_time = time.time()
-            try:
-                return await method(*args, **kwargs)
-            finally:
-                duration = time.time() - start_time
-                record_db_time(self.request, duration)
-        return wrapper
 
+# -----------------------
+# 进程级共享连接池
+# -----------------------
+_http_pool: Optional[httpx.Client] = None
+_async_http_pool: Optional[httpx.AsyncClient] = None
+_http_pool_lock = threading.Lock()
 
-def get_supabase_client(
-    request: Request,
-    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
-) -> TimedSupabaseClient:
+
+def _rest_url() -> str:
+    return f"{settings.SUPABASE_URL.rstrip('/')}/rest/v1"
+
+
+def _pool_options() -> Dict[str, Any]:
+    """同步/异步连接池共用的 httpx 参数（keep-alive + HTTP/2）。
+
+    池上只放与用户无关的公共请求头（apikey、schema 等），
+    用户的 Authorization 由 ScopedSession 按请求附加，避免会话状态在请求间泄漏。
     """
-    Creates and returns a Supabase client instance that is authenticated for the current request.
-    A new client is created for each request to ensure thread safety and proper RLS enforcement.
+    return dict(
+        base_url=_rest_url(),
+        headers={
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            "Accept-Profile": "public",
+            "Content-Profile": "public",
+            "apikey": settings.SUPABASE_KEY,
+        },
+        limits=httpx.Limits(
+            max_connections=settings.SUPABASE_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.SUPABASE_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=settings.SUPABASE_POOL_KEEPALIVE_EXPIRY,
+        ),
+        timeout=settings.SUPABASE_TIMEOUT,
+        http2=settings.SUPABASE_HTTP2,
+        follow_redirects=True,
+    )
+
+
+def get_http_pool() -> httpx.Client:
+    """返回进程级共享的同步 httpx 连接池，首次调用时惰性创建。"""
+    global _http_pool
+    if _http_pool is None:
+        with _http_pool_lock:
+            if _http_pool is None:
+                _http_pool = httpx.Client(**_pool_options())
+                logger.info(
+                    "PostgREST 连接池已创建: http2=%s, max_connections=%s, max_keepalive=%s",
+                    settings.SUPABASE_HTTP2,
+                    settings.SUPABASE_POOL_MAX_CONNECTIONS,
+                    settings.SUPABASE_POOL_MAX_KEEPALIVE,
+                )
+    return _http_pool
+
+
+def get_async_http_pool() -> httpx.AsyncClient:
+    """返回进程级共享的异步 httpx 连接池，供 async 路由使用。"""
+    global _async_http_pool
+    if _async_http_pool is None:
+        with _http_pool_lock:
+            if _async_http_pool is None:
+                _async_http_pool = httpx.AsyncClient(**_pool_options())
+                logger.info("PostgREST 异步连接池已创建: http2=%s", settings.SUPABASE_HTTP2)
+    return _async_http_pool
+
+
+def close_http_pool():
+    """关闭同步共享连接池（应用关闭时调用）。"""
+    global _http_pool
+    with _http_pool_lock:
+        if _http_pool is not None:
+            _http_pool.close()
+            _http_pool = None
+
+
+async def close_async_http_pool():
+    """关闭异步共享连接池（应用关闭时调用）。"""
+    global _async_http_pool
+    pool, _async_http_pool = _async_http_pool, None
+    if pool is not None:
+        await pool.aclose()
+
+
+class ScopedSession:
+    """共享连接池之上的轻量会话，只负责为每次请求附加调用者的 token。
+
+    postgrest 的请求构造器只会调用 ``session.request(...)``，
+    因此这里按鸭子类型实现该方法即可复用其全部查询构造能力。
     """
-    url = settings.SUPABASE_URL
-    key = settings.SUPABASE_KEY  # 这里还是用 ANON key
-    logger.info(f"Creating Supabase client for URL: {url}")
 
-    client = create_client(supabase_url=url, supabase_key=key)
+    def __init__(self, pool: httpx.Client, token: Optional[str] = None):
+        self.pool = pool
+        self.headers = Headers({"Authorization": f"Bearer {token or settings.SUPABASE_KEY}"})
+
+    def _merge_headers(self, headers: Optional[Headers]) -> Headers:
+        merged = Headers(self.headers)
+        if headers:
+            merged.update(headers)
+        return merged
+
+    def request(self, method: str, url: str, *, headers: Optional[Headers] = None, **kwargs) -> httpx.Response:
+        headers = self._merge_headers(headers)
+        start_time = time.perf_counter()
+        response = None
+        try:
+            response = self.pool.request(method, url, headers=headers, **kwargs)
+            return response
+        finally:
+            _record_query(method, url, headers, kwargs.get("params"), response, time.perf_counter() - start_time)
+
+
+class AsyncScopedSession(ScopedSession):
+    """ScopedSession 的异步版本，底层为共享的 httpx.AsyncClient"""
+
+    async def request(self, method: str, url: str, *, headers: Optional[Headers] = None, **kwargs) -> httpx.Response:
+        headers = self._merge_headers(headers)
+        start_time = time.perf_counter()
+        response = None
+        try:
+            response = await self.pool.request(method, url, headers=headers, **kwargs)
+            return response
+        finally:
+            _record_query(method, url, headers, kwargs.get("params"), response, time.perf_counter() - start_time)
+
+
+# -----------------------
+# 查询级耗时记录
+# -----------------------
+# 不参与过滤的 PostgREST 查询参数
+_NON_FILTER_PARAMS = {"select", "columns", "on_conflict"}
+
+
+def _query_operation(method: str, path: str, headers: Headers) -> str:
+    """根据 HTTP 方法和请求头推断 PostgREST 操作类型"""
+    if path.startswith("/rpc/"):
+        return "rpc"
+    if method == "POST":
+        return "upsert" if "resolution=" in headers.get("Prefer", "") else "insert"
+    return {"GET": "select", "HEAD": "count", "PATCH": "update", "DELETE": "delete"}.get(method, method.lower())
+
+
+def _response_rows(response: Optional[httpx.Response]) -> Optional[int]:
+    """从 Content-Range 头 (例如 0-24/*) 解析返回行数，无法判断时返回 None
 
-    # 如果请求里带了 Bearer Token，就让 client 使用这个 token
-    if credentials:
-        token = credentials.credentials
+    POST/PATCH 带 return=representation 时 PostgREST 返回 */*，不含行数，此时按 JSON 数组的长度计算。
+    """
+    if response is None:
+        return None
+    if "vnd.pgrst.object" in response.headers.get("Content-Type", ""):
+        return 1 if response.is_success else 0
+    content_range = response.headers.get("Content-Range", "")
+    row_range = content_range.split("/", 1)[0]
+    if "-" in row_range:
+        first, last = row_range.split("-", 1)
         try:
-            # 正确的 token 绑定方式（兼容新版 supabase-py）
-            client.auth.set_session(access_token=token, refresh_token=None)
-            logger.info("Supabase client 已绑定用户 token")
-        except Exception as e:
-            logger.error(f"Failed to authenticate Supabase client with token: {e}")
+            return int(last) - int(first) + 1
+        except ValueError:
+            return None
+    if not response.is_success or not response.content:
+        return 0 if row_range == "*" else None
+    try:
+        body = response.json()
+    except ValueError:
+        return None
+    return len(body) if isinstance(body, list) else None
+
+
+def _record_query(method: str, path: str, headers: Headers, params: Optional[QueryParams], response: Optional[httpx.Response], duration: float):
+    """记录一次 PostgREST 往返：表、操作、过滤条件、响应大小和耗时"""
+    table = path.strip("/").split("/")[-1]
+    operation = _query_operation(method, path, headers)
+    filters = "&".join(f"{k}={v}" for k, v in (params or QueryParams()).multi_items() if k not in _NON_FILTER_PARAMS)
+    rows = _response_rows(response)
+    size = len(response.content) if response is not None else 0
+    status = response.status_code if response is not None else "error"
+
+    record_db_span(table, operation, duration, rows, filters, size)
+    logger.debug(
+        "DB %s %s [%s] -> %s, rows=%s, %d bytes, %.2fms",
+        operation, table, filters, status, rows, size, duration * 1000,
+    )
+
+
+def _rpc_args(func: str, params: Dict[str, Any], count: Optional[CountMethod], get: bool):
+    """与 postgrest 客户端 rpc() 相同的参数组装逻辑"""
+    headers = Headers({"Prefer": f"count={count}"}) if count else Headers()
+    if get:
+        return f"/rpc/{func}", "GET", headers, QueryParams(params), {}
+    return f"/rpc/{func}", "POST", headers, QueryParams(), params
+
+
+class PooledSupabaseClient:
+    """基于共享连接池的 PostgREST 客户端，只提供 API 层实际使用的 table/from_/rpc。
+
+    每个请求创建一个实例的成本仅为一个 Headers 对象，不再重建 httpx/auth/storage/realtime 子客户端。
+    """
+
+    def __init__(self, token: Optional[str] = None, pool: Optional[httpx.Client] = None):
+        self.session = ScopedSession(pool or get_http_pool(), token)
+
+    def from_(self, table: str) -> SyncRequestBuilder:
+        return SyncRequestBuilder(self.session, f"/{table}")
+
+    def table(self, table: str) -> SyncRequestBuilder:
+        return self.from_(table)
+
+    def rpc(self, func: str, params: Dict[str, Any], count: Optional[CountMethod] = None, get: bool = False) -> SyncRPCFilterRequestBuilder:
+        path, method, headers, query, json = _rpc_args(func, params, count, get)
+        return SyncRPCFilterRequestBuilder(self.session, path, method, headers, query, json=json)
+
+
+class AsyncPooledSupabaseClient:
+    """PooledSupabaseClient 的异步版本：构造查询的方式不变，``execute()`` 需要 await。"""
 
-    # 返回包装后的客户端，用于记录耗时
-    return TimedSupabaseClient(client, request)
+    def __init__(self, token: Optional[str] = None, pool: Optional[httpx.AsyncClient] = None):
+        self.session = AsyncScopedSession(pool or get_async_http_pool(), token)
+
+    def from_(self, table: str) -> AsyncRequestBuilder:
+        return AsyncRequestBuilder(self.session, f"/{table}")
+
+    def table(self, table: str) -> AsyncRequestBuilder:
+        return self.from_(table)
+
+    def rpc(self, func: str, params: Dict[str, Any], count: Optional[CountMethod] = None, get: bool = False) -> AsyncRPCFilterRequestBuilder:
+        path, method, headers, query, json = _rpc_args(func, params, count, get)
+        return AsyncRPCFilterRequestBuilder(self.session, path, method, headers, query, json=json)
+
+
+def get_supabase_client(
+    auth: AuthContext = Depends(get_auth_context),
+) -> PooledSupabaseClient:
+    """
+    Returns a PostgREST client for the current request backed by the process-wide connection pool.
+    The token comes from the request's shared AuthContext, so it is verified once and only attached per request:
+    RLS keeps working and no session state is shared.
+    """
+    # 每次 execute() 的往返耗时由 ScopedSession 记录到当前请求的 RequestTrace
+    return PooledSupabaseClient(auth.db_token)
+
+
+def get_async_supabase_client(
+    auth: AuthContext = Depends(get_auth_context),
+) -> AsyncPooledSupabaseClient:
+    """
+    Async counterpart of get_supabase_client for ``async def`` route handlers.
+    Queries are built the same way but ``execute()`` must be awaited, so DB I/O never blocks the event loop.
+    """
+    return AsyncPooledSupabaseClient(auth.db_token)
 
 
 def init_supabase_for_startup():
@@ -94,10 +276,9 @@ def init_supabase_for_startup():
     It does not return the client, only checks if a connection can be made.
     """
     try:
-        key = settings.SUPABASE_KEY
-        client = create_client(supabase_url=settings.SUPABASE_URL, supabase_key=key)
+        client = PooledSupabaseClient()
 
-        # ⚠️ 执行一次轻量查询来验证连接（替代仅仅创建 client）
+        # ⚠️ 执行一次轻量查询来验证连接，同时预热共享连接池
         client.table("checklists").select("id").limit(1).execute()
 
         logger.info("Supabase credentials verified successfully at startup.")
@@ -109,30 +290,6 @@ def init_supabase_for_startup():
         # raise SystemExit
 
 
-# -----------------------
-# Mock Request for testing
-# -----------------------
-class MockRequest(StarletteRequest):
-    """用于在 __main__ 测试 get_supabase_client"""
-
-    def __init__(self, headers: Optional[dict] = None):
-        scope: Scope = {
-            "type": "http",
-            "method": "GET",
-            "path": "/",
-            "headers": Headers(headers or {}).raw,
-            "query_string": b"",
-            "client": ("127.0.0.1", 5000),
-            "server": ("127.0.0.1", 8000),
-            "scheme": "http",
-            "root_path": "",
-            "app": None,
-            "http_version": "1.1",
-            "url": URL("http://testserver/"),
-        }
-        super().__init__(scope)
-
-
 if __name__ == "__main__":
     """
     Test the Supabase client functions.
@@ -144,14 +301,13 @@ if __name__ == "__main__":
         init_supabase_for_startup()
         print("   ✓ init_supabase_for_startup() completed successfully")
 
-        print("2. Testing get_supabase_client() with mock request...")
-        mock_request = MockRequest(headers={"Authorization": "Bearer test_token"})
-        client = get_supabase_client(mock_request, None)  # credentials 由 DI 注入，这里传 None
+        print("2. Testing get_supabase_client() with anonymous context...")
+        client = get_supabase_client(AuthContext())  # AuthContext 由 DI 注入，这里传匿名上下文
         print("   ✓ get_supabase_client() returned:", type(client))
 
         print("\n=== Test Summary ===")
         print("✓ init_supabase_for_startup(): SUCCESS")
-        print("✓ get_supabase_client(): SUCCESS (with MockRequest)")
+        print("✓ get_supabase_client(): SUCCESS (with anonymous AuthContext)")
         print("✅ Overall: Core functionality is working correctly")
 
     except Exception as e:
@@ -1,5 +1,6 @@
 from pydantic import AnyUrl, Field
 from pydantic_settings import BaseSettings
+from typing import Dict
 
 class Settings(BaseSettings):
     SUPABASE_URL: str = Field(..., env="SUPABASE_URL")
@@ -11,6 +12,46 @@ class Settings(BaseSettings):
     GAODE_KEY: str = Field(..., env="GAODE_KEY")
     # 用来禁用认证
     AUTH_DISABLED: bool = Field(False, env="AUTH_DISABLED")
+    # 已验证 JWT 的 LRU 缓存容量
+    JWT_CACHE_SIZE: int = Field(10000, env="JWT_CACHE_SIZE")
+    # 行程访问级别缓存：多 worker 部署时各进程独立，TTL 决定撤销权限后的最长生效延迟
+    TRIP_ACCESS_CACHE_TTL: float = Field(30.0, env="TRIP_ACCESS_CACHE_TTL")
+    TRIP_ACCESS_CACHE_SIZE: int = Field(10000, env="TRIP_ACCESS_CACHE_SIZE")
+    # 行程详情文档缓存: memory（进程内）/ redis（多 worker 共享，需要 pip install redis）/ none
+    # memory 的写入失效只作用于当前进程：以多个 worker 运行时，其他 worker 在 TTL 内仍可能返回旧文档，应使用 redis 或 none
+    DOCUMENT_CACHE_BACKEND: str = Field("memory", env="DOCUMENT_CACHE_BACKEND")
+    DOCUMENT_CACHE_URL: str = Field("", env="DOCUMENT_CACHE_URL")
+    DOCUMENT_CACHE_SIZE: int = Field(1000, env="DOCUMENT_CACHE_SIZE")
+    DOCUMENT_CACHE_TTL: float = Field(300.0, env="DOCUMENT_CACHE_TTL")
+    # 协作者资料 (users.name, avatar_url) 缓存，按 (查看者, 用户) 缓存以遵守 users 的 RLS
+    PROFILE_CACHE_SIZE: int = Field(10000, env="PROFILE_CACHE_SIZE")
+    PROFILE_CACHE_TTL: float = Field(60.0, env="PROFILE_CACHE_TTL")
+    # GET /trips/ 的默认分页大小（只传 cursor 时使用；limit 和 cursor 都不传时不分页）和允许的最大 limit
+    TRIP_LIST_PAGE_SIZE: int = Field(50, env="TRIP_LIST_PAGE_SIZE")
+    TRIP_LIST_MAX_PAGE_SIZE: int = Field(200, env="TRIP_LIST_MAX_PAGE_SIZE")
+    # GET /trips/export 每次从数据库取回的完整行程数，决定导出时的内存上限
+    TRIP_EXPORT_PAGE_SIZE: int = Field(20, env="TRIP_EXPORT_PAGE_SIZE")
+    # GET /sync 每次最多处理的变更记录数，超出时分页（has_more + 续传位置）
+    SYNC_PAGE_SIZE: int = Field(1000, env="SYNC_PAGE_SIZE")
+    # 行程变更事件 (GET /trips/{trip_id}/events): local（写接口直接发布，仅单 worker）/ postgres（LISTEN trip_events，需要 pip install asyncpg）
+    TRIP_EVENTS_BACKEND: str = Field("local", env="TRIP_EVENTS_BACKEND")
+    TRIP_EVENTS_DSN: str = Field("", env="TRIP_EVENTS_DSN")
+    TRIP_EVENTS_QUEUE_SIZE: int = Field(100, env="TRIP_EVENTS_QUEUE_SIZE")
+    # SSE 心跳间隔；连接保持的最长时间，到期后客户端自动重连并重新校验权限
+    TRIP_EVENTS_HEARTBEAT: float = Field(15.0, env="TRIP_EVENTS_HEARTBEAT")
+    TRIP_EVENTS_MAX_STREAM_SECONDS: float = Field(300.0, env="TRIP_EVENTS_MAX_STREAM_SECONDS")
+    # 每个请求的数据库往返次数预算（0 表示关闭检测），用于调试/CI 发现 N+1 查询
+    DB_ROUNDTRIP_BUDGET: int = Field(0, env="DB_ROUNDTRIP_BUDGET")
+    # 超出预算时的处理方式: warn 只记录日志, raise 返回 500 并附带调用序列
+    DB_ROUNDTRIP_BUDGET_MODE: str = Field("warn", env="DB_ROUNDTRIP_BUDGET_MODE")
+    # 按路由覆盖预算, JSON 格式, 键为 "METHOD /route/template" 或 "/route/template"
+    DB_ROUNDTRIP_BUDGET_OVERRIDES: Dict[str, int] = Field(default_factory=dict, env="DB_ROUNDTRIP_BUDGET_OVERRIDES")
+    # PostgREST 共享连接池配置
+    SUPABASE_HTTP2: bool = Field(True, env="SUPABASE_HTTP2")
+    SUPABASE_POOL_MAX_CONNECTIONS: int = Field(100, env="SUPABASE_POOL_MAX_CONNECTIONS")
+    SUPABASE_POOL_MAX_KEEPALIVE: int = Field(20, env="SUPABASE_POOL_MAX_KEEPALIVE")
+    SUPABASE_POOL_KEEPALIVE_EXPIRY: float = Field(30.0, env="SUPABASE_POOL_KEEPALIVE_EXPIRY")
+    SUPABASE_TIMEOUT: float = Field(10.0, env="SUPABASE_TIMEOUT")
     class Config:
         env_file = ".env"
         extra = "ignore"  # 忽略额外环境变量
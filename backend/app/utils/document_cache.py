@@ -0,0 +1,201 @@
+# utils/document_cache.py
+# 已序列化文档（例如行程详情 JSON）的读穿缓存，后端可插拔：
+#   memory - 进程内 LRUCache（默认；只能失效当前进程的缓存，多 worker 时其他进程在 TTL 内仍可能返回旧文档）
+#   redis  - 任意 Redis 协议服务（redis / valkey / 本地替身），多个 worker 共享同一份缓存并同步失效
+#   none   - 关闭缓存
+#
+# 读穿填充与写入失效之间的竞争：读取数据库之后、写入缓存之前，如果有写接口完成了修改并 invalidate，
+# 直接写入会把旧文档重新放回缓存，直到 TTL 过期。因此每个文档另有一个代次标记：
+# 读取数据库之前先取 generation()，invalidate 时换成新的随机标记，set 只在标记未变时写入（比较与写入是原子的）。
+import uuid
+from typing import Optional, Tuple
+
+from app.utils.cache import LRUCache
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class MemoryBackend:
+    """进程内后端，基于 LRUCache（比较与写入之间没有 await，在事件循环内是原子的）"""
+
+    def __init__(self, maxsize: int):
+        self.cache = LRUCache(maxsize=maxsize)
+        self.generations = LRUCache(maxsize=maxsize)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self.cache.get(key)
+
+    async def generation(self, gen_key: str) -> Optional[bytes]:
+        return self.generations.get(gen_key)
+
+    async def set_if_generation(self, key: str, value: bytes, ttl: float, gen_key: str, generation: Optional[bytes]):
+        if self.generations.get(gen_key) == generation:
+            self.cache.set(key, value, ttl=ttl)
+
+    async def invalidate(self, key: str, gen_key: str, generation: bytes, ttl: float):
+        self.cache.delete(key)
+        self.generations.set(gen_key, generation, ttl=ttl)
+
+    async def close(self):
+        pass
+
+
+# KEYS[1]=文档键 KEYS[2]=代次键 ARGV[1]=文档 ARGV[2]=TTL(毫秒) ARGV[3]=读取前的代次（不存在时为空串）
+_SET_IF_GENERATION_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') == ARGV[3] then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+
+class RedisBackend:
+    """Redis 协议后端（可选依赖: pip install redis）"""
+
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("DOCUMENT_CACHE_BACKEND=redis requires the 'redis' package (pip install redis)") from e
+        self.client = redis.from_url(url)
+        self.set_if_generation_script = self.client.register_script(_SET_IF_GENERATION_SCRIPT)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(key)
+
+    async def generation(self, gen_key: str) -> Optional[bytes]:
+        return await self.client.get(gen_key)
+
+    async def set_if_generation(self, key: str, value: bytes, ttl: float, gen_key: str, generation: Optional[bytes]):
+        await self.set_if_generation_script(keys=[key, gen_key], args=[value, int(ttl * 1000), generation or b""])
+
+    async def invalidate(self, key: str, gen_key: str, generation: bytes, ttl: float):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            pipe.set(gen_key, generation, px=int(ttl * 1000))
+            await pipe.execute()
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class DocumentCache:
+    """
+    按文档ID缓存序列化后的响应体及其 ETag。
+
+    后端出错时只记录日志并按未命中处理，缓存不可用不会影响接口本身。
+    hits/misses 计数供 /metrics 使用（register_cache）。
+    """
+
+    def __init__(self, namespace: str, backend=None, ttl: float = 300.0):
+        """
+        Args:
+            namespace: 键前缀，例如 trip
+            backend: MemoryBackend / RedisBackend，None 表示关闭缓存
+            ttl: 条目存活秒数
+        """
+        self.namespace = namespace
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, document_id: str) -> str:
+        return f"doc:{self.namespace}:{document_id}"
+
+    def _gen_key(self, document_id: str) -> str:
+        return f"docgen:{self.namespace}:{document_id}"
+
+    async def get(self, document_id: str) -> Optional[Tuple[str, bytes]]:
+        """
+        读取缓存的文档
+
+        Returns:
+            Optional[Tuple[str, bytes]]: (ETag, 响应体)，未命中时为 None
+        """
+        if self.backend is None:
+            return None
+        try:
+            value = await self.backend.get(self._key(document_id))
+        except Exception as e:
+            logger.warning("文档缓存读取失败 %s: %s", self._key(document_id), e)
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        etag, _, body = value.partition(b"\n")
+        return etag.decode(), body
+
+    async def generation(self, document_id: str) -> Optional[bytes]:
+        """
+        读取文档当前的代次标记，必须在读取数据库之前调用，结果原样传给 set
+
+        Returns:
+            Optional[bytes]: 代次标记，从未失效过（或已过期）时为 None
+        """
+        if self.backend is None:
+            return None
+        try:
+            return await self.backend.generation(self._gen_key(document_id))
+        except Exception as e:
+            logger.warning("文档缓存读取代次失败 %s: %s", self._gen_key(document_id), e)
+            return None
+
+    async def set(self, document_id: str, etag: str, body: bytes, generation: Optional[bytes]):
+        """写入文档（ETag 与响应体一起保存，命中时可直接处理 If-None-Match）
+
+        generation 是读取数据库之前 generation() 的结果；期间文档被 invalidate 过时放弃写入。
+        """
+        if self.backend is None:
+            return
+        try:
+            await self.backend.set_if_generation(
+                self._key(document_id), etag.encode() + b"\n" + body, self.ttl, self._gen_key(document_id), generation,
+            )
+        except Exception as e:
+            logger.warning("文档缓存写入失败 %s: %s", self._key(document_id), e)
+
+    async def invalidate(self, document_id: str):
+        """文档被修改后删除缓存，并换上新的代次标记，使修改前开始的读穿填充失效
+
+        代次标记的存活时间与文档 TTL 相同；只要一次读穿（generation() 到 set）不超过 TTL，就不会放回旧文档。
+        """
+        if self.backend is None:
+            return
+        try:
+            await self.backend.invalidate(self._key(document_id), self._gen_key(document_id), uuid.uuid4().hex.encode(), self.ttl)
+        except Exception as e:
+            logger.warning("文档缓存失效失败 %s: %s", self._key(document_id), e)
+
+    async def close(self):
+        """关闭后端连接（应用关闭时调用）"""
+        if self.backend is not None:
+            await self.backend.close()
+
+
+def create_document_cache(namespace: str, backend: str, url: str = "", maxsize: int = 1000, ttl: float = 300.0) -> DocumentCache:
+    """
+    按配置创建文档缓存
+
+    Args:
+        namespace: 键前缀
+        backend: memory / redis / none
+        url: redis 连接地址（backend=redis 时必填）
+        maxsize: memory 后端的最大条目数
+        ttl: 条目存活秒数
+
+    Returns:
+        DocumentCache: 文档缓存实例
+    """
+    if backend == "memory":
+        return DocumentCache(namespace, MemoryBackend(maxsize), ttl)
+    if backend == "redis":
+        if not url:
+            raise ValueError("DOCUMENT_CACHE_URL is required when DOCUMENT_CACHE_BACKEND=redis")
+        return DocumentCache(namespace, RedisBackend(url), ttl)
+    if backend == "none":
+        return DocumentCache(namespace, None, ttl)
+    raise ValueError(f"Unknown document cache backend: {backend}")
@@ -0,0 +1,53 @@
+# utils/etag.py
+# 基于文档版本号（trips.version / checklists.version）的 ETag 条件请求
+#
+# 版本号只保证文档语义上未变化，不保证响应字节完全相同（例如协作者的 users.name / avatar_url
+# 变化不会改变 trips.version），因此使用弱 ETag (W/"...")。
+from typing import Optional
+
+from fastapi import Response
+
+
+def make_etag(kind: str, document_id: str, version) -> str:
+    """
+    生成弱 ETag
+
+    Args:
+        kind: 文档类型，例如 trip / checklist
+        document_id: 文档ID
+        version: 文档版本号
+
+    Returns:
+        str: 弱 ETag，例如 W/"trip-<id>-v3"
+    """
+    return f'W/"{kind}-{document_id}-v{version}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    判断 If-None-Match 请求头是否命中当前 ETag（按 RFC 9110 对 If-None-Match 使用弱比较）
+
+    Args:
+        if_none_match: If-None-Match 请求头的值
+        etag: 当前 ETag
+
+    Returns:
+        bool: 命中时返回 True
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return any(candidate.removeprefix("W/") == etag.removeprefix("W/") for candidate in candidates)
+
+
+def set_etag(response: Response, etag: str):
+    """为完整响应设置 ETag；no-cache 让浏览器每次都带上 If-None-Match 重新验证"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+
+
+def not_modified(etag: str) -> Response:
+    """返回不带响应体的 304 Not Modified"""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
@@ -0,0 +1,156 @@
+# utils/events.py
+# 行程变更事件：进程内发布/订阅 + 数据库通知适配器 + SSE 消息格式
+#
+# 事件格式: {"type": "item.updated", "data": {...}}，按 topic（trip_id）分发给订阅者。
+# 事件来源（TRIP_EVENTS_BACKEND）:
+#   local    - 由本进程的写接口直接发布；只有单 worker 时所有订阅者都能收到
+#   postgres - 数据库触发器 pg_notify('trip_events', ...)，每个 worker 各自 LISTEN 后发布到本进程，
+#              其他服务或直接写库的改动也能推送（需要 pip install asyncpg）
+import asyncio
+import json
+from collections import defaultdict
+from typing import Dict, Optional, Set
+
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# 订阅者队列满或通知连接中断后发送：客户端应重新拉取整个行程文档
+RESYNC_EVENT = {"type": "resync", "data": {}}
+
+
+class PubSub:
+    """进程内发布/订阅，每个订阅者一个有界队列"""
+
+    def __init__(self, queue_size: int = 100):
+        """
+        Args:
+            queue_size: 每个订阅者最多积压的事件数
+        """
+        self.queue_size = queue_size
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+
+    def subscribe(self, topic: str) -> asyncio.Queue:
+        """订阅 topic，返回接收事件的队列（用完后必须 unsubscribe）"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers[topic].add(queue)
+        return queue
+
+    def unsubscribe(self, topic: str, queue: asyncio.Queue):
+        """取消订阅"""
+        queues = self.subscribers.get(topic)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[topic]
+
+    def publish(self, topic: str, event: dict):
+        """
+        向 topic 的所有订阅者发布事件（不阻塞）
+
+        订阅者消费太慢导致队列已满时，清空其积压事件并只留一条 resync，
+        避免一个慢客户端占用无限内存。
+        """
+        for queue in list(self.subscribers.get(topic, ())):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC_EVENT)
+
+    def publish_all(self, event: dict):
+        """向所有 topic 发布事件"""
+        for topic in list(self.subscribers):
+            self.publish(topic, event)
+
+
+class PostgresNotifyListener:
+    """
+    LISTEN 数据库通知并发布到进程内 PubSub（可选依赖: pip install asyncpg）
+
+    通知内容为 JSON: {"trip_id": ..., "type": ..., "data": {...}}。
+    连接断开时定期重连，重连成功后向所有订阅者发送 resync（期间的通知已丢失）。
+    """
+
+    def __init__(self, pubsub: PubSub, dsn: str, channel: str = "trip_events", reconnect_delay: float = 5.0):
+        self.pubsub = pubsub
+        self.dsn = dsn
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self.connection = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    async def start(self):
+        """建立连接并开始 LISTEN（应用启动时调用）"""
+        try:
+            import asyncpg
+        except ImportError as e:
+            raise RuntimeError("TRIP_EVENTS_BACKEND=postgres requires the 'asyncpg' package (pip install asyncpg)") from e
+        self.connection = await asyncpg.connect(self.dsn)
+        self.connection.add_termination_listener(self._on_terminated)
+        await self.connection.add_listener(self.channel, self._on_notify)
+        logger.info("Listening for %s notifications.", self.channel)
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str):
+        try:
+            event = json.loads(payload)
+            topic = event.pop("trip_id")
+        except (ValueError, KeyError) as e:
+            logger.warning("无法解析的 %s 通知: %s", channel, e)
+            return
+        self.pubsub.publish(str(topic), event)
+
+    def _on_terminated(self, connection):
+        if self._closed:
+            return
+        logger.warning("%s 通知连接已断开，%.0f 秒后重连", self.channel, self.reconnect_delay)
+        self._reconnect_task = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self):
+        while not self._closed:
+            await asyncio.sleep(self.reconnect_delay)
+            try:
+                await self.start()
+            except Exception as e:
+                logger.warning("%s 通知连接重连失败: %s", self.channel, e)
+                continue
+            self.pubsub.publish_all(RESYNC_EVENT)
+            return
+
+    async def close(self):
+        """停止 LISTEN 并关闭连接（应用关闭时调用）"""
+        self._closed = True
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+        if self.connection is not None and not self.connection.is_closed():
+            await self.connection.close()
+
+
+def create_event_listener(pubsub: PubSub, backend: str, dsn: str = "") -> Optional[PostgresNotifyListener]:
+    """
+    按配置创建事件来源
+
+    Args:
+        pubsub: 接收事件的进程内 PubSub
+        backend: local / postgres
+        dsn: Postgres 连接串（backend=postgres 时必填）
+
+    Returns:
+        Optional[PostgresNotifyListener]: local 时为 None，由写接口直接发布
+    """
+    if backend == "local":
+        return None
+    if backend == "postgres":
+        if not dsn:
+            raise ValueError("TRIP_EVENTS_DSN is required when TRIP_EVENTS_BACKEND=postgres")
+        return PostgresNotifyListener(pubsub, dsn)
+    raise ValueError(f"Unknown trip events backend: {backend}")
+
+
+def sse_message(event: dict) -> bytes:
+    """把事件编码为一条 SSE 消息"""
+    data = json.dumps(event.get("data", {}), separators=(",", ":"), ensure_ascii=False, default=str)
+    return f"event: {event['type']}\ndata: {data}\n\n".encode()
@@ -0,0 +1,81 @@
+# utils/fast_json.py
+# 可信数据行的快速响应路径
+#
+# PostgREST 返回的行已经是 JSON 解码后的 dict / list / str。路由把它们整理成响应结构后，
+# 这里按响应模型用 TypeAdapter 校验一次，再由 orjson 直接序列化这份原始数据：
+# 不再逐字段构建 Pydantic 模型、也不再经过 FastAPI 按 response_model 的第二次校验
+# 和标准库 json 编码。路由上的 response_model 仍然保留，用于生成 OpenAPI 文档。
+from functools import lru_cache
+from typing import Any, Optional
+
+import orjson
+from fastapi import Response
+from pydantic import TypeAdapter
+
+
+@lru_cache(maxsize=None)
+def _adapter(model_type) -> TypeAdapter:
+    """每个响应类型只构建一次 TypeAdapter"""
+    return TypeAdapter(model_type)
+
+
+def render_json(model_type, content: Any) -> bytes:
+    """
+    按响应模型校验一次后用 orjson 序列化
+
+    Args:
+        model_type: 响应类型，例如 TripResponse、List[ItineraryDay]
+        content: 已整理成响应结构的数据（只包含要返回的字段）
+
+    Returns:
+        bytes: JSON 响应体
+    """
+    _adapter(model_type).validate_python(content)
+    return orjson.dumps(content)
+
+
+def dump_json(content: Any) -> bytes:
+    """
+    序列化数据库函数已经按响应结构组装好的文档（例如 get_trip_document），不再逐字段校验
+
+    Args:
+        content: 已是最终响应结构的数据
+
+    Returns:
+        bytes: JSON 响应体
+    """
+    return orjson.dumps(content)
+
+
+def load_json(body: bytes) -> Any:
+    """
+    解析 dump_json / render_json 生成的响应体（例如缓存中的文档需要补充字段时）
+
+    Args:
+        body: JSON 响应体
+
+    Returns:
+        Any: 解析后的数据
+    """
+    return orjson.loads(body)
+
+
+def json_response(model_type, content: Any, status_code: int = 200, headers: Optional[dict] = None) -> Response:
+    """
+    构建已校验、已序列化的 JSON 响应（直接返回 Response，FastAPI 不会再处理 response_model）
+
+    Args:
+        model_type: 响应类型
+        content: 已整理成响应结构的数据
+        status_code: HTTP 状态码
+        headers: 额外的响应头
+
+    Returns:
+        Response: JSON 响应
+    """
+    return Response(
+        content=render_json(model_type, content),
+        status_code=status_code,
+        headers=headers,
+        media_type="application/json",
+    )
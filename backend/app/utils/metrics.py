@@ -0,0 +1,245 @@
+# utils/metrics.py
+# 进程内指标注册表，按 Prometheus 文本格式 (0.0.4) 输出，供 /metrics 抓取
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+LabelValues = Tuple[str, ...]
+
+# 默认的延迟分桶（秒），覆盖 5ms ~ 10s
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值；也可以传入 collect 回调在抓取时计算"""
+    type_name = "gauge"
+
+    def __init__(self, *args, collect: Optional[Callable[[], Dict[LabelValues, float]]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+        self._collect = collect
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self) -> List[str]:
+        if self._collect is not None:
+            items = list(self._collect().items())
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """累积分桶直方图，可用 histogram_quantile() 计算 p99"""
+    type_name = "histogram"
+
+    def __init__(self, *args, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label -> [各分桶计数..., sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0.0] * (len(self.buckets) + 1)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            counts[-1] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts)) for key, counts in self._values.items()]
+        lines = []
+        for key, counts in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(cumulative)}")
+        return lines
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), collect=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, collect=collect))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets=buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+registry = Registry()
+
+# --- 缓存命中率 ---
+# 各模块通过 register_cache 登记自己的 LRUCache，抓取时读取其 hits/misses
+_caches: Dict[str, object] = {}
+
+
+def register_cache(name: str, cache):
+    """登记一个带 hits/misses 计数的缓存，使其出现在 /metrics 中"""
+    _caches[name] = cache
+
+
+def _collect_cache(field: str) -> Callable[[], Dict[LabelValues, float]]:
+    def collect():
+        result = {}
+        for name, cache in list(_caches.items()):
+            hits, misses = cache.hits, cache.misses
+            if field == "ratio":
+                total = hits + misses
+                result[(name,)] = hits / total if total else 0.0
+            else:
+                result[(name,)] = getattr(cache, field)
+        return result
+    return collect
+
+
+registry.gauge("cache_hits", "Cache hits since start", ("cache",), collect=_collect_cache("hits"))
+registry.gauge("cache_misses", "Cache misses since start", ("cache",), collect=_collect_cache("misses"))
+registry.gauge("cache_hit_ratio", "Cache hit ratio since start", ("cache",), collect=_collect_cache("ratio"))
+
+# --- HTTP / 数据库指标 ---
+http_requests_total = registry.counter(
+    "http_requests_total", "HTTP requests by route template and status", ("method", "route", "status"))
+http_request_duration_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template and status", ("method", "route", "status"))
+http_request_db_seconds = registry.histogram(
+    "http_request_db_seconds", "Total DB time spent per HTTP request", ("method", "route"))
+http_requests_in_flight = registry.gauge(
+    "http_requests_in_flight", "HTTP requests currently being processed")
+db_query_duration_seconds = registry.histogram(
+    "db_query_duration_seconds", "Latency of individual PostgREST round trips", ("table", "operation"))
+
+
+def _collect_threadpool() -> Dict[LabelValues, float]:
+    """读取 anyio 默认线程池（同步路由在此运行）的占用和排队情况"""
+    import anyio.to_thread
+
+    try:
+        limiter = anyio.to_thread.current_default_thread_limiter()
+    except RuntimeError:  # 不在事件循环中
+        return {}
+    stats = limiter.statistics()
+    return {
+        ("busy",): stats.borrowed_tokens,
+        ("waiting",): stats.tasks_waiting,
+        ("limit",): limiter.total_tokens,
+    }
+
+
+registry.gauge("threadpool_workers", "Default threadpool usage and queue depth", ("state",), collect=_collect_threadpool)
+
+
+def observe_request(method: str, route: str, status: int, duration: float, trace=None):
+    """
+    请求结束时记录 HTTP 与数据库指标
+
+    Args:
+        method: HTTP 方法
+        route: 路由模板（例如 /trips/{trip_id}），避免把 ID 写进标签
+        status: 响应状态码
+        duration: 请求总耗时（秒）
+        trace: 当前请求的 RequestTrace
+    """
+    http_requests_total.inc(method=method, route=route, status=status)
+    http_request_duration_seconds.observe(duration, method=method, route=route, status=status)
+    if trace is not None:
+        http_request_db_seconds.observe(trace.db_time, method=method, route=route)
+        for span in trace.spans:
+            db_query_duration_seconds.observe(span.duration, table=span.table, operation=span.operation)
@@ -0,0 +1,52 @@
+# utils/profiles.py
+# 用户资料（name, avatar_url）的批量加载器
+#
+# 协作者列表只需要少量用户的资料，而同一批用户会在不同行程、不同请求中反复出现。
+# 路由先收集本次响应涉及的全部 user_id，再调用 load_profiles：
+# 命中短 TTL 的 LRU 缓存的直接返回，其余用一次 users?id=in.(...) 查询取回。
+#
+# 查询使用调用者的令牌，受 public.users 的 RLS 约束；缓存键因此包含查看者 (viewer_id, user_id)，
+# 一个用户读到的资料不会被返回给另一个用户。
+from typing import Dict, Iterable
+
+from supabase import AsyncClient
+
+from app.core.config import settings
+from app.utils.cache import LRUCache
+from app.utils.metrics import register_cache
+
+# 资料变更不经过本服务，TTL 决定改名/换头像后的最长延迟
+profile_cache = LRUCache(maxsize=settings.PROFILE_CACHE_SIZE, ttl=settings.PROFILE_CACHE_TTL)
+register_cache("user_profile", profile_cache)
+
+PROFILE_FIELDS = "id, name, avatar_url"
+
+
+async def load_profiles(db: AsyncClient, viewer_id: str, user_ids: Iterable[str]) -> Dict[str, dict]:
+    """
+    批量读取用户资料
+
+    Args:
+        db: Supabase数据库客户端实例（使用 viewer_id 的令牌）
+        viewer_id: 当前用户ID，作为缓存键的一部分
+        user_ids: 用户ID，可以重复
+
+    Returns:
+        Dict[str, dict]: user_id -> {"name": ..., "avatar_url": ...}，不存在的用户不包含在内
+    """
+    profiles = {}
+    missing = []
+    for user_id in dict.fromkeys(str(user_id) for user_id in user_ids):
+        profile = profile_cache.get((viewer_id, user_id))
+        if profile is None:
+            missing.append(user_id)
+        else:
+            profiles[user_id] = profile
+
+    if missing:
+        res = await db.table("users").select(PROFILE_FIELDS).in_("id", missing).execute()
+        for row in res.data:
+            profile = {"name": row.get('name'), "avatar_url": row.get('avatar_url')}
+            profile_cache.set((viewer_id, str(row['id'])), profile)
+            profiles[str(row['id'])] = profile
+    return profiles
@@ -0,0 +1,94 @@
+# utils/rank.py
+# 分数排序键（fractional index）：用可比较的字符串代替整数 sort_order，
+# 在两个相邻项目之间插入时只需要为被移动的项目生成一个新键，不用重新编号其他行。
+#
+# 键是 base-62 小数 "0.xxx" 的小数部分，按字节序（数据库中使用 COLLATE "C"）比较，
+# 且不以 "0" 结尾，因此任意两个不同的键之间总能再插入一个新键。
+from typing import List, Optional
+
+ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+BASE = len(ALPHABET)
+
+# 合法键的正则（供请求模型校验）
+RANK_PATTERN = r"^[0-9A-Za-z]*[1-9A-Za-z]$"
+
+# 键长度超过该值时安排一次重新均匀分布（反复在同一位置插入会让键变长）
+REBALANCE_LENGTH = 16
+
+
+def _digit(char: str) -> int:
+    return ALPHABET.index(char)
+
+
+def rank_between(before: Optional[str], after: Optional[str]) -> str:
+    """
+    生成严格位于 before 和 after 之间的键
+
+    Args:
+        before: 前一个项目的键，放在最前面时为 None
+        after: 后一个项目的键，放在最后面时为 None
+
+    Returns:
+        str: 新键
+
+    Raises:
+        ValueError: before >= after，或键以 "0" 结尾
+    """
+    before = before or ""
+    if after is not None and before >= after:
+        raise ValueError(f"rank {before!r} is not before {after!r}")
+    if before.endswith("0") or (after and after.endswith("0")):
+        raise ValueError("rank must not end with '0'")
+    return _midpoint(before, after)
+
+
+def _midpoint(a: str, b: Optional[str]) -> str:
+    if b is not None:
+        # 跳过公共前缀（a 较短时按补 0 处理）
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else "0") == b[n]:
+            n += 1
+        if n > 0:
+            return b[:n] + _midpoint(a[n:], b[n:])
+
+    digit_a = _digit(a[0]) if a else 0
+    digit_b = _digit(b[0]) if b is not None else BASE
+    if digit_b - digit_a > 1:
+        return ALPHABET[(digit_a + digit_b + 1) // 2]
+    # 首位相邻：b 更长时取 b 的首位即可，否则在 a 的首位之后继续取中点
+    if b is not None and len(b) > 1:
+        return b[:1]
+    return ALPHABET[digit_a] + _midpoint(a[1:], None)
+
+
+def rank_sequence(count: int) -> List[str]:
+    """
+    生成 count 个均匀分布的递增键，用于整天重新分布（rebalance）
+
+    所有键等宽，相邻键之间至少留出一位的空间，之后的插入能保持较短的键。
+
+    Args:
+        count: 键的数量
+
+    Returns:
+        List[str]: 递增的键列表
+    """
+    width = 1
+    while BASE ** width < (count + 1) * BASE:
+        width += 1
+    step = BASE ** width // (count + 1)
+
+    ranks = []
+    for index in range(1, count + 1):
+        value = step * index
+        chars = []
+        for _ in range(width):
+            value, remainder = divmod(value, BASE)
+            chars.append(ALPHABET[remainder])
+        ranks.append("".join(reversed(chars)).rstrip("0"))
+    return ranks
+
+
+def needs_rebalance(rank: Optional[str]) -> bool:
+    """判断键是否已经长到需要重新分布"""
+    return rank is not None and len(rank) > REBALANCE_LENGTH
@@ -0,0 +1,48 @@
+# utils/roundtrip_budget.py
+# 每个请求的数据库往返次数预算检测（调试 / CI 模式）
+from typing import Optional
+
+from app.core.config import settings
+from app.utils.timing import RequestTrace
+
+
+def round_trip_budget(method: str, route: str) -> int:
+    """
+    返回指定路由的往返次数预算，0 表示不检测
+
+    Args:
+        method: HTTP 方法
+        route: 路由模板，例如 /trips/items/{item_id}
+    """
+    overrides = settings.DB_ROUNDTRIP_BUDGET_OVERRIDES
+    budget = overrides.get(f"{method} {route}", overrides.get(route))
+    return settings.DB_ROUNDTRIP_BUDGET if budget is None else budget
+
+
+def format_call_sequence(trace: RequestTrace) -> str:
+    """把请求内的数据库调用按发生顺序格式化成多行报告"""
+    lines = []
+    for index, span in enumerate(trace.spans, start=1):
+        line = f"  {index}. {span.operation} {span.table}"
+        if span.filters:
+            line += f" [{span.filters}]"
+        if span.rows is not None:
+            line += f" rows={span.rows}"
+        lines.append(f"{line} {span.duration * 1000:.1f}ms")
+    return "\n".join(lines)
+
+
+def check_round_trip_budget(method: str, route: str, trace: RequestTrace) -> Optional[str]:
+    """
+    检查请求是否超出往返次数预算
+
+    Returns:
+        Optional[str]: 超出预算时返回包含调用序列的报告，否则返回 None
+    """
+    budget = round_trip_budget(method, route)
+    if budget <= 0 or len(trace.spans) <= budget:
+        return None
+    return (
+        f"{method} {route} made {len(trace.spans)} DB round trips (budget {budget}):\n"
+        f"{format_call_sequence(trace)}"
+    )
@@ -0,0 +1,24 @@
+# utils/rpc_errors.py
+# 数据库函数（RPC）中 RAISE EXCEPTION ... USING ERRCODE 到 HTTP 状态码的转换
+from fastapi import HTTPException
+from postgrest.exceptions import APIError
+
+# ERRCODE -> HTTP 状态码，未列出的按 400 处理
+RPC_ERROR_STATUS = {
+    "42501": 403,  # insufficient_privilege
+    "P0002": 404,  # no_data_found
+    "22023": 400,  # invalid_parameter_value
+}
+
+
+def raise_for_rpc_error(e: APIError):
+    """
+    把 RPC 抛出的数据库错误转换为对应的 HTTPException
+
+    Args:
+        e: postgrest 客户端抛出的 APIError
+
+    Raises:
+        HTTPException: 状态码由 RPC_ERROR_STATUS 决定，detail 为数据库错误信息
+    """
+    raise HTTPException(status_code=RPC_ERROR_STATUS.get(e.code, 400), detail=e.message)
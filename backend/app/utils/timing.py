@@ -1,99 +1,136 @@
 # utils/timing.py
 import time
+import threading
 from contextlib import contextmanager
-from fastapi import Request
-from typing import Optional
+from contextvars import ContextVar, Token
+from typing import List, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
-# 存储请求状态的全局字典（在实际应用中可能需要使用更可靠的存储方式）
-request_state = {}
 
-@contextmanager
-def db_timer(request: Request, operation: str = "db_operation"):
-    """
-    数据库操作耗时记录上下文管理器
-    
-    Args:
-        request: FastAPI请求对象
-        operation: 数据库操作描述
-    """
-    request_id = f"{id(request)}"
-    start_time = time.time()
-    
-    try:
-        logger.debug(f"开始数据库操作: {operation}")
-        yield
-    finally:
-        duration = time.time() - start_time
-        logger.debug(f"数据库操作完成: {operation}, 耗时: {duration*1000:.2f}ms")
-        
-        # 记录到请求状态中
-        if request_id in request_state:
-            request_state[request_id]["db_time"] += duration
-
-def record_db_time(request: Request, duration: float):
+class DbSpan:
+    """一次数据库调用的记录"""
+    __slots__ = ("table", "operation", "duration", "rows", "filters", "size")
+
+    def __init__(self, table: str, operation: str, duration: float, rows: Optional[int] = None, filters: str = "", size: int = 0):
+        self.table = table
+        self.operation = operation
+        self.duration = duration  # 秒
+        self.rows = rows
+        self.filters = filters  # PostgREST 过滤条件，例如 id=eq.1&user_id=eq.2
+        self.size = size  # 响应体字节数
+
+
+class RequestTrace:
     """
-    记录数据库操作耗时的辅助函数
-    
-    Args:
-        request: FastAPI请求对象
-        duration: 数据库操作耗时（秒）
+    单个请求的耗时记录器。
+
+    通过 contextvars 绑定到当前请求：async 路由和在线程池中运行的同步路由
+    都能拿到同一个实例（anyio 在切换到线程池时会复制上下文），因此不再需要按 id(request) 查全局字典。
     """
-    request_id = f"{id(request)}"
-    if request_id in request_state:
-        request_state[request_id]["db_time"] += duration
 
-def get_db_time(request: Request) -> float:
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.spans: List[DbSpan] = []
+        self._lock = threading.Lock()
+
+    def add_span(self, span: DbSpan):
+        with self._lock:
+            self.spans.append(span)
+
+    @property
+    def db_time(self) -> float:
+        """数据库总耗时（秒）"""
+        return sum(span.duration for span in self.spans)
+
+    @property
+    def total_time(self) -> float:
+        """请求开始至今的总耗时（秒）"""
+        return time.perf_counter() - self.start_time
+
+    def server_timing(self) -> str:
+        """
+        生成 Server-Timing 响应头，浏览器开发者工具的 Timing 面板会直接展示每一项。
+
+        格式: total;dur=12.3, app;dur=4.1, db;dur=8.2, db1;desc="trips select rows=3";dur=5.0, ...
+        """
+        total_ms = self.total_time * 1000
+        db_ms = self.db_time * 1000
+        metrics = [
+            f"total;dur={total_ms:.1f}",
+            f"app;dur={total_ms - db_ms:.1f}",
+            f"db;dur={db_ms:.1f}",
+        ]
+        for index, span in enumerate(self.spans, start=1):
+            desc = f"{span.table} {span.operation}"
+            if span.rows is not None:
+                desc += f" rows={span.rows}"
+            desc = desc.replace('"', "'")
+            metrics.append(f'db{index};desc="{desc}";dur={span.duration * 1000:.1f}')
+        return ", ".join(metrics)
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+def start_request_trace() -> Token:
     """
-    获取请求的数据库总耗时
-    
-    Args:
-        request: FastAPI请求对象
-        
+    为当前请求创建耗时记录器
+
     Returns:
-        float: 数据库总耗时（秒）
+        Token: 传给 end_request_trace 用于恢复上下文
     """
-    request_id = f"{id(request)}"
-    return request_state.get(request_id, {}).get("db_time", 0)
+    return _current_trace.set(RequestTrace())
+
 
-def init_request_state(request: Request):
+def end_request_trace(token: Token):
     """
-    初始化请求状态
-    
+    结束当前请求的耗时记录
+
     Args:
-        request: FastAPI请求对象
+        token: start_request_trace 返回的 Token
     """
-    request_id = f"{id(request)}"
-    request_state[request_id] = {
-        "start_time": time.time(),
-        "db_time": 0,
-        "logic_time": 0
-    }
-
-def cleanup_request_state(request: Request):
+    _current_trace.reset(token)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    """返回当前请求的耗时记录器（不在请求上下文中时为 None）"""
+    return _current_trace.get()
+
+
+def record_db_span(table: str, operation: str, duration: float, rows: Optional[int] = None, filters: str = "", size: int = 0):
     """
-    清理请求状态
-    
+    记录一次数据库调用
+
     Args:
-        request: FastAPI请求对象
+        table: 表名或 RPC 名
+        operation: 操作类型（select/insert/update/delete/rpc 等）
+        duration: 耗时（秒）
+        rows: 返回的行数（未知时为 None）
+        filters: 过滤条件
+        size: 响应体字节数
     """
-    request_id = f"{id(request)}"
-    if request_id in request_state:
-        del request_state[request_id]
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(DbSpan(table, operation, duration, rows, filters, size))
 
-def get_total_time(request: Request) -> float:
+
+@contextmanager
+def db_timer(table: str, operation: str = "db_operation"):
     """
-    获取请求总耗时
-    
+    数据库操作耗时记录上下文管理器
+
     Args:
-        request: FastAPI请求对象
-        
-    Returns:
-        float: 请求总耗时（秒）
+        table: 表名或 RPC 名
+        operation: 数据库操作描述
     """
-    request_id = f"{id(request)}"
-    if request_id in request_state:
-        return time.time() - request_state[request_id]["start_time"]
-    return 0
\ No newline at end of file
+    start_time = time.perf_counter()
+
+    try:
+        logger.debug(f"开始数据库操作: {table} {operation}")
+        yield
+    finally:
+        duration = time.perf_counter() - start_time
+        logger.debug(f"数据库操作完成: {table} {operation}, 耗时: {duration*1000:.2f}ms")
+        record_db_span(table, operation, duration)
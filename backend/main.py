@@ -1,15 +1,19 @@
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
 from app.api.data_api import router as data_router
 from app.api.checklist_api import router as checklist_router
 from app.api.favorites_api import router as favorites_router
-from app.api.trips_api import router as trips_router
-from app.core.client import init_supabase_for_startup
-import time
+from app.api.sync_api import router as sync_router
+from app.api.trips_api import router as trips_router, trip_document_cache, trip_event_listener
+from app.core.client import init_supabase_for_startup, close_http_pool, close_async_http_pool
 from app.utils.logger import setup_logger
-from app.utils.timing import init_request_state, cleanup_request_state, get_db_time, get_total_time
+from app.utils.timing import start_request_trace, end_request_trace, current_trace
+from app.utils import metrics
+from app.utils.roundtrip_budget import check_round_trip_budget
+from app.core.config import settings
 
 from fastapi import FastAPI, Depends
 from app.core.auth import require_user
@@ -20,9 +24,17 @@ logger = setup_logger(__name__)
 async def lifespan(app: FastAPI):
     # 在应用启动时初始化 Supabase 客户端
     init_supabase_for_startup()
+    # postgres 模式下开始 LISTEN 行程变更通知
+    if trip_event_listener is not None:
+        await trip_event_listener.start()
     logger.info("Application startup complete.")
     yield
-    # 在应用关闭时可以添加清理代码 (如果需要)
+    # 在应用关闭时释放 PostgREST 共享连接池、文档缓存连接和变更通知连接
+    close_http_pool()
+    await close_async_http_pool()
+    await trip_document_cache.close()
+    if trip_event_listener is not None:
+        await trip_event_listener.close()
     logger.info("Application shutdown.")
 
 # 创建 FastAPI 应用实例
@@ -41,7 +53,8 @@ app.add_middleware(
     allow_origins=["http://localhost:8080", "http://127.0.0.1:8080"],  # 警告: 在生产环境中不安全
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "PATCH"],
-    allow_headers=["Authorization", "Content-Type"],
+    allow_headers=["Authorization", "Content-Type", "If-None-Match"],
+    expose_headers=["X-Next-Cursor", "ETag"],  # 行程列表分页游标、详情接口的 ETag
 )
 
 # ---------------- 路由注册 ----------------
@@ -50,6 +63,7 @@ app.include_router(data_router, prefix="/data", tags=["data"])
 app.include_router(favorites_router, prefix="/favorites", tags=["Favorites"])
 app.include_router(checklist_router, prefix="/checklists", tags=["Checklists"])
 app.include_router(trips_router, prefix="/trips", tags=["Trips"])
+app.include_router(sync_router, prefix="/sync", tags=["Sync"])
 
 # 根路由
 @app.get("/", summary="Root Endpoint", description="A simple root endpoint to check if the API is running.")
@@ -64,6 +78,11 @@ def read_root():
 def read_me(user_id: str = Depends(require_user)):
     return {"user_id": user_id}
 
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    """Prometheus 抓取端点"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 # ---------------- 请求耗时分析中间件 ----------------
 @app.middleware("http")
 async def timing_middleware(request: Request, call_next):
@@ -72,29 +91,51 @@ async def timing_middleware(request: Request, call_next):
     """
     client_ip = request.client.host if request.client else "Unknown"
     
-    # 记录请求开始时间
-    start_time = time.time()
     logger.info(f"Request: {request.method} {request.url} - From: {client_ip}")
     
-    # 初始化请求状态
-    init_request_state(request)
+    # 为当前请求创建耗时记录器（基于 contextvars，线程池中的同步路由也能记录）
+    trace_token = start_request_trace()
+    trace = current_trace()
+    metrics.http_requests_in_flight.inc()
     
     try:
         response = await call_next(request)
     finally:
         # 清理请求状态
-        cleanup_request_state(request)
+        end_request_trace(trace_token)
+        metrics.http_requests_in_flight.dec()
     
     # 计算总耗时
-    total_time = get_total_time(request) * 1000  # 转换为毫秒
-    db_time = get_db_time(request) * 1000  # 转换为毫秒
+    total_time = trace.total_time * 1000  # 转换为毫秒
+    db_time = trace.db_time * 1000  # 转换为毫秒
     logic_time = total_time - db_time
     
+    # 在浏览器开发者工具中可直接查看每个数据库调用的耗时
+    response.headers["Server-Timing"] = trace.server_timing()
+    
+    # 路由模板在路由匹配后写入 scope，未匹配的请求统一归为 unmatched，避免标签基数爆炸
+    route = request.scope.get("route")
+    route_path = getattr(route, "path", "unmatched")
+    metrics.observe_request(request.method, route_path, response.status_code, trace.total_time, trace)
+    
+    # 调试 / CI 模式: 检查数据库往返次数是否超出预算
+    if settings.DB_ROUNDTRIP_BUDGET or settings.DB_ROUNDTRIP_BUDGET_OVERRIDES:
+        response.headers["X-DB-Round-Trips"] = str(len(trace.spans))
+        report = check_round_trip_budget(request.method, route_path, trace)
+        if report:
+            logger.warning("DB round-trip budget exceeded: %s", report)
+            if settings.DB_ROUNDTRIP_BUDGET_MODE == "raise":
+                return JSONResponse(
+                    status_code=500,
+                    content={"detail": "DB round-trip budget exceeded", "report": report.splitlines()},
+                    headers={"X-DB-Round-Trips": str(len(trace.spans)), "Server-Timing": trace.server_timing()},
+                )
+    
     logger.info(
         f"Response: {response.status_code} - "
         f"Total: {total_time:.2f}ms | "
         f"Logic: {logic_time:.2f}ms | "
-        f"DB: {db_time:.2f}ms"
+        f"DB: {db_time:.2f}ms ({len(trace.spans)} calls)"
     )
     
     return response
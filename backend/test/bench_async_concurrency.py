@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+并发基准：async 路由中调用同步 PostgREST (阻塞事件循环) vs 真正的异步数据访问
+
+用法（在 backend/ 目录下）:
+    python test/bench_async_concurrency.py
+    python test/bench_async_concurrency.py --concurrency 100 --requests 500 --latency 0.05
+
+两条路由都运行在同一个 FastAPI 应用内，通过 ASGITransport 发起请求；
+模拟 PostgREST 每次往返固定休眠 --latency 秒。
+"""
+
+import argparse
+import asyncio
+import time
+
+from postgrest_stub import start_stub_server, use_stub_settings
+
+
+async def run(app, path: str, total: int, concurrency: int) -> float:
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one():
+            async with semaphore:
+                response = await client.get(path)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=50, help="同时在途的请求数")
+    parser.add_argument("--requests", type=int, default=200, help="每种方式的请求总数")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟的 PostgREST 往返耗时（秒）")
+    args = parser.parse_args()
+
+    use_stub_settings(start_stub_server(latency=args.latency))
+
+    from fastapi import Depends
+    from app.core.auth import require_user
+    from app.core.client import close_async_http_pool, get_supabase_client
+    from main import app
+
+    app.dependency_overrides[require_user] = lambda: "bench-user-id"
+
+    @app.get("/_bench/blocking-favorites")
+    async def blocking_favorites(supabase=Depends(get_supabase_client)):
+        # 旧写法：async 路由里直接调用同步 execute()，会阻塞整个事件循环
+        return supabase.from_("user_favorites").select("item_id, item_type").execute().data
+
+    print(
+        f"=== Concurrency benchmark ({args.requests} requests, "
+        f"{args.concurrency} in flight, {args.latency * 1000:.0f}ms per DB call) ==="
+    )
+
+    async def compare():
+        # 异步连接池绑定在事件循环上，所有测量在同一个循环里完成
+        for name, path in (("sync client in async route", "/_bench/blocking-favorites"), ("async client", "/favorites/")):
+            await run(app, path, min(args.concurrency, args.requests), args.concurrency)  # 预热
+            elapsed = await run(app, path, args.requests, args.concurrency)
+            print(f"{name:<28} {elapsed:6.2f}s  {args.requests / elapsed:8.1f} req/s")
+        await close_async_http_pool()
+
+    asyncio.run(compare())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+基准测试：每个请求 create_client() vs 进程级共享连接池 (PooledSupabaseClient)
+
+用法（在 backend/ 目录下）:
+    python test/bench_supabase_client.py              # 使用本地 PostgREST 模拟服务
+    python test/bench_supabase_client.py --live       # 使用 .env 中配置的真实 Supabase
+    python test/bench_supabase_client.py -n 500
+
+本地模拟服务只返回固定 JSON，因此测得的差值主要是客户端构建与连接建立的开销；
+对真实 Supabase（TLS + 公网延迟）差距会更大。
+"""
+
+import argparse
+import statistics
+import time
+
+from postgrest_stub import start_stub_server, use_stub_settings
+
+
+def summarize(name: str, samples: list):
+    samples_ms = sorted(s * 1000 for s in samples)
+    p95 = samples_ms[int(len(samples_ms) * 0.95) - 1]
+    print(
+        f"{name:<28} mean={statistics.mean(samples_ms):7.2f}ms  "
+        f"p50={statistics.median(samples_ms):7.2f}ms  p95={p95:7.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=200, help="每种方式执行的请求数")
+    parser.add_argument("--live", action="store_true", help="使用 .env 中的真实 Supabase 配置")
+    args = parser.parse_args()
+
+    if not args.live:
+        use_stub_settings(start_stub_server())
+
+    from supabase import create_client
+    from app.core.config import settings
+    from app.core.client import PooledSupabaseClient, close_http_pool
+
+    def per_request():
+        client = create_client(supabase_url=settings.SUPABASE_URL, supabase_key=settings.SUPABASE_KEY)
+        client.table("checklists").select("id").limit(1).execute()
+
+    def pooled():
+        client = PooledSupabaseClient("bench-user-token")
+        client.table("checklists").select("id").limit(1).execute()
+
+    print(f"=== Supabase client benchmark ({args.n} requests, url={settings.SUPABASE_URL}) ===")
+    for name, fn in (("create_client() per request", per_request), ("pooled client", pooled)):
+        fn()  # 预热
+        samples = []
+        for _ in range(args.n):
+            start = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - start)
+        summarize(name, samples)
+
+    close_http_pool()
+
+
+if __name__ == "__main__":
+    main()
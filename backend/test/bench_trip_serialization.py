@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+基准测试：行程详情响应的序列化 CPU 开销（30 天、每天 10 个项目，共 300 个项目）
+
+用法（在 backend/ 目录下）:
+    python test/bench_trip_serialization.py
+    python test/bench_trip_serialization.py -n 500 --days 30 --items-per-day 10
+
+对同一份 PostgREST 返回的行数据比较四种方式（只统计进程 CPU 时间，不含数据库往返）：
+    models+response_model  逐字段构建模型，FastAPI 再按 response_model 校验并用标准库 json 编码
+    models+dump_json       逐字段构建模型，model_dump_json 序列化
+    rows+orjson            整理数据行，按响应模型校验一次后用 orjson 序列化（导出、复制）
+    document+orjson        get_trip_document 已在数据库中组装好文档，直接用 orjson 序列化（行程详情）
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+from postgrest_stub import use_stub_settings
+
+
+def make_trip_row(days: int, items_per_day: int) -> dict:
+    """构造与 trips 深层嵌入查询结构相同的数据行"""
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "name": "Japan Rail Pass Trip",
+        "destination": "Tokyo, Kyoto, Osaka",
+        "start_date": "2025-10-01",
+        "end_date": "2025-10-30",
+        "description": "Thirty days across Honshu.",
+        "status": "Planning",
+        "thumbnail": "https://example.com/thumb.jpg",
+        "created_at": "2025-09-01T08:00:00+00:00",
+        "updated_at": "2025-09-02T08:00:00+00:00",
+        "version": 42,
+        "trip_collaborators": [
+            {"id": str(uuid.uuid4()), "user_id": str(uuid.uuid4()), "access_level": "editor", "users": {"name": f"Friend {n}", "avatar_url": None}}
+            for n in range(3)
+        ],
+        "itinerary_days": [
+            {
+                "id": str(uuid.uuid4()),
+                "trip_id": None,
+                "day_number": day + 1,
+                "date": f"2025-10-{day + 1:02d}",
+                "title": f"Day {day + 1}",
+                "itinerary_items": [
+                    {
+                        "id": str(uuid.uuid4()),
+                        "day_id": None,
+                        "time": f"{9 + item % 12:02d}:00",
+                        "type": "sightseeing",
+                        "name": f"Stop {item + 1}",
+                        "notes": "Buy tickets at the gate. " * 3,
+                        "sort_order": item,
+                        "rank": f"a{item:02d}",
+                    }
+                    for item in range(items_per_day)
+                ],
+            }
+            for day in range(days)
+        ],
+    }
+
+
+def build_models(trip: dict):
+    """逐字段构建模型（与之前的 get_trip_details 相同）"""
+    from app.api.trips_api import Collaborator, ItineraryDay, ItineraryItem, TripResponse
+
+    collaborators = [
+        Collaborator(
+            id=collab['id'],
+            user_id=collab['user_id'],
+            access_level=collab['access_level'],
+            name=collab['users'].get('name', ''),
+            avatar_url=collab['users'].get('avatar_url'),
+        )
+        for collab in trip['trip_collaborators']
+        if collab.get('users')
+    ]
+    itinerary = [
+        ItineraryDay(
+            id=day['id'],
+            day_number=day['day_number'],
+            date=day['date'],
+            title=day.get('title'),
+            items=[
+                ItineraryItem(
+                    id=item['id'],
+                    time=item.get('time'),
+                    type=item.get('type', 'custom'),
+                    name=item['name'],
+                    notes=item.get('notes'),
+                    rank=item.get('rank'),
+                )
+                for item in day['itinerary_items']
+            ],
+        )
+        for day in trip['itinerary_days']
+    ]
+    return TripResponse(
+        id=trip['id'],
+        user_id=trip['user_id'],
+        name=trip['name'],
+        destination=trip['destination'],
+        start_date=trip['start_date'],
+        end_date=trip['end_date'],
+        description=trip.get('description'),
+        status=trip['status'],
+        thumbnail=trip.get('thumbnail'),
+        created_at=trip['created_at'],
+        updated_at=trip['updated_at'],
+        collaborators=collaborators,
+        itinerary=itinerary,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=200, help="每种方式执行的次数")
+    parser.add_argument("--days", type=int, default=30, help="行程天数")
+    parser.add_argument("--items-per-day", type=int, default=10, help="每天的项目数")
+    args = parser.parse_args()
+
+    # 不访问数据库，只需要让 Settings 能够加载
+    use_stub_settings("http://127.0.0.1:9")
+
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_model_field
+    from app.api.trips_api import TripResponse, _collaborator_documents, _day_document, _trip_document
+    from app.utils.fast_json import dump_json, render_json
+
+    trip = make_trip_row(args.days, args.items_per_day)
+    # 行序列化使用 load_profiles 的结果，这里直接取行中的资料
+    profiles = {collab['user_id']: collab['users'] for collab in trip['trip_collaborators']}
+    response_field = create_model_field(name="Response_get_trip_details", type_=TripResponse, mode="serialization")
+    loop = asyncio.new_event_loop()
+
+    def models_response_model() -> bytes:
+        content = loop.run_until_complete(serialize_response(field=response_field, response_content=build_models(trip)))
+        return JSONResponse(content).body
+
+    def models_dump_json() -> bytes:
+        return build_models(trip).model_dump_json().encode()
+
+    def rows_orjson() -> bytes:
+        document = _trip_document(
+            trip,
+            collaborators=_collaborator_documents(trip['trip_collaborators'], profiles),
+            itinerary=[_day_document(day) for day in trip['itinerary_days']],
+        )
+        return render_json(TripResponse, document)
+
+    # get_trip_document 返回的文档与 rows+orjson 的结构相同
+    document = json.loads(rows_orjson())
+
+    def document_orjson() -> bytes:
+        return dump_json(document)
+
+    # 各种方式的输出必须一致
+    baseline = json.loads(models_response_model())
+    assert json.loads(models_dump_json()) == baseline
+    assert json.loads(rows_orjson()) == baseline
+    assert json.loads(document_orjson()) == baseline
+
+    item_count = args.days * args.items_per_day
+    print(f"{args.days} 天 / {item_count} 个项目，响应体 {len(rows_orjson()) / 1024:.1f} KiB，每种方式 {args.n} 次")
+    for name, fn in [
+        ("models+response_model", models_response_model),
+        ("models+dump_json", models_dump_json),
+        ("rows+orjson", rows_orjson),
+        ("document+orjson", document_orjson),
+    ]:
+        for _ in range(10):
+            fn()
+        samples = []
+        for _ in range(args.n):
+            start = time.process_time()
+            fn()
+            samples.append((time.process_time() - start) * 1000)
+        samples.sort()
+        p95 = samples[int(len(samples) * 0.95) - 1]
+        print(f"{name:<24} cpu mean={statistics.mean(samples):7.3f}ms  p50={statistics.median(samples):7.3f}ms  p95={p95:7.3f}ms")
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+基准测试脚本共用的本地 PostgREST 模拟服务。
+
+只用于 test/bench_*.py：任何请求都返回固定 JSON，可选地模拟网络/数据库延迟。
+"""
+
+import asyncio
+import multiprocessing
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def _serve(latency: float, body: bytes, ports: multiprocessing.Queue):
+    response = (
+        b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+        b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+    )
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                if length:
+                    await reader.readexactly(length)
+                if latency:
+                    await asyncio.sleep(latency)
+                writer.write(response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(asyncio.start_server(handle, "127.0.0.1", 0, backlog=1024))
+    ports.put(server.sockets[0].getsockname()[1])
+    loop.run_forever()
+
+
+def start_stub_server(latency: float = 0.0, body: bytes = b"[]") -> str:
+    """在独立进程中启动模拟服务（HTTP/1.1 keep-alive），返回其 base URL。
+
+    放在独立进程里是为了不和被测代码争抢 GIL，否则并发测试结果会失真。
+
+    Args:
+        latency: 每个请求在返回前等待的秒数，用于模拟 PostgREST 往返耗时
+        body: 所有请求返回的 JSON 内容
+    """
+    ports = multiprocessing.Queue()
+    multiprocessing.Process(target=_serve, args=(latency, body, ports), daemon=True).start()
+    return f"http://127.0.0.1:{ports.get(timeout=10)}"
+
+
+def use_stub_settings(url: str):
+    """在导入 app 模块之前调用，让 Settings 指向模拟服务。"""
+    os.environ.update({
+        "SUPABASE_URL": url,
+        "SUPABASE_KEY": "bench-anon-key-0123456789",
+        "SUPABASE_JWT_SECRET": "bench-secret",
+        "TIANDITU_KEY": "bench",
+        "GAODE_KEY": "bench",
+        # 本地模拟服务只支持 HTTP/1.1
+        "SUPABASE_HTTP2": "false",
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    })
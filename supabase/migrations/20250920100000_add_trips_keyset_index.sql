@@ -0,0 +1,5 @@
+-- 行程列表按 (created_at, id) 倒序做游标分页（GET /trips/?cursor=...）
+-- 复合索引让 "user_id = ? AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT n"
+-- 直接走索引范围扫描，无论用户有多少行程，每页成本都只与 limit 相关。
+CREATE INDEX IF NOT EXISTS idx_trips_user_created_at_id
+    ON public.trips (user_id, created_at DESC, id DESC);
@@ -0,0 +1,134 @@
+-- 行程成员表：把 "用户拥有的行程" 和 "用户参与协作的行程" 合并成一张按用户组织的表。
+--
+-- 之前 GET /trips/ 用 trips.user_id 与嵌入的 trip_collaborators.user_id 做 OR 过滤，
+-- PostgREST 只能扫描 trips 再逐行嵌入协作者，随着 trip_collaborators 增长越来越慢。
+-- trip_members 由触发器维护，(user_id, trip_created_at DESC, trip_id DESC) 索引让
+-- "我的行程" 的每一页都是一次索引范围扫描，与表的总大小无关。
+
+CREATE TABLE IF NOT EXISTS public.trip_members (
+    user_id UUID NOT NULL,
+    trip_id UUID NOT NULL REFERENCES public.trips(id) ON DELETE CASCADE,
+    access_level TEXT NOT NULL,            -- owner / editor / viewer
+    trip_created_at TIMESTAMPTZ NOT NULL,  -- 冗余 trips.created_at，用于分页排序
+    PRIMARY KEY (user_id, trip_id)
+);
+
+COMMENT ON TABLE public.trip_members IS 'Denormalized (user, trip) membership maintained by triggers on trips and trip_collaborators.';
+
+CREATE INDEX IF NOT EXISTS idx_trip_members_user_recent
+    ON public.trip_members (user_id, trip_created_at DESC, trip_id DESC);
+CREATE INDEX IF NOT EXISTS idx_trip_members_trip_id
+    ON public.trip_members (trip_id);
+
+-- list_user_trips 改为扫描 trip_members 后，不再有查询使用 trips 上的 (user_id, created_at, id) 索引
+-- （20250920100000_add_trips_keyset_index），保留它只会增加 trips 的写入开销
+DROP INDEX IF EXISTS public.idx_trips_user_created_at_id;
+
+ALTER TABLE public.trip_members ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can read their own trip memberships" ON public.trip_members
+    FOR SELECT USING (auth.uid() = user_id);
+
+
+-- 行程所有者 -> owner 成员
+CREATE OR REPLACE FUNCTION public.sync_trip_owner_membership()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        IF NEW.user_id IS DISTINCT FROM OLD.user_id THEN
+            DELETE FROM public.trip_members
+            WHERE trip_id = NEW.id AND user_id = OLD.user_id AND access_level = 'owner';
+        END IF;
+        UPDATE public.trip_members SET trip_created_at = NEW.created_at WHERE trip_id = NEW.id;
+    END IF;
+
+    INSERT INTO public.trip_members (user_id, trip_id, access_level, trip_created_at)
+    VALUES (NEW.user_id, NEW.id, 'owner', NEW.created_at)
+    ON CONFLICT (user_id, trip_id) DO UPDATE SET access_level = 'owner';
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE TRIGGER sync_trip_owner_membership
+    AFTER INSERT OR UPDATE OF user_id, created_at ON public.trips
+    FOR EACH ROW
+    EXECUTE FUNCTION public.sync_trip_owner_membership();
+
+
+-- 协作者 -> editor/viewer 成员；所有者的 owner 记录不会被协作者记录覆盖或删除
+CREATE OR REPLACE FUNCTION public.sync_trip_collaborator_membership()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM public.trip_members
+        WHERE trip_id = OLD.trip_id AND user_id = OLD.user_id AND access_level <> 'owner';
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO public.trip_members (user_id, trip_id, access_level, trip_created_at)
+        SELECT NEW.user_id, NEW.trip_id, NEW.access_level, t.created_at
+        FROM public.trips t
+        WHERE t.id = NEW.trip_id
+        ON CONFLICT (user_id, trip_id) DO UPDATE
+        SET access_level = EXCLUDED.access_level
+        WHERE public.trip_members.access_level <> 'owner';
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE TRIGGER sync_trip_collaborator_membership
+    AFTER INSERT OR UPDATE OR DELETE ON public.trip_collaborators
+    FOR EACH ROW
+    EXECUTE FUNCTION public.sync_trip_collaborator_membership();
+
+
+-- 回填已有数据
+INSERT INTO public.trip_members (user_id, trip_id, access_level, trip_created_at)
+SELECT user_id, id, 'owner', created_at FROM public.trips
+ON CONFLICT (user_id, trip_id) DO NOTHING;
+
+INSERT INTO public.trip_members (user_id, trip_id, access_level, trip_created_at)
+SELECT c.user_id, c.trip_id, c.access_level, t.created_at
+FROM public.trip_collaborators c
+JOIN public.trips t ON t.id = c.trip_id
+ON CONFLICT (user_id, trip_id) DO NOTHING;
+
+
+-- 按 (created_at, id) 倒序列出用户拥有或参与的行程（游标分页）。
+-- 返回 SETOF trips，调用方仍可通过 PostgREST 的 select= 做字段投影和嵌入 trip_collaborators。
+CREATE OR REPLACE FUNCTION public.list_user_trips(
+    p_user_id uuid,
+    p_limit int DEFAULT 50,
+    p_cursor_created_at timestamptz DEFAULT NULL,
+    p_cursor_id uuid DEFAULT NULL
+)
+RETURNS SETOF public.trips AS $$
+BEGIN
+    -- Security Check: 只能列出自己的行程
+    IF p_user_id IS DISTINCT FROM auth.uid() AND auth.role() <> 'service_role' THEN
+        RAISE EXCEPTION 'Permission denied: cannot list trips of user %.', p_user_id;
+    END IF;
+
+    IF p_cursor_created_at IS NULL THEN
+        RETURN QUERY
+        SELECT t.*
+        FROM public.trip_members m
+        JOIN public.trips t ON t.id = m.trip_id
+        WHERE m.user_id = p_user_id
+        ORDER BY m.trip_created_at DESC, m.trip_id DESC
+        LIMIT p_limit;
+    ELSE
+        RETURN QUERY
+        SELECT t.*
+        FROM public.trip_members m
+        JOIN public.trips t ON t.id = m.trip_id
+        WHERE m.user_id = p_user_id
+          AND (m.trip_created_at, m.trip_id) < (p_cursor_created_at, p_cursor_id)
+        ORDER BY m.trip_created_at DESC, m.trip_id DESC
+        LIMIT p_limit;
+    END IF;
+END;
+$$ LANGUAGE plpgsql STABLE SECURITY DEFINER SET search_path = public;
@@ -0,0 +1,110 @@
+-- 批量修改行程日程项目：一次请求、一次事务执行多个 create/update/delete/move 操作。
+-- 行程编辑器的一次拖拽/编辑会话不再需要为每个项目单独发请求并重复做权限校验；
+-- 任一操作失败时整个函数回滚，不会留下部分修改。
+--
+-- p_operations 为 JSON 数组，每个元素:
+--   {"op": "create", "day_id": ..., "name": ..., "time": ..., "type": ..., "notes": ..., "sort_order": ..., "client_id": ...}
+--   {"op": "update", "id": ..., 以及要修改的 name/time/type/notes/sort_order}
+--   {"op": "move",   "id": ..., "day_id": ..., "sort_order": ...}
+--   {"op": "delete", "id": ...}
+-- 返回与输入顺序一致的结果数组: [{"index": 0, "op": "create", "id": ..., "client_id": ...}, ...]
+
+CREATE OR REPLACE FUNCTION public.apply_itinerary_batch(
+    p_trip_id uuid,
+    p_user_id uuid,
+    p_operations jsonb
+)
+RETURNS jsonb AS $$
+DECLARE
+    v_op jsonb;
+    v_index int := 0;
+    v_item_id uuid;
+    v_day_id uuid;
+    v_results jsonb := '[]'::jsonb;
+BEGIN
+    -- 1. Security Check: 调用者只能以自己的身份操作，且必须是行程所有者或 editor 协作者
+    IF p_user_id IS DISTINCT FROM auth.uid() AND auth.role() <> 'service_role' THEN
+        RAISE EXCEPTION 'Permission denied: cannot act as user %.', p_user_id USING ERRCODE = '42501';
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM public.trips WHERE id = p_trip_id) THEN
+        RAISE EXCEPTION 'Trip % not found.', p_trip_id USING ERRCODE = 'P0002';
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM public.trip_members
+        WHERE trip_id = p_trip_id AND user_id = p_user_id AND access_level IN ('owner', 'editor')
+    ) THEN
+        RAISE EXCEPTION 'Permission denied: User % cannot edit trip %.', p_user_id, p_trip_id USING ERRCODE = '42501';
+    END IF;
+
+    -- 2. 按顺序执行每个操作
+    FOR v_op IN SELECT * FROM jsonb_array_elements(p_operations)
+    LOOP
+        v_item_id := (v_op->>'id')::uuid;
+        v_day_id := (v_op->>'day_id')::uuid;
+
+        -- 目标日程天必须属于该行程
+        IF v_day_id IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM public.itinerary_days WHERE id = v_day_id AND trip_id = p_trip_id
+        ) THEN
+            RAISE EXCEPTION 'Operation %: itinerary day % not found in trip %.', v_index, v_day_id, p_trip_id USING ERRCODE = 'P0002';
+        END IF;
+
+        -- 被修改的项目必须属于该行程
+        IF v_item_id IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM public.itinerary_items i
+            JOIN public.itinerary_days d ON d.id = i.day_id
+            WHERE i.id = v_item_id AND d.trip_id = p_trip_id
+        ) THEN
+            RAISE EXCEPTION 'Operation %: itinerary item % not found in trip %.', v_index, v_item_id, p_trip_id USING ERRCODE = 'P0002';
+        END IF;
+
+        CASE v_op->>'op'
+        WHEN 'create' THEN
+            INSERT INTO public.itinerary_items (day_id, name, time, type, notes, sort_order)
+            VALUES (
+                v_day_id,
+                v_op->>'name',
+                v_op->>'time',
+                COALESCE(v_op->>'type', 'custom'),
+                v_op->>'notes',
+                COALESCE((v_op->>'sort_order')::int, 0)
+            )
+            RETURNING id INTO v_item_id;
+
+        WHEN 'update' THEN
+            -- 只更新请求中出现的字段，与 PATCH /items/{item_id} 的语义一致
+            UPDATE public.itinerary_items
+            SET name = CASE WHEN v_op ? 'name' THEN v_op->>'name' ELSE name END,
+                time = CASE WHEN v_op ? 'time' THEN v_op->>'time' ELSE time END,
+                type = CASE WHEN v_op ? 'type' THEN v_op->>'type' ELSE type END,
+                notes = CASE WHEN v_op ? 'notes' THEN v_op->>'notes' ELSE notes END,
+                sort_order = CASE WHEN v_op ? 'sort_order' THEN (v_op->>'sort_order')::int ELSE sort_order END
+            WHERE id = v_item_id;
+
+        WHEN 'move' THEN
+            UPDATE public.itinerary_items
+            SET day_id = COALESCE(v_day_id, day_id),
+                sort_order = CASE WHEN v_op ? 'sort_order' THEN (v_op->>'sort_order')::int ELSE sort_order END
+            WHERE id = v_item_id;
+
+        WHEN 'delete' THEN
+            DELETE FROM public.itinerary_items WHERE id = v_item_id;
+
+        ELSE
+            RAISE EXCEPTION 'Operation %: unknown op %.', v_index, v_op->>'op' USING ERRCODE = '22023';
+        END CASE;
+
+        v_results := v_results || jsonb_build_object(
+            'index', v_index,
+            'op', v_op->>'op',
+            'id', v_item_id,
+            'client_id', v_op->'client_id'
+        );
+        v_index := v_index + 1;
+    END LOOP;
+
+    RETURN v_results;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
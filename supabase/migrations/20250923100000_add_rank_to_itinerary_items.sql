@@ -0,0 +1,196 @@
+-- 日程项目的分数排序键（fractional index）
+--
+-- itinerary_items.sort_order 是整数，重新排序一天的项目需要逐行改写很多行。
+-- rank 是 base-62 的小数字符串（见 backend/app/utils/rank.py），按字节序比较：
+-- 在两个相邻项目之间插入/移动时只需要给被移动的那一行写一个新的 rank。
+-- 键变得过长时，后端会在后台把整天的 rank 重新均匀分布。
+
+ALTER TABLE public.itinerary_items ADD COLUMN IF NOT EXISTS rank TEXT COLLATE "C";
+
+-- 与 app.utils.rank.rank_sequence 相同：p_count 个等宽、均匀分布的键中的第 p_index 个
+CREATE OR REPLACE FUNCTION public.itinerary_rank_key(p_index int, p_count int)
+RETURNS text AS $$
+DECLARE
+    v_alphabet text := '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz';
+    v_width int := 1;
+    v_value numeric;
+    v_key text := '';
+BEGIN
+    WHILE 62::numeric ^ v_width < (p_count + 1)::numeric * 62 LOOP
+        v_width := v_width + 1;
+    END LOOP;
+    v_value := floor(62::numeric ^ v_width / (p_count + 1)) * p_index;
+    FOR i IN 1..v_width LOOP
+        v_key := substr(v_alphabet, (v_value % 62)::int + 1, 1) || v_key;
+        v_value := floor(v_value / 62);
+    END LOOP;
+    RETURN rtrim(v_key, '0');
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+-- 与 app.utils.rank.rank_between(p_rank, None) 相同：紧跟在 p_rank 之后的键
+CREATE OR REPLACE FUNCTION public.itinerary_rank_after(p_rank text)
+RETURNS text AS $$
+DECLARE
+    v_alphabet text := '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz';
+    v_prefix text := '';
+    v_rest text := COALESCE(p_rank, '');
+    v_digit int;
+BEGIN
+    LOOP
+        IF v_rest = '' THEN
+            RETURN v_prefix || 'V';
+        END IF;
+        v_digit := strpos(v_alphabet, left(v_rest, 1)) - 1;
+        IF v_digit < 61 THEN
+            RETURN v_prefix || substr(v_alphabet, (v_digit + 62 + 1) / 2 + 1, 1);
+        END IF;
+        v_prefix := v_prefix || 'z';
+        v_rest := substr(v_rest, 2);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+-- 回填：每天按原 sort_order 的顺序均匀分布
+UPDATE public.itinerary_items i
+SET rank = public.itinerary_rank_key(r.position, r.total)
+FROM (
+    SELECT id,
+           row_number() OVER (PARTITION BY day_id ORDER BY sort_order, id)::int AS position,
+           count(*) OVER (PARTITION BY day_id)::int AS total
+    FROM public.itinerary_items
+) r
+WHERE i.id = r.id AND i.rank IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_itinerary_items_day_rank
+    ON public.itinerary_items (day_id, rank);
+
+-- 插入时未指定 rank 的项目追加到当天末尾
+CREATE OR REPLACE FUNCTION public.set_itinerary_item_rank()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.rank IS NULL THEN
+        SELECT public.itinerary_rank_after(max(rank)) INTO NEW.rank
+        FROM public.itinerary_items
+        WHERE day_id = NEW.day_id;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER set_itinerary_item_rank
+    BEFORE INSERT ON public.itinerary_items
+    FOR EACH ROW
+    EXECUTE FUNCTION public.set_itinerary_item_rank();
+
+
+-- apply_itinerary_batch: create/update/move 支持 rank。
+-- 天内顺序只由 rank 决定，sort_order 不再写入：update/move 中出现 sort_order 时报错，避免客户端以为排序成功
+CREATE OR REPLACE FUNCTION public.apply_itinerary_batch(
+    p_trip_id uuid,
+    p_user_id uuid,
+    p_operations jsonb
+)
+RETURNS jsonb AS $$
+DECLARE
+    v_op jsonb;
+    v_index int := 0;
+    v_item_id uuid;
+    v_day_id uuid;
+    v_results jsonb := '[]'::jsonb;
+BEGIN
+    -- 1. Security Check: 调用者只能以自己的身份操作，且必须是行程所有者或 editor 协作者
+    IF p_user_id IS DISTINCT FROM auth.uid() AND auth.role() <> 'service_role' THEN
+        RAISE EXCEPTION 'Permission denied: cannot act as user %.', p_user_id USING ERRCODE = '42501';
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM public.trips WHERE id = p_trip_id) THEN
+        RAISE EXCEPTION 'Trip % not found.', p_trip_id USING ERRCODE = 'P0002';
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM public.trip_members
+        WHERE trip_id = p_trip_id AND user_id = p_user_id AND access_level IN ('owner', 'editor')
+    ) THEN
+        RAISE EXCEPTION 'Permission denied: User % cannot edit trip %.', p_user_id, p_trip_id USING ERRCODE = '42501';
+    END IF;
+
+    -- 2. 按顺序执行每个操作
+    FOR v_op IN SELECT * FROM jsonb_array_elements(p_operations)
+    LOOP
+        v_item_id := (v_op->>'id')::uuid;
+        v_day_id := (v_op->>'day_id')::uuid;
+
+        -- 目标日程天必须属于该行程
+        IF v_day_id IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM public.itinerary_days WHERE id = v_day_id AND trip_id = p_trip_id
+        ) THEN
+            RAISE EXCEPTION 'Operation %: itinerary day % not found in trip %.', v_index, v_day_id, p_trip_id USING ERRCODE = 'P0002';
+        END IF;
+
+        -- 被修改的项目必须属于该行程
+        IF v_item_id IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM public.itinerary_items i
+            JOIN public.itinerary_days d ON d.id = i.day_id
+            WHERE i.id = v_item_id AND d.trip_id = p_trip_id
+        ) THEN
+            RAISE EXCEPTION 'Operation %: itinerary item % not found in trip %.', v_index, v_item_id, p_trip_id USING ERRCODE = 'P0002';
+        END IF;
+
+        IF v_op ? 'sort_order' THEN
+            RAISE EXCEPTION 'Operation %: sort_order is no longer supported, use rank.', v_index USING ERRCODE = '22023';
+        END IF;
+
+        IF v_op->>'op' = 'move' AND NOT (v_op ? 'day_id' OR v_op ? 'rank') THEN
+            RAISE EXCEPTION 'Operation %: move requires day_id or rank.', v_index USING ERRCODE = '22023';
+        END IF;
+
+        CASE v_op->>'op'
+        WHEN 'create' THEN
+            -- 未指定 rank 时由 set_itinerary_item_rank 触发器追加到当天末尾
+            INSERT INTO public.itinerary_items (day_id, name, time, type, notes, rank)
+            VALUES (
+                v_day_id,
+                v_op->>'name',
+                v_op->>'time',
+                COALESCE(v_op->>'type', 'custom'),
+                v_op->>'notes',
+                v_op->>'rank'
+            )
+            RETURNING id INTO v_item_id;
+
+        WHEN 'update' THEN
+            -- 只更新请求中出现的字段，与 PATCH /items/{item_id} 的语义一致
+            UPDATE public.itinerary_items
+            SET name = CASE WHEN v_op ? 'name' THEN v_op->>'name' ELSE name END,
+                time = CASE WHEN v_op ? 'time' THEN v_op->>'time' ELSE time END,
+                type = CASE WHEN v_op ? 'type' THEN v_op->>'type' ELSE type END,
+                notes = CASE WHEN v_op ? 'notes' THEN v_op->>'notes' ELSE notes END,
+                rank = CASE WHEN v_op ? 'rank' THEN v_op->>'rank' ELSE rank END
+            WHERE id = v_item_id;
+
+        WHEN 'move' THEN
+            UPDATE public.itinerary_items
+            SET day_id = COALESCE(v_day_id, day_id),
+                rank = CASE WHEN v_op ? 'rank' THEN v_op->>'rank' ELSE rank END
+            WHERE id = v_item_id;
+
+        WHEN 'delete' THEN
+            DELETE FROM public.itinerary_items WHERE id = v_item_id;
+
+        ELSE
+            RAISE EXCEPTION 'Operation %: unknown op %.', v_index, v_op->>'op' USING ERRCODE = '22023';
+        END CASE;
+
+        v_results := v_results || jsonb_build_object(
+            'index', v_index,
+            'op', v_op->>'op',
+            'id', v_item_id,
+            'client_id', v_op->'client_id'
+        );
+        v_index := v_index + 1;
+    END LOOP;
+
+    RETURN v_results;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
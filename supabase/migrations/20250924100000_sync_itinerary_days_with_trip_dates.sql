@@ -0,0 +1,105 @@
+-- 根据行程日期范围在服务端批量生成/平移日程天
+--
+-- 之前客户端需要为每一天单独调用 POST /trips/{trip_id}/days（14 天的行程就是 14 个串行请求），
+-- 删除某一天后 day_number 也不会重新编号。
+-- 现在由触发器在同一事务中完成：
+--   * 创建行程、修改 start_date/end_date 时，按日期范围一次性插入缺少的天，
+--     已有的天按原顺序重新编号并平移到新的日期；
+--     范围缩短时删除多出来的空白天（有项目的天保留在末尾，避免丢失用户内容）。
+--   * 删除某一天时，之后的天依次前移（day_number 和 date 一起），末尾补上空白天。
+-- 有日期范围的行程，日程天只由 start_date/end_date 决定：始终满足 date = start_date + day_number - 1，
+-- 天数等于范围内的天数（加上保留下来的有项目的天）。POST /trips/{trip_id}/days 因此只用于没有日期范围的行程。
+
+CREATE OR REPLACE FUNCTION public.sync_trip_itinerary_days(
+    p_trip_id uuid,
+    p_start_date date,
+    p_end_date date
+)
+RETURNS void AS $$
+DECLARE
+    v_total int;
+BEGIN
+    IF p_start_date IS NULL OR p_end_date IS NULL OR p_end_date < p_start_date THEN
+        RETURN;
+    END IF;
+    v_total := p_end_date - p_start_date + 1;
+
+    -- 1. 删除超出新范围的空白天
+    DELETE FROM public.itinerary_days d
+    WHERE d.trip_id = p_trip_id
+      AND d.day_number > v_total
+      AND NOT EXISTS (SELECT 1 FROM public.itinerary_items i WHERE i.day_id = d.id);
+
+    -- 2. 已有的天按原顺序重新编号，并平移到新的日期
+    UPDATE public.itinerary_days d
+    SET day_number = r.position,
+        date = p_start_date + (r.position - 1)
+    FROM (
+        SELECT id, row_number() OVER (ORDER BY day_number, date, id)::int AS position
+        FROM public.itinerary_days
+        WHERE trip_id = p_trip_id
+    ) r
+    WHERE d.id = r.id
+      AND (d.day_number IS DISTINCT FROM r.position OR d.date::date IS DISTINCT FROM p_start_date + (r.position - 1));
+
+    -- 3. 一次性插入缺少的天
+    INSERT INTO public.itinerary_days (trip_id, day_number, date)
+    SELECT p_trip_id, n, p_start_date + (n - 1)
+    FROM generate_series(
+        (SELECT COUNT(*) FROM public.itinerary_days WHERE trip_id = p_trip_id)::int + 1,
+        v_total
+    ) AS n;
+END;
+$$ LANGUAGE plpgsql SECURITY INVOKER SET search_path = public;
+
+-- 只由下面的触发器函数（SECURITY DEFINER）调用，不通过 /rpc 暴露给客户端
+REVOKE EXECUTE ON FUNCTION public.sync_trip_itinerary_days(uuid, date, date) FROM PUBLIC, anon, authenticated;
+
+CREATE OR REPLACE FUNCTION public.sync_trip_itinerary_days_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT'
+       OR NEW.start_date IS DISTINCT FROM OLD.start_date
+       OR NEW.end_date IS DISTINCT FROM OLD.end_date THEN
+        PERFORM public.sync_trip_itinerary_days(NEW.id, NEW.start_date::date, NEW.end_date::date);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE TRIGGER sync_trip_itinerary_days
+    AFTER INSERT OR UPDATE OF start_date, end_date ON public.trips
+    FOR EACH ROW
+    EXECUTE FUNCTION public.sync_trip_itinerary_days_trigger();
+
+
+-- 删除某一天后，把之后的天依次前移
+CREATE OR REPLACE FUNCTION public.renumber_itinerary_days_after_delete()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_trip public.trips%ROWTYPE;
+BEGIN
+    -- 级联删除整个行程时不需要重新编号
+    SELECT * INTO v_trip FROM public.trips WHERE id = OLD.trip_id;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+
+    -- 有日期范围：按范围重新编号、平移日期，并在末尾补上缺少的天
+    IF v_trip.start_date IS NOT NULL AND v_trip.end_date IS NOT NULL THEN
+        PERFORM public.sync_trip_itinerary_days(v_trip.id, v_trip.start_date::date, v_trip.end_date::date);
+        RETURN NULL;
+    END IF;
+
+    UPDATE public.itinerary_days
+    SET day_number = day_number - 1
+    WHERE trip_id = OLD.trip_id AND day_number > OLD.day_number;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE TRIGGER renumber_itinerary_days_after_delete
+    AFTER DELETE ON public.itinerary_days
+    FOR EACH ROW
+    EXECUTE FUNCTION public.renumber_itinerary_days_after_delete();
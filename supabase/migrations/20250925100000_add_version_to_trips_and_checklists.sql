@@ -0,0 +1,101 @@
+-- 行程 / 清单文档的版本号，用于 ETag 条件请求
+--
+-- trips.version 和 checklists.version 在整棵文档（行程: 日程天、日程项目、协作者；
+-- 清单: 分类、项目）任意一行变化时加一。GET 详情接口只需读取这一列就能判断
+-- 客户端缓存的 ETag 是否仍然有效，命中时直接返回 304，不再执行深层嵌入查询。
+-- 注意：协作者的 users(name, avatar_url) 资料变化不会改变行程版本，因此后端使用弱 ETag (W/"...")。
+
+ALTER TABLE public.trips ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 1;
+ALTER TABLE public.checklists ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 1;
+
+-- 文档根自身被修改时加一（子表触发的加一也会经过这里，只是多加一次，不影响比较）
+CREATE OR REPLACE FUNCTION public.bump_document_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.version := OLD.version + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER bump_trips_version
+    BEFORE UPDATE ON public.trips
+    FOR EACH ROW
+    EXECUTE FUNCTION public.bump_document_version();
+
+CREATE TRIGGER bump_checklists_version
+    BEFORE UPDATE ON public.checklists
+    FOR EACH ROW
+    EXECUTE FUNCTION public.bump_document_version();
+
+
+-- 行程子表：itinerary_days / trip_collaborators 直接带 trip_id，itinerary_items 通过 day_id 找到行程
+CREATE OR REPLACE FUNCTION public.bump_trip_version()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_row record := CASE WHEN TG_OP = 'DELETE' THEN OLD ELSE NEW END;
+    v_trip_ids uuid[];
+BEGIN
+    IF TG_TABLE_NAME = 'itinerary_items' THEN
+        SELECT array_agg(DISTINCT trip_id) INTO v_trip_ids
+        FROM public.itinerary_days
+        WHERE id IN (v_row.day_id, CASE WHEN TG_OP = 'UPDATE' THEN OLD.day_id END);
+    ELSE
+        v_trip_ids := ARRAY[v_row.trip_id];
+        IF TG_OP = 'UPDATE' AND OLD.trip_id IS DISTINCT FROM NEW.trip_id THEN
+            v_trip_ids := v_trip_ids || OLD.trip_id;
+        END IF;
+    END IF;
+
+    UPDATE public.trips SET version = version + 1 WHERE id = ANY(v_trip_ids);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE TRIGGER bump_trip_version
+    AFTER INSERT OR UPDATE OR DELETE ON public.itinerary_days
+    FOR EACH ROW
+    EXECUTE FUNCTION public.bump_trip_version();
+
+CREATE TRIGGER bump_trip_version
+    AFTER INSERT OR UPDATE OR DELETE ON public.itinerary_items
+    FOR EACH ROW
+    EXECUTE FUNCTION public.bump_trip_version();
+
+CREATE TRIGGER bump_trip_version
+    AFTER INSERT OR UPDATE OR DELETE ON public.trip_collaborators
+    FOR EACH ROW
+    EXECUTE FUNCTION public.bump_trip_version();
+
+
+-- 清单子表：checklist_categories 直接带 checklist_id，checklist_items 通过 category_id 找到清单
+CREATE OR REPLACE FUNCTION public.bump_checklist_version()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_row record := CASE WHEN TG_OP = 'DELETE' THEN OLD ELSE NEW END;
+    v_checklist_ids uuid[];
+BEGIN
+    IF TG_TABLE_NAME = 'checklist_items' THEN
+        SELECT array_agg(DISTINCT checklist_id) INTO v_checklist_ids
+        FROM public.checklist_categories
+        WHERE id IN (v_row.category_id, CASE WHEN TG_OP = 'UPDATE' THEN OLD.category_id END);
+    ELSE
+        v_checklist_ids := ARRAY[v_row.checklist_id];
+        IF TG_OP = 'UPDATE' AND OLD.checklist_id IS DISTINCT FROM NEW.checklist_id THEN
+            v_checklist_ids := v_checklist_ids || OLD.checklist_id;
+        END IF;
+    END IF;
+
+    UPDATE public.checklists SET version = version + 1 WHERE id = ANY(v_checklist_ids);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE TRIGGER bump_checklist_version
+    AFTER INSERT OR UPDATE OR DELETE ON public.checklist_categories
+    FOR EACH ROW
+    EXECUTE FUNCTION public.bump_checklist_version();
+
+CREATE TRIGGER bump_checklist_version
+    AFTER INSERT OR UPDATE OR DELETE ON public.checklist_items
+    FOR EACH ROW
+    EXECUTE FUNCTION public.bump_checklist_version();
@@ -0,0 +1,75 @@
+-- 行程变更通知，供 GET /trips/{trip_id}/events（SSE）使用
+--
+-- 后端在 TRIP_EVENTS_BACKEND=postgres 时 LISTEN trip_events，把通知转发给正在查看该行程的协作者。
+-- 通知内容只包含变化的这一行（与后端 local 模式发布的事件字段相同）:
+--   {"trip_id": ..., "type": "item.updated", "data": {"id": ..., "day_id": ..., ...}}
+-- NOTIFY 在事务提交后才会送达，回滚的修改不会被推送。
+
+CREATE OR REPLACE FUNCTION public.notify_trip_event()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_row record := CASE WHEN TG_OP = 'DELETE' THEN OLD ELSE NEW END;
+    v_action text := CASE TG_OP WHEN 'INSERT' THEN 'created' WHEN 'UPDATE' THEN 'updated' ELSE 'deleted' END;
+    v_trip_id uuid;
+    v_kind text;
+    v_data jsonb;
+    v_payload text;
+BEGIN
+    IF TG_TABLE_NAME = 'trips' THEN
+        v_trip_id := v_row.id;
+        v_kind := 'trip';
+        v_data := CASE WHEN TG_OP = 'DELETE' THEN jsonb_build_object('id', v_row.id)
+            ELSE jsonb_build_object(
+                'id', v_row.id, 'name', v_row.name, 'destination', v_row.destination,
+                'start_date', v_row.start_date, 'end_date', v_row.end_date,
+                'description', v_row.description, 'status', v_row.status, 'thumbnail', v_row.thumbnail
+            ) END;
+    ELSIF TG_TABLE_NAME = 'itinerary_days' THEN
+        v_trip_id := v_row.trip_id;
+        v_kind := 'day';
+        v_data := CASE WHEN TG_OP = 'DELETE' THEN jsonb_build_object('id', v_row.id)
+            ELSE jsonb_build_object('id', v_row.id, 'day_number', v_row.day_number, 'date', v_row.date, 'title', v_row.title) END;
+    ELSE
+        SELECT trip_id INTO v_trip_id FROM public.itinerary_days WHERE id = v_row.day_id;
+        v_kind := 'item';
+        v_data := CASE WHEN TG_OP = 'DELETE' THEN jsonb_build_object('id', v_row.id, 'day_id', v_row.day_id)
+            ELSE jsonb_build_object(
+                'id', v_row.id, 'day_id', v_row.day_id, 'time', v_row.time, 'type', v_row.type,
+                'name', v_row.name, 'notes', v_row.notes, 'rank', v_row.rank
+            ) END;
+    END IF;
+
+    -- 整个行程被级联删除时，日程天/项目的删除不再单独通知（trip.deleted 已经足够）
+    IF v_trip_id IS NULL OR (TG_TABLE_NAME <> 'trips' AND NOT EXISTS (SELECT 1 FROM public.trips WHERE id = v_trip_id)) THEN
+        RETURN NULL;
+    END IF;
+
+    v_payload := jsonb_build_object('trip_id', v_trip_id, 'type', v_kind || '.' || v_action, 'data', v_data)::text;
+    -- NOTIFY 的内容上限约 8000 字节（长备注等）：只发送ID，客户端据此重新拉取
+    IF octet_length(v_payload) > 7900 THEN
+        v_payload := jsonb_build_object(
+            'trip_id', v_trip_id, 'type', v_kind || '.' || v_action,
+            'data', jsonb_build_object('id', v_row.id, 'partial', true)
+        )::text;
+    END IF;
+
+    PERFORM pg_notify('trip_events', v_payload);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- 只通知用户可见字段的变化（version 自增、updated_at 之类的更新不推送）
+CREATE TRIGGER notify_trip_event
+    AFTER UPDATE OF name, destination, start_date, end_date, description, status, thumbnail OR DELETE ON public.trips
+    FOR EACH ROW
+    EXECUTE FUNCTION public.notify_trip_event();
+
+CREATE TRIGGER notify_trip_event
+    AFTER INSERT OR UPDATE OR DELETE ON public.itinerary_days
+    FOR EACH ROW
+    EXECUTE FUNCTION public.notify_trip_event();
+
+CREATE TRIGGER notify_trip_event
+    AFTER INSERT OR UPDATE OR DELETE ON public.itinerary_items
+    FOR EACH ROW
+    EXECUTE FUNCTION public.notify_trip_event();
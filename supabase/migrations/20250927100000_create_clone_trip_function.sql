@@ -0,0 +1,81 @@
+-- 服务端深拷贝行程：一次调用复制行程、日程天和日程项目
+--
+-- 之前客户端需要先读取行程详情，再逐行调用 create_trip / add_itinerary_day / add_itinerary_item，
+-- 20 天的行程就是几百次往返。这里全部用集合操作完成：
+--   1. 插入新行程（sync_trip_itinerary_days 触发器按日期范围生成日程天）
+--   2. 按 day_number 把源行程的标题复制到新生成的天上；源行程中超出日期范围的天（保留的有项目的天）补插到末尾
+--   3. 一条 INSERT ... SELECT 复制所有日程项目（保留 rank，顺序不变）
+-- 传入 p_start_date 时整个行程平移到新的开始日期，时长不变。
+-- 协作者不复制，新行程属于调用者。
+
+CREATE OR REPLACE FUNCTION public.clone_trip(
+    p_trip_id uuid,
+    p_user_id uuid,
+    p_start_date date DEFAULT NULL,
+    p_name text DEFAULT NULL
+)
+RETURNS public.trips AS $$
+DECLARE
+    v_source public.trips;
+    v_trip public.trips;
+    v_start date;
+BEGIN
+    -- 1. Security Check: 调用者只能以自己的身份操作，且必须能查看源行程
+    IF p_user_id IS DISTINCT FROM auth.uid() AND auth.role() <> 'service_role' THEN
+        RAISE EXCEPTION 'Permission denied: cannot act as user %.', p_user_id USING ERRCODE = '42501';
+    END IF;
+
+    SELECT * INTO v_source FROM public.trips WHERE id = p_trip_id;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Trip % not found.', p_trip_id USING ERRCODE = 'P0002';
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM public.trip_members WHERE trip_id = p_trip_id AND user_id = p_user_id) THEN
+        RAISE EXCEPTION 'Permission denied: User % cannot access trip %.', p_user_id, p_trip_id USING ERRCODE = '42501';
+    END IF;
+
+    -- 2. 新行程（日期按 p_start_date 平移）
+    v_start := COALESCE(p_start_date, v_source.start_date::date);
+    INSERT INTO public.trips (user_id, name, destination, description, status, thumbnail, start_date, end_date)
+    VALUES (
+        p_user_id,
+        COALESCE(p_name, v_source.name || ' (copy)'),
+        v_source.destination,
+        v_source.description,
+        'Not Started',
+        v_source.thumbnail,
+        v_start,
+        v_start + (v_source.end_date::date - v_source.start_date::date)
+    )
+    RETURNING * INTO v_trip;
+
+    -- 3. 日程天：触发器已按日期范围生成，复制标题；补插超出范围的天
+    UPDATE public.itinerary_days d
+    SET title = s.title
+    FROM public.itinerary_days s
+    WHERE s.trip_id = p_trip_id
+      AND d.trip_id = v_trip.id
+      AND d.day_number = s.day_number
+      AND s.title IS NOT NULL;
+
+    INSERT INTO public.itinerary_days (trip_id, day_number, date, title)
+    SELECT v_trip.id, s.day_number, v_start + (s.day_number - 1), s.title
+    FROM public.itinerary_days s
+    WHERE s.trip_id = p_trip_id
+      AND NOT EXISTS (
+          SELECT 1 FROM public.itinerary_days d WHERE d.trip_id = v_trip.id AND d.day_number = s.day_number
+      );
+
+    -- 4. 日程项目：一次性复制到对应 day_number 的新日程天
+    INSERT INTO public.itinerary_items (day_id, name, time, type, notes, sort_order, rank)
+    SELECT d.id, i.name, i.time, i.type, i.notes, i.sort_order, i.rank
+    FROM public.itinerary_items i
+    JOIN public.itinerary_days s ON s.id = i.day_id
+    JOIN public.itinerary_days d ON d.trip_id = v_trip.id AND d.day_number = s.day_number
+    WHERE s.trip_id = p_trip_id;
+
+    -- 重新读取，返回触发器更新后的 version
+    SELECT * INTO v_trip FROM public.trips WHERE id = v_trip.id;
+    RETURN v_trip;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
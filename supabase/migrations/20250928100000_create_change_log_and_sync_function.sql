@@ -0,0 +1,244 @@
+-- 增量同步：变更日志 + sync_changes RPC（GET /sync?since=...）
+--
+-- 客户端之前只能完整重新下载 GET /trips/ 和 GET /checklists/ 来检查更新。
+-- 现在 trips / itinerary_days / itinerary_items / checklists / checklist_categories / checklist_items
+-- 的每次增删改都由触发器写入 change_log；客户端带上上次的水位线，只取回之后变化的行和删除的ID。
+--
+-- 水位线使用事务ID（xid8）而不是自增序号：序号在插入时分配、提交顺序却可能不同，
+-- 按序号推进水位线会漏掉提交较晚的小序号。sync_changes 只返回 txid 小于当前快照 xmin 的记录
+-- （这些事务一定已经结束），新的水位线就是这个 xmin，因此不会漏掉也不会重复。
+--
+-- 可见性:
+--   行程相关的行 (user_id 为空) 按 trip_members 判断当前用户是否仍是成员；
+--   清单相关的行、协作者变更、行程删除 (user_id 不为空) 只对该用户可见。
+-- 被加入一个已有行程时，协作者变更会让下一次同步返回整个行程；被移除或行程被删除时返回行程的删除记录。
+
+CREATE TABLE IF NOT EXISTS public.change_log (
+    seq BIGSERIAL PRIMARY KEY,
+    txid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+    table_name TEXT NOT NULL,
+    row_id UUID NOT NULL,
+    op CHAR(1) NOT NULL,   -- I / U / D
+    trip_id UUID,          -- 行程相关的行
+    user_id UUID,          -- 只对该用户可见的记录
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+COMMENT ON TABLE public.change_log IS 'Row-level change log for delta sync, written by triggers and read by sync_changes().';
+
+CREATE INDEX IF NOT EXISTS idx_change_log_txid ON public.change_log (txid);
+
+-- 只通过 SECURITY DEFINER 函数访问
+ALTER TABLE public.change_log ENABLE ROW LEVEL SECURITY;
+
+-- 为已有数据写入初始记录，since=0 的首次同步才能拿到全部数据
+INSERT INTO public.change_log (table_name, row_id, op, trip_id, user_id)
+SELECT 'trips', id, 'I', id, NULL FROM public.trips
+UNION ALL
+SELECT 'itinerary_days', id, 'I', trip_id, NULL FROM public.itinerary_days
+UNION ALL
+SELECT 'itinerary_items', i.id, 'I', d.trip_id, NULL
+FROM public.itinerary_items i JOIN public.itinerary_days d ON d.id = i.day_id
+UNION ALL
+SELECT 'checklists', id, 'I', NULL, user_id FROM public.checklists
+UNION ALL
+SELECT 'checklist_categories', cat.id, 'I', NULL, c.user_id
+FROM public.checklist_categories cat JOIN public.checklists c ON c.id = cat.checklist_id
+UNION ALL
+SELECT 'checklist_items', ci.id, 'I', NULL, c.user_id
+FROM public.checklist_items ci
+JOIN public.checklist_categories cat ON cat.id = ci.category_id
+JOIN public.checklists c ON c.id = cat.checklist_id;
+
+
+CREATE OR REPLACE FUNCTION public.log_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_row record := CASE WHEN TG_OP = 'DELETE' THEN OLD ELSE NEW END;
+    v_trip_id uuid;
+    v_user_id uuid;
+BEGIN
+    CASE TG_TABLE_NAME
+    WHEN 'trips' THEN
+        v_trip_id := v_row.id;
+    WHEN 'itinerary_days' THEN
+        v_trip_id := v_row.trip_id;
+    WHEN 'itinerary_items' THEN
+        SELECT trip_id INTO v_trip_id FROM public.itinerary_days WHERE id = v_row.day_id;
+    WHEN 'trip_collaborators' THEN
+        v_trip_id := v_row.trip_id;
+        v_user_id := v_row.user_id;
+    WHEN 'checklists' THEN
+        v_user_id := v_row.user_id;
+    WHEN 'checklist_categories' THEN
+        SELECT user_id INTO v_user_id FROM public.checklists WHERE id = v_row.checklist_id;
+    WHEN 'checklist_items' THEN
+        SELECT c.user_id INTO v_user_id
+        FROM public.checklist_categories cat
+        JOIN public.checklists c ON c.id = cat.checklist_id
+        WHERE cat.id = v_row.category_id;
+    END CASE;
+
+    -- 上级已被级联删除（整个行程/清单被删除），由上级的删除记录覆盖
+    IF v_trip_id IS NULL AND v_user_id IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO public.change_log (table_name, row_id, op, trip_id, user_id)
+    VALUES (TG_TABLE_NAME, v_row.id, left(TG_OP, 1), v_trip_id, v_user_id);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- 行程删除时成员关系会被级联删除，因此在 BEFORE DELETE 中为每个成员各写一条删除记录
+CREATE OR REPLACE FUNCTION public.log_trip_delete()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO public.change_log (table_name, row_id, op, trip_id, user_id)
+    SELECT 'trips', OLD.id, 'D', OLD.id, m.user_id
+    FROM public.trip_members m
+    WHERE m.trip_id = OLD.id;
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE TRIGGER log_change
+    AFTER INSERT OR UPDATE ON public.trips
+    FOR EACH ROW
+    EXECUTE FUNCTION public.log_change();
+
+CREATE TRIGGER log_trip_delete
+    BEFORE DELETE ON public.trips
+    FOR EACH ROW
+    EXECUTE FUNCTION public.log_trip_delete();
+
+CREATE TRIGGER log_change
+    AFTER INSERT OR UPDATE OR DELETE ON public.itinerary_days
+    FOR EACH ROW
+    EXECUTE FUNCTION public.log_change();
+
+CREATE TRIGGER log_change
+    AFTER INSERT OR UPDATE OR DELETE ON public.itinerary_items
+    FOR EACH ROW
+    EXECUTE FUNCTION public.log_change();
+
+CREATE TRIGGER log_change
+    AFTER INSERT OR UPDATE OR DELETE ON public.trip_collaborators
+    FOR EACH ROW
+    EXECUTE FUNCTION public.log_change();
+
+CREATE TRIGGER log_change
+    AFTER INSERT OR UPDATE OR DELETE ON public.checklists
+    FOR EACH ROW
+    EXECUTE FUNCTION public.log_change();
+
+CREATE TRIGGER log_change
+    AFTER INSERT OR UPDATE OR DELETE ON public.checklist_categories
+    FOR EACH ROW
+    EXECUTE FUNCTION public.log_change();
+
+CREATE TRIGGER log_change
+    AFTER INSERT OR UPDATE OR DELETE ON public.checklist_items
+    FOR EACH ROW
+    EXECUTE FUNCTION public.log_change();
+
+
+-- 返回 p_since 之后对该用户可见的变化:
+-- {"watermark": <下一次的 p_since>,
+--  "trips": [...], "itinerary_days": [...], "itinerary_items": [...],
+--  "checklists": [...], "checklist_categories": [...], "checklist_items": [...],
+--  "deleted": {"trips": [id, ...], "itinerary_items": [...], ...}}
+-- 行为当前的完整行；同一行多次修改只返回一次。p_since = 0 时返回全部数据。
+CREATE OR REPLACE FUNCTION public.sync_changes(
+    p_user_id uuid,
+    p_since bigint DEFAULT 0
+)
+RETURNS jsonb AS $$
+DECLARE
+    v_until xid8 := pg_snapshot_xmin(pg_current_snapshot());
+    v_since xid8 := p_since::text::xid8;
+    v_result jsonb;
+BEGIN
+    -- Security Check: 调用者只能同步自己的数据
+    IF p_user_id IS DISTINCT FROM auth.uid() AND auth.role() <> 'service_role' THEN
+        RAISE EXCEPTION 'Permission denied: cannot act as user %.', p_user_id USING ERRCODE = '42501';
+    END IF;
+
+    IF p_since < 0 THEN
+        RAISE EXCEPTION 'Invalid watermark %.', p_since USING ERRCODE = '22023';
+    END IF;
+
+    WITH member_trips AS (
+        SELECT trip_id FROM public.trip_members WHERE user_id = p_user_id
+    ),
+    -- 每一行只取最后一次变化
+    changes AS (
+        SELECT DISTINCT ON (l.table_name, l.row_id) l.table_name, l.row_id, l.op, l.trip_id
+        FROM public.change_log l
+        WHERE l.txid >= v_since AND l.txid < v_until
+          AND (l.user_id = p_user_id OR (l.user_id IS NULL AND l.trip_id IN (SELECT trip_id FROM member_trips)))
+        ORDER BY l.table_name, l.row_id, l.seq DESC
+    ),
+    -- 新加入的行程：返回整个行程
+    joined_trips AS (
+        SELECT trip_id FROM changes
+        WHERE table_name = 'trip_collaborators' AND op <> 'D' AND trip_id IN (SELECT trip_id FROM member_trips)
+    ),
+    -- 被移除的行程：对客户端而言等同于删除
+    left_trips AS (
+        SELECT trip_id FROM changes
+        WHERE table_name = 'trip_collaborators' AND op = 'D' AND trip_id NOT IN (SELECT trip_id FROM member_trips)
+    ),
+    upserted AS (
+        SELECT table_name, row_id FROM changes WHERE op <> 'D' AND table_name <> 'trip_collaborators'
+    ),
+    deleted AS (
+        SELECT table_name, row_id FROM changes WHERE op = 'D' AND table_name <> 'trip_collaborators'
+        UNION
+        SELECT 'trips', trip_id FROM left_trips
+    )
+    SELECT jsonb_build_object(
+        'watermark', v_until::text::bigint,
+        'trips', COALESCE((
+            SELECT jsonb_agg(to_jsonb(t)) FROM public.trips t
+            WHERE t.id IN (SELECT trip_id FROM member_trips)
+              AND (t.id IN (SELECT row_id FROM upserted WHERE table_name = 'trips') OR t.id IN (SELECT trip_id FROM joined_trips))
+        ), '[]'::jsonb),
+        'itinerary_days', COALESCE((
+            SELECT jsonb_agg(to_jsonb(d)) FROM public.itinerary_days d
+            WHERE d.trip_id IN (SELECT trip_id FROM member_trips)
+              AND (d.id IN (SELECT row_id FROM upserted WHERE table_name = 'itinerary_days') OR d.trip_id IN (SELECT trip_id FROM joined_trips))
+        ), '[]'::jsonb),
+        'itinerary_items', COALESCE((
+            SELECT jsonb_agg(to_jsonb(i)) FROM public.itinerary_items i
+            JOIN public.itinerary_days d ON d.id = i.day_id
+            WHERE d.trip_id IN (SELECT trip_id FROM member_trips)
+              AND (i.id IN (SELECT row_id FROM upserted WHERE table_name = 'itinerary_items') OR d.trip_id IN (SELECT trip_id FROM joined_trips))
+        ), '[]'::jsonb),
+        'checklists', COALESCE((
+            SELECT jsonb_agg(to_jsonb(c)) FROM public.checklists c
+            WHERE c.user_id = p_user_id
+              AND c.id IN (SELECT row_id FROM upserted WHERE table_name = 'checklists')
+        ), '[]'::jsonb),
+        'checklist_categories', COALESCE((
+            SELECT jsonb_agg(to_jsonb(cat)) FROM public.checklist_categories cat
+            JOIN public.checklists c ON c.id = cat.checklist_id
+            WHERE c.user_id = p_user_id
+              AND cat.id IN (SELECT row_id FROM upserted WHERE table_name = 'checklist_categories')
+        ), '[]'::jsonb),
+        'checklist_items', COALESCE((
+            SELECT jsonb_agg(to_jsonb(ci)) FROM public.checklist_items ci
+            JOIN public.checklist_categories cat ON cat.id = ci.category_id
+            JOIN public.checklists c ON c.id = cat.checklist_id
+            WHERE c.user_id = p_user_id
+              AND ci.id IN (SELECT row_id FROM upserted WHERE table_name = 'checklist_items')
+        ), '[]'::jsonb),
+        'deleted', COALESCE((
+            SELECT jsonb_object_agg(table_name, ids)
+            FROM (SELECT table_name, jsonb_agg(row_id) AS ids FROM deleted GROUP BY table_name) grouped
+        ), '{}'::jsonb)
+    ) INTO v_result;
+
+    RETURN v_result;
+END;
+$$ LANGUAGE plpgsql STABLE SECURITY DEFINER SET search_path = public;
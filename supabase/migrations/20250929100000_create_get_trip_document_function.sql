@@ -0,0 +1,82 @@
+-- 行程详情文档在数据库中组装：GET /trips/{trip_id} 一次 RPC 取回最终的 JSON
+--
+-- 之前后端通过 PostgREST 嵌入查询取回 trips -> trip_collaborators / itinerary_days -> itinerary_items 的嵌套行，
+-- 再在 Python 中逐行重建协作者、日程天和日程项目对象并校验。
+-- 这里用 json_build_object + json_agg 直接生成与 TripResponse 字段、顺序完全相同的文档：
+--   日程天按 day_number 排序，日程项目按 rank 排序（rank 取代了 sort_order 作为天内的顺序，见 add_rank_to_itinerary_items）
+--   协作者只返回 trip_collaborators 的 id / user_id / access_level。文档由后端按行程缓存、在用户之间共享，
+--   name / avatar_url 不在这里以定义者权限读取，而是由后端 load_profiles 按当前用户的权限补上（与其他接口相同）
+-- 返回 {"version": ..., "document": {...}}，version 供后端生成 ETag，document 原样作为响应体。
+
+CREATE OR REPLACE FUNCTION public.get_trip_document(p_trip_id uuid, p_user_id uuid)
+RETURNS json AS $$
+DECLARE
+    v_result json;
+BEGIN
+    -- 1. Security Check: 调用者只能以自己的身份操作，且必须是行程成员
+    IF p_user_id IS DISTINCT FROM auth.uid() AND auth.role() <> 'service_role' THEN
+        RAISE EXCEPTION 'Permission denied: cannot act as user %.', p_user_id USING ERRCODE = '42501';
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM public.trip_members WHERE trip_id = p_trip_id AND user_id = p_user_id) THEN
+        IF NOT EXISTS (SELECT 1 FROM public.trips WHERE id = p_trip_id) THEN
+            RAISE EXCEPTION 'Trip % not found.', p_trip_id USING ERRCODE = 'P0002';
+        END IF;
+        RAISE EXCEPTION 'Permission denied: User % cannot access trip %.', p_user_id, p_trip_id USING ERRCODE = '42501';
+    END IF;
+
+    -- 2. 组装文档（键的顺序与 TripResponse 相同）
+    SELECT json_build_object(
+        'version', t.version,
+        'document', json_build_object(
+            'name', t.name,
+            'destination', t.destination,
+            'start_date', t.start_date,
+            'end_date', t.end_date,
+            'description', t.description,
+            'status', t.status,
+            'thumbnail', t.thumbnail,
+            'id', t.id,
+            'user_id', t.user_id,
+            'created_at', t.created_at,
+            'updated_at', t.updated_at,
+            'collaborators', COALESCE((
+                SELECT json_agg(json_build_object(
+                    'id', c.id,
+                    'user_id', c.user_id,
+                    'access_level', c.access_level
+                ) ORDER BY c.user_id)
+                FROM public.trip_collaborators c
+                WHERE c.trip_id = t.id
+            ), '[]'::json),
+            'itinerary', COALESCE((
+                SELECT json_agg(json_build_object(
+                    'id', d.id,
+                    'day_number', d.day_number,
+                    'date', d.date,
+                    'title', d.title,
+                    'items', COALESCE((
+                        SELECT json_agg(json_build_object(
+                            'id', i.id,
+                            'time', i.time,
+                            'type', COALESCE(i.type, 'custom'),
+                            'name', i.name,
+                            'notes', i.notes,
+                            'rank', i.rank
+                        ) ORDER BY i.rank, i.id)
+                        FROM public.itinerary_items i
+                        WHERE i.day_id = d.id
+                    ), '[]'::json)
+                ) ORDER BY d.day_number)
+                FROM public.itinerary_days d
+                WHERE d.trip_id = t.id
+            ), '[]'::json)
+        )
+    )
+    INTO v_result
+    FROM public.trips t
+    WHERE t.id = p_trip_id;
+
+    RETURN v_result;
+END;
+$$ LANGUAGE plpgsql STABLE SECURITY DEFINER SET search_path = public;
@@ -0,0 +1,176 @@
+-- 行程列表卡片的计数器：日程天数、日程项目数、协作者数、最近活动时间
+--
+-- GET /trips/ 的列表不返回日程（itinerary 始终为空），前端要显示 "N 天 / M 个活动 / K 位协作者"
+-- 之前只能逐个请求详情。这里把计数冗余存储在 trips 上，列表只需读取 trips 这一张表。
+--
+-- 维护方式：子表的增删改已经由 bump_trip_version 对所属行程执行 UPDATE（版本号加一），计数器的增减合并进同一条 UPDATE。
+-- bump_trip_version 改为语句级触发器（transition table）：一条语句无论改了多少行，每个涉及的行程只更新一次。
+-- apply_itinerary_batch、clone_trip、按日期生成日程天的触发器等批量路径因此不再对同一行程行做 N 次 UPDATE
+-- （也不再产生 N 条 trips 的 change_log 记录）。
+-- last_activity_at 由 trips 的 BEFORE UPDATE 触发器在每次行程或其子表变化时设为 now()。
+-- 只有 version / last_activity_at 变化（例如修改某个日程项目）时不写 trips 的 change_log，GET /sync 不会因此重发整行行程；
+-- 计数器变化（增删日程天、项目、协作者）仍然会同步。
+
+ALTER TABLE public.trips
+    ADD COLUMN IF NOT EXISTS day_count INT NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS item_count INT NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS collaborator_count INT NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS last_activity_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+-- 回填已有行程（在创建 touch_trip_activity 之前执行，保留原来的 updated_at 作为最近活动时间）
+UPDATE public.trips t
+SET day_count = (SELECT count(*) FROM public.itinerary_days d WHERE d.trip_id = t.id),
+    item_count = (
+        SELECT count(*)
+        FROM public.itinerary_items i
+        JOIN public.itinerary_days d ON d.id = i.day_id
+        WHERE d.trip_id = t.id
+    ),
+    collaborator_count = (SELECT count(*) FROM public.trip_collaborators c WHERE c.trip_id = t.id),
+    last_activity_at = COALESCE(t.updated_at, t.created_at, now());
+
+
+-- 子表变化（语句级）：版本号加一，同时调整计数器。
+-- 新行记 +1、旧行记 -1，按行程汇总后每个行程执行一次 UPDATE；UPDATE 在同一行程内的行两者抵消，只加版本号。
+-- transition table 只能用于单一事件的触发器，INSERT / UPDATE / DELETE 各建一个，都使用 new_rows / old_rows 这两个名字。
+CREATE OR REPLACE FUNCTION public.bump_trip_version()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_new_trip_ids uuid[];
+    v_old_trip_ids uuid[];
+BEGIN
+    IF TG_TABLE_NAME = 'itinerary_items' THEN
+        IF TG_OP <> 'DELETE' THEN
+            SELECT array_agg(d.trip_id) INTO v_new_trip_ids
+            FROM new_rows i JOIN public.itinerary_days d ON d.id = i.day_id;
+        END IF;
+        -- 日程天被删除时级联删除的项目已找不到所属的天，由日程天的 DELETE 重新统计 item_count
+        IF TG_OP <> 'INSERT' THEN
+            SELECT array_agg(d.trip_id) INTO v_old_trip_ids
+            FROM old_rows i JOIN public.itinerary_days d ON d.id = i.day_id;
+        END IF;
+    ELSE
+        IF TG_OP <> 'DELETE' THEN
+            SELECT array_agg(trip_id) INTO v_new_trip_ids FROM new_rows;
+        END IF;
+        IF TG_OP <> 'INSERT' THEN
+            SELECT array_agg(trip_id) INTO v_old_trip_ids FROM old_rows;
+        END IF;
+    END IF;
+
+    UPDATE public.trips t
+    SET version = t.version + 1,
+        day_count = t.day_count + CASE WHEN TG_TABLE_NAME = 'itinerary_days' THEN c.delta ELSE 0 END,
+        item_count = CASE
+            WHEN TG_TABLE_NAME = 'itinerary_items' THEN t.item_count + c.delta
+            -- 被删除的天已不可见：按剩下的天统计，与级联删除项目的先后无关
+            WHEN TG_TABLE_NAME = 'itinerary_days' AND TG_OP = 'DELETE' THEN (
+                SELECT count(*)
+                FROM public.itinerary_items i
+                JOIN public.itinerary_days d ON d.id = i.day_id
+                WHERE d.trip_id = t.id
+            )
+            ELSE t.item_count END,
+        collaborator_count = t.collaborator_count + CASE WHEN TG_TABLE_NAME = 'trip_collaborators' THEN c.delta ELSE 0 END
+    FROM (
+        SELECT trip_id, sum(delta)::int AS delta
+        FROM (
+            SELECT unnest(v_new_trip_ids) AS trip_id, 1 AS delta
+            UNION ALL
+            SELECT unnest(v_old_trip_ids), -1
+        ) changed
+        GROUP BY trip_id
+    ) c
+    WHERE t.id = c.trip_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- 替换 add_version_to_trips_and_checklists 中的行级触发器
+DROP TRIGGER IF EXISTS bump_trip_version ON public.itinerary_days;
+DROP TRIGGER IF EXISTS bump_trip_version ON public.itinerary_items;
+DROP TRIGGER IF EXISTS bump_trip_version ON public.trip_collaborators;
+
+CREATE TRIGGER bump_trip_version_insert
+    AFTER INSERT ON public.itinerary_days
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION public.bump_trip_version();
+
+CREATE TRIGGER bump_trip_version_update
+    AFTER UPDATE ON public.itinerary_days
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION public.bump_trip_version();
+
+CREATE TRIGGER bump_trip_version_delete
+    AFTER DELETE ON public.itinerary_days
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION public.bump_trip_version();
+
+CREATE TRIGGER bump_trip_version_insert
+    AFTER INSERT ON public.itinerary_items
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION public.bump_trip_version();
+
+CREATE TRIGGER bump_trip_version_update
+    AFTER UPDATE ON public.itinerary_items
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION public.bump_trip_version();
+
+CREATE TRIGGER bump_trip_version_delete
+    AFTER DELETE ON public.itinerary_items
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION public.bump_trip_version();
+
+CREATE TRIGGER bump_trip_version_insert
+    AFTER INSERT ON public.trip_collaborators
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION public.bump_trip_version();
+
+CREATE TRIGGER bump_trip_version_update
+    AFTER UPDATE ON public.trip_collaborators
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION public.bump_trip_version();
+
+CREATE TRIGGER bump_trip_version_delete
+    AFTER DELETE ON public.trip_collaborators
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION public.bump_trip_version();
+
+
+-- 行程自身或子表（经 bump_trip_version）的任何修改都记为一次活动
+CREATE OR REPLACE FUNCTION public.touch_trip_activity()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.last_activity_at := now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER touch_trip_activity
+    BEFORE UPDATE ON public.trips
+    FOR EACH ROW
+    EXECUTE FUNCTION public.touch_trip_activity();
+
+
+-- 只有版本号 / 最近活动时间变化的更新不写 change_log：这类更新来自子表的修改，子表自己的记录已经覆盖
+DROP TRIGGER IF EXISTS log_change ON public.trips;
+
+CREATE TRIGGER log_change
+    AFTER INSERT ON public.trips
+    FOR EACH ROW
+    EXECUTE FUNCTION public.log_change();
+
+CREATE TRIGGER log_change_update
+    AFTER UPDATE ON public.trips
+    FOR EACH ROW
+    WHEN ((to_jsonb(OLD) - 'version' - 'last_activity_at') IS DISTINCT FROM (to_jsonb(NEW) - 'version' - 'last_activity_at'))
+    EXECUTE FUNCTION public.log_change();
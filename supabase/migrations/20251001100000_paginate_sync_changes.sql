@@ -0,0 +1,161 @@
+-- 增量同步分页 + change_log 压缩
+--
+-- 1. sync_changes 每次最多处理 p_limit 条变更记录。首次同步（since=0，包含回填的全部数据）
+--    不再一次性返回整个历史：按 (txid, seq) 顺序截断，返回 has_more 和续传位置 (watermark, after_seq)，
+--    客户端原样带回直到 has_more 为 false。同一个事务的记录可能跨页（回填就是一个事务），因此续传位置需要 seq。
+-- 2. compact_change_log 删除已被同一行更新的记录覆盖的旧记录。sync_changes 对每一行只使用最新的一条，
+--    删除被覆盖的记录不会改变任何客户端（包括正在分页中的客户端）的同步结果；change_log 的大小
+--    因此以现存行数 + 删除记录数为上限。由定时任务（例如 pg_cron）周期调用。
+
+DROP FUNCTION IF EXISTS public.sync_changes(uuid, bigint);
+
+-- 分页按 (txid, seq) 扫描，压缩按 (table_name, row_id) 查找更新的记录
+DROP INDEX IF EXISTS public.idx_change_log_txid;
+CREATE INDEX IF NOT EXISTS idx_change_log_txid_seq ON public.change_log (txid, seq);
+CREATE INDEX IF NOT EXISTS idx_change_log_row ON public.change_log (table_name, row_id, seq);
+
+-- 返回 (p_since, p_after_seq) 之后对该用户可见的变化，最多 p_limit 条变更记录:
+-- {"watermark": <下一次的 p_since>, "after_seq": <下一次的 p_after_seq>, "has_more": false,
+--  "trips": [...], "itinerary_days": [...], "itinerary_items": [...],
+--  "checklists": [...], "checklist_categories": [...], "checklist_items": [...],
+--  "deleted": {"trips": [id, ...], "itinerary_items": [...], ...}}
+-- 行为当前的完整行；同一页内同一行多次修改只返回一次。p_since = 0 时从头开始（全部数据）。
+CREATE OR REPLACE FUNCTION public.sync_changes(
+    p_user_id uuid,
+    p_since bigint DEFAULT 0,
+    p_after_seq bigint DEFAULT 0,
+    p_limit int DEFAULT 1000
+)
+RETURNS jsonb AS $$
+DECLARE
+    v_until xid8 := pg_snapshot_xmin(pg_current_snapshot());
+    v_since xid8 := p_since::text::xid8;
+    v_result jsonb;
+BEGIN
+    -- Security Check: 调用者只能同步自己的数据
+    IF p_user_id IS DISTINCT FROM auth.uid() AND auth.role() <> 'service_role' THEN
+        RAISE EXCEPTION 'Permission denied: cannot act as user %.', p_user_id USING ERRCODE = '42501';
+    END IF;
+
+    IF p_since < 0 OR p_after_seq < 0 THEN
+        RAISE EXCEPTION 'Invalid watermark %/%.', p_since, p_after_seq USING ERRCODE = '22023';
+    END IF;
+
+    IF p_limit IS NULL OR p_limit < 1 THEN
+        RAISE EXCEPTION 'Invalid limit %.', p_limit USING ERRCODE = '22023';
+    END IF;
+
+    WITH member_trips AS (
+        SELECT trip_id FROM public.trip_members WHERE user_id = p_user_id
+    ),
+    -- 本页的变更记录：续传位置之后按 (txid, seq) 取 p_limit 条，多取一条用于判断是否还有下一页
+    page AS (
+        SELECT l.seq, l.txid, l.table_name, l.row_id, l.op, l.trip_id,
+               row_number() OVER (ORDER BY l.txid, l.seq) AS position
+        FROM public.change_log l
+        WHERE l.txid >= v_since AND l.txid < v_until
+          AND (l.txid > v_since OR l.seq > p_after_seq)
+          AND (l.user_id = p_user_id OR (l.user_id IS NULL AND l.trip_id IN (SELECT trip_id FROM member_trips)))
+        ORDER BY l.txid, l.seq
+        LIMIT p_limit + 1
+    ),
+    page_end AS (
+        SELECT txid, seq FROM page WHERE position = p_limit
+          AND EXISTS (SELECT 1 FROM page WHERE position > p_limit)
+    ),
+    -- 每一行只取本页内最后一次变化
+    changes AS (
+        SELECT DISTINCT ON (table_name, row_id) table_name, row_id, op, trip_id
+        FROM page
+        WHERE position <= p_limit
+        ORDER BY table_name, row_id, txid DESC, seq DESC
+    ),
+    -- 新加入的行程：返回整个行程
+    joined_trips AS (
+        SELECT trip_id FROM changes
+        WHERE table_name = 'trip_collaborators' AND op <> 'D' AND trip_id IN (SELECT trip_id FROM member_trips)
+    ),
+    -- 被移除的行程：对客户端而言等同于删除
+    left_trips AS (
+        SELECT trip_id FROM changes
+        WHERE table_name = 'trip_collaborators' AND op = 'D' AND trip_id NOT IN (SELECT trip_id FROM member_trips)
+    ),
+    upserted AS (
+        SELECT table_name, row_id FROM changes WHERE op <> 'D' AND table_name <> 'trip_collaborators'
+    ),
+    deleted AS (
+        SELECT table_name, row_id FROM changes WHERE op = 'D' AND table_name <> 'trip_collaborators'
+        UNION
+        SELECT 'trips', trip_id FROM left_trips
+    )
+    SELECT jsonb_build_object(
+        -- 没有下一页时推进到快照 xmin；否则停在本页最后一条记录
+        'watermark', COALESCE((SELECT txid FROM page_end), v_until)::text::bigint,
+        'after_seq', COALESCE((SELECT seq FROM page_end), 0),
+        'has_more', EXISTS (SELECT 1 FROM page_end),
+        'trips', COALESCE((
+            SELECT jsonb_agg(to_jsonb(t)) FROM public.trips t
+            WHERE t.id IN (SELECT trip_id FROM member_trips)
+              AND (t.id IN (SELECT row_id FROM upserted WHERE table_name = 'trips') OR t.id IN (SELECT trip_id FROM joined_trips))
+        ), '[]'::jsonb),
+        'itinerary_days', COALESCE((
+            SELECT jsonb_agg(to_jsonb(d)) FROM public.itinerary_days d
+            WHERE d.trip_id IN (SELECT trip_id FROM member_trips)
+              AND (d.id IN (SELECT row_id FROM upserted WHERE table_name = 'itinerary_days') OR d.trip_id IN (SELECT trip_id FROM joined_trips))
+        ), '[]'::jsonb),
+        'itinerary_items', COALESCE((
+            SELECT jsonb_agg(to_jsonb(i)) FROM public.itinerary_items i
+            JOIN public.itinerary_days d ON d.id = i.day_id
+            WHERE d.trip_id IN (SELECT trip_id FROM member_trips)
+              AND (i.id IN (SELECT row_id FROM upserted WHERE table_name = 'itinerary_items') OR d.trip_id IN (SELECT trip_id FROM joined_trips))
+        ), '[]'::jsonb),
+        'checklists', COALESCE((
+            SELECT jsonb_agg(to_jsonb(c)) FROM public.checklists c
+            WHERE c.user_id = p_user_id
+              AND c.id IN (SELECT row_id FROM upserted WHERE table_name = 'checklists')
+        ), '[]'::jsonb),
+        'checklist_categories', COALESCE((
+            SELECT jsonb_agg(to_jsonb(cat)) FROM public.checklist_categories cat
+            JOIN public.checklists c ON c.id = cat.checklist_id
+            WHERE c.user_id = p_user_id
+              AND cat.id IN (SELECT row_id FROM upserted WHERE table_name = 'checklist_categories')
+        ), '[]'::jsonb),
+        'checklist_items', COALESCE((
+            SELECT jsonb_agg(to_jsonb(ci)) FROM public.checklist_items ci
+            JOIN public.checklist_categories cat ON cat.id = ci.category_id
+            JOIN public.checklists c ON c.id = cat.checklist_id
+            WHERE c.user_id = p_user_id
+              AND ci.id IN (SELECT row_id FROM upserted WHERE table_name = 'checklist_items')
+        ), '[]'::jsonb),
+        'deleted', COALESCE((
+            SELECT jsonb_object_agg(table_name, ids)
+            FROM (SELECT table_name, jsonb_agg(row_id) AS ids FROM deleted GROUP BY table_name) grouped
+        ), '{}'::jsonb)
+    ) INTO v_result;
+
+    RETURN v_result;
+END;
+$$ LANGUAGE plpgsql STABLE SECURITY DEFINER SET search_path = public;
+
+
+-- 删除被覆盖的变更记录：同一 (table_name, row_id, user_id) 已有更新的记录时，旧记录不再被 sync_changes 使用。
+-- 只比较已提交的记录（未提交事务的记录对这里不可见），返回删除的条数。
+CREATE OR REPLACE FUNCTION public.compact_change_log()
+RETURNS bigint AS $$
+DECLARE
+    v_deleted bigint;
+BEGIN
+    DELETE FROM public.change_log old
+    WHERE EXISTS (
+        SELECT 1 FROM public.change_log newer
+        WHERE newer.table_name = old.table_name
+          AND newer.row_id = old.row_id
+          AND newer.user_id IS NOT DISTINCT FROM old.user_id
+          AND (newer.txid, newer.seq) > (old.txid, old.seq)
+    );
+    GET DIAGNOSTICS v_deleted = ROW_COUNT;
+    RETURN v_deleted;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+REVOKE EXECUTE ON FUNCTION public.compact_change_log() FROM PUBLIC, anon, authenticated;